@@ -1,20 +1,62 @@
 #!/usr/bin/env python3
 """
 Vercel Serverless Function for Twitter Spaces Download API
+yt-dlp is imported lazily and limited to the Twitter extractors, so a cold start
+only pays for what a Space lookup needs. Set YDL_PREWARM=true to load it during
+the function's init phase, or GET /api/download?warmup=1 to warm an instance.
 """
 
+import time
+
+_import_started = time.perf_counter()
+
 import os
 import re
+import sys
 import json
 import logging
 from datetime import datetime
+from urllib.parse import urlparse, parse_qs
 from http.server import BaseHTTPRequestHandler
-import yt_dlp
+
+# Shared modules live in the project root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metadata_cache import MetadataCache
+from ydl_pool import YDLPool
+from space_resolver import SpaceResolver
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Survives across invocations while the function instance stays warm
+metadata_cache = MetadataCache(
+    max_entries=int(os.environ.get('METADATA_CACHE_SIZE', 512)),
+    ttl=int(os.environ.get('METADATA_CACHE_TTL', 21600)),
+    live_ttl=int(os.environ.get('METADATA_CACHE_LIVE_TTL', 30)),
+    db_path=os.environ.get('METADATA_CACHE_DB') or None,
+)
+ydl_pool = YDLPool(
+    max_uses=int(os.environ.get('YDL_MAX_USES', 100)),
+    max_age=int(os.environ.get('YDL_MAX_AGE', 1800)),
+)
+space_resolver = SpaceResolver(
+    max_entries=int(os.environ.get('RESOLVER_CACHE_SIZE', 4096)),
+    ttl=int(os.environ.get('RESOLVER_CACHE_TTL', 86400)),
+    expand_short_links=os.environ.get('RESOLVER_EXPAND_SHORT_LINKS', 'True').lower() == 'true',
+)
+
+# Everything a Space, status or t.co URL can be handed between
+TWITTER_EXTRACTORS = [
+    'yt_dlp.extractor.twitter.TwitterSpacesIE',
+    'yt_dlp.extractor.twitter.TwitterIE',
+    'yt_dlp.extractor.twitter.TwitterBroadcastIE',
+    'yt_dlp.extractor.twitter.TwitterCardIE',
+    'yt_dlp.extractor.twitter.TwitterShortenerIE',
+    'yt_dlp.extractor.periscope.PeriscopeIE',
+]
+ydl_pool.register('metadata', {'quiet': True}, extractors=TWITTER_EXTRACTORS)
+
 class TwitterSpaceDownloader:
     def __init__(self):
         self.ydl_opts = {
@@ -25,22 +67,11 @@ class TwitterSpaceDownloader:
     
     def normalize_twitter_url(self, url):
         """Normalize Twitter/X URLs to ensure compatibility"""
-        url = url.strip()
-        
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
-        
-        url = url.replace('x.com', 'twitter.com')
-        return url
+        return space_resolver.normalize(url)
     
     def validate_twitter_space_url(self, url):
         """Validate if the URL is a valid Twitter Spaces URL"""
-        patterns = [
-            r'https?://(www\.)?(twitter\.com|x\.com)/i/spaces/\w+',
-            r'https?://(www\.)?(twitter\.com|x\.com)/.+/status/\d+',
-            r'https?://t\.co/.+'
-        ]
-        return any(re.match(pattern, url) for pattern in patterns)
+        return space_resolver.is_supported(url)
     
     def extract_space_info(self, url):
         """Extract Twitter Spaces information without downloading"""
@@ -50,74 +81,89 @@ class TwitterSpaceDownloader:
             if not self.validate_twitter_space_url(url):
                 raise ValueError("Invalid Twitter Spaces URL. Please provide a valid Twitter Spaces link.")
             
-            with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+            space_info = self.fetch_space_info(url)
+            
+            formats = []
+            if 'formats' in space_info and space_info['formats']:
+                # 使用字典来存储每个分辨率的最佳格式
+                quality_formats = {}
+                for fmt in space_info['formats']:
+                    # For Spaces, prioritize audio-only formats but also include video formats
+                    if fmt.get('acodec') != 'none':  # Audio formats for Spaces
+                        quality = self.get_audio_quality_label(fmt)
+                        # 获取当前格式的文件大小，确保为数字
+                        try:
+                            current_size = int(fmt.get('filesize') or 0)
+                        except Exception:
+                            current_size = 0
+                        try:
+                            prev_size = int(quality_formats[quality].get('raw_filesize', 0)) if quality in quality_formats else 0
+                        except Exception:
+                            prev_size = 0
+                        # 如果这个分辨率还没有记录，或者当前格式的文件大小更大（质量更好），则更新
+                        if quality not in quality_formats or current_size > prev_size:
+                            quality_formats[quality] = {
+                                'format_id': fmt.get('format_id', ''),
+                                'url': fmt.get('url', ''),
+                                'ext': fmt.get('ext', 'mp4'),
+                                'quality': quality,
+                                'filesize': self.format_filesize(fmt.get('filesize')),
+                                'raw_filesize': current_size,
+                                'filename': f"{self.sanitize_filename(space_info.get('title', 'twitter_space'))}.{fmt.get('ext', 'mp4')}"
+                            }
+                
+                # 将去重后的格式添加到列表中（去掉raw_filesize字段）
+                formats = [{k: v for k, v in f.items() if k != 'raw_filesize'} for f in quality_formats.values()]
+            
+            # If no formats found, try the direct URL
+            if not formats and space_info.get('url'):
+                formats.append({
+                    'format_id': 'direct',
+                    'url': space_info['url'],
+                    'ext': space_info.get('ext', 'mp4'),
+                    'quality': 'Standard Audio',
+                    'filesize': self.format_filesize(space_info.get('filesize')),
+                    'filename': f"{self.sanitize_filename(space_info.get('title', 'twitter_space'))}.{space_info.get('ext', 'mp4')}"
+                })
+            
+            return {
+                'title': space_info.get('title', 'Twitter Space'),
+                'author': space_info.get('uploader', 'Unknown'),
+                'duration': self.format_duration(space_info.get('duration')),
+                'thumbnail': space_info.get('thumbnail', ''),
+                'formats': formats[:5] if formats else []
+            }
+            
+        except Exception as e:
+            logger.error(f"Error extracting Twitter Spaces info: {str(e)}")
+            raise ValueError(f"Failed to extract Twitter Spaces information: {str(e)}")
+    
+    def fetch_space_info(self, url):
+        """Return the extract_info result for a Space URL, served from the metadata cache when possible"""
+        def fetch():
+            with ydl_pool.acquire('metadata') as ydl:
                 info = ydl.extract_info(url, download=False)
                 
                 if not info:
                     raise ValueError("Could not extract Twitter Spaces information")
                 
                 if 'entries' in info:
-                    space_info = info['entries'][0] if info['entries'] else None
+                    space_info = next(iter(info['entries'] or []), None)
                 else:
                     space_info = info
                 
                 if not space_info:
                     raise ValueError("No Twitter Spaces found in the provided URL")
                 
-                formats = []
-                if 'formats' in space_info and space_info['formats']:
-                    # 使用字典来存储每个分辨率的最佳格式
-                    quality_formats = {}
-                    for fmt in space_info['formats']:
-                        # For Spaces, prioritize audio-only formats but also include video formats
-                        if fmt.get('acodec') != 'none':  # Audio formats for Spaces
-                            quality = self.get_audio_quality_label(fmt)
-                            # 获取当前格式的文件大小，确保为数字
-                            try:
-                                current_size = int(fmt.get('filesize') or 0)
-                            except Exception:
-                                current_size = 0
-                            try:
-                                prev_size = int(quality_formats[quality].get('raw_filesize', 0)) if quality in quality_formats else 0
-                            except Exception:
-                                prev_size = 0
-                            # 如果这个分辨率还没有记录，或者当前格式的文件大小更大（质量更好），则更新
-                            if quality not in quality_formats or current_size > prev_size:
-                                quality_formats[quality] = {
-                                    'format_id': fmt.get('format_id', ''),
-                                    'url': fmt.get('url', ''),
-                                    'ext': fmt.get('ext', 'mp4'),
-                                    'quality': quality,
-                                    'filesize': self.format_filesize(fmt.get('filesize')),
-                                    'raw_filesize': current_size,
-                                    'filename': f"{self.sanitize_filename(space_info.get('title', 'twitter_space'))}.{fmt.get('ext', 'mp4')}"
-                                }
-                    
-                    # 将去重后的格式添加到列表中（去掉raw_filesize字段）
-                    formats = [{k: v for k, v in f.items() if k != 'raw_filesize'} for f in quality_formats.values()]
-                
-                # If no formats found, try the direct URL
-                if not formats and space_info.get('url'):
-                    formats.append({
-                        'format_id': 'direct',
-                        'url': space_info['url'],
-                        'ext': space_info.get('ext', 'mp4'),
-                        'quality': 'Standard Audio',
-                        'filesize': self.format_filesize(space_info.get('filesize')),
-                        'filename': f"{self.sanitize_filename(space_info.get('title', 'twitter_space'))}.{space_info.get('ext', 'mp4')}"
-                    })
-                
-                return {
-                    'title': space_info.get('title', 'Twitter Space'),
-                    'author': space_info.get('uploader', 'Unknown'),
-                    'duration': self.format_duration(space_info.get('duration')),
-                    'thumbnail': space_info.get('thumbnail', ''),
-                    'formats': formats[:5] if formats else []
-                }
-                
-        except Exception as e:
-            logger.error(f"Error extracting Twitter Spaces info: {str(e)}")
-            raise ValueError(f"Failed to extract Twitter Spaces information: {str(e)}")
+                return ydl.sanitize_info(space_info)
+        
+        keys = [url]
+        space_id = space_resolver.space_id(url)
+        if space_id:
+            keys.insert(0, space_id)
+        space_info = metadata_cache.get_or_fetch(keys, fetch)
+        space_resolver.remember(url, space_info.get('id'))
+        return space_info
     
     def get_audio_quality_label(self, fmt):
         """Generate a human-readable audio quality label for Spaces"""
@@ -198,6 +244,24 @@ class TwitterSpaceDownloader:
 # Initialize downloader
 downloader = TwitterSpaceDownloader()
 
+# Cold-start timings of this instance, reported by the warm-up request
+startup = {'module_import_ms': None, 'warm_up_ms': None}
+
+def warm_up():
+    """Import yt-dlp and build the lookup instance ahead of the first request"""
+    if startup['warm_up_ms'] is None:
+        started = time.perf_counter()
+        ydl_pool.warm('metadata')
+        startup['warm_up_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Warmed up yt-dlp in {startup['warm_up_ms']} ms")
+    return startup
+
+startup['module_import_ms'] = round((time.perf_counter() - _import_started) * 1000, 1)
+logger.info(f"Imported api/download.py in {startup['module_import_ms']} ms")
+
+if os.environ.get('YDL_PREWARM', 'False').lower() == 'true':
+    warm_up()
+
 class handler(BaseHTTPRequestHandler):
     def _set_headers(self, status_code=200):
         self.send_response(status_code)
@@ -249,5 +313,10 @@ class handler(BaseHTTPRequestHandler):
             self.wfile.write(json.dumps({'error': 'Internal server error occurred while processing Twitter Spaces'}).encode('utf-8'))
 
     def do_GET(self):
+        if 'warmup' in parse_qs(urlparse(self.path).query):
+            self._set_headers(200)
+            self.wfile.write(json.dumps({'warm': True, 'startup': warm_up()}).encode('utf-8'))
+            return
+        
         self._set_headers(405)
         self.wfile.write(json.dumps({'error': 'Method not allowed'}).encode('utf-8')) 
\ No newline at end of file
@@ -7,183 +7,586 @@ A Flask-based API for downloading Twitter/X Spaces using yt-dlp
 import os
 import re
 import json
+import atexit
+import math
 import logging
 import tempfile
-import smtplib
-import hashlib
+import threading
+import shutil
+import subprocess
+import time
+from contextlib import ExitStack
 from datetime import datetime
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from flask import Flask, request, jsonify, send_file, abort
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html import escape
+from flask import Flask, Response, request, jsonify, send_file, abort, redirect, g
 from flask_cors import CORS
-import yt_dlp
+from werkzeug.exceptions import HTTPException
 from urllib.parse import urlparse, parse_qs
+from jobs import (JobQueue, QueueFullError, report_progress, set_job_timeout, in_worker_process,
+                  current_job_id, move_to_lane)
+from singleflight import SingleFlight
+from metadata_cache import MetadataCache, is_live_info
+from file_store import FileStore
+from s3_store import S3FileStore
+from cache_manager import CacheManager
+from streaming import TeeTranscode, build_ffmpeg_command
+from hls import SegmentFetcher, HLSError, Checkpoint, covering_segments
+from notifications import EmailNotifier
+from ydl_pool import YDLPool
+from space_resolver import SpaceResolver
+from rate_limit import RateLimiter, RateLimitedError
+from cluster import Cluster
+import metrics
+import tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder='.', static_url_path='')
-CORS(app)  # Enable CORS for frontend integration
+# Comma-separated list of allowed origins; Retry-After is exposed so browsers can honour 429s
+CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*')
+CORS(app, origins=CORS_ORIGINS.split(',') if CORS_ORIGINS != '*' else '*',
+     expose_headers=['Retry-After'])  # Enable CORS for frontend integration
 
 # Configuration
 DOWNLOAD_DIR = os.path.join(tempfile.gettempdir(), 'twitter_spaces')
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+single_flight = SingleFlight(os.path.join(DOWNLOAD_DIR, '.locks'))
+
+# Output formats. m4a remuxes the AAC audio of a Space without re-encoding;
+# mp3 re-encodes it and is opt-in. Streams to a pipe need a fragmented MP4
+# since the moov atom cannot be written after the fact.
+OUTPUT_FORMATS = {
+    'm4a': {
+        'mimetype': 'audio/mp4',
+        'quality': 'Original Quality (AAC)',
+        'bitrate': 64,
+        'remux_args': ['-c:a', 'copy', '-bsf:a', 'aac_adtstoasc'],
+        'transcode_args': ['-c:a', 'aac', '-b:a', '128k'],
+        'file_args': ['-f', 'mp4', '-movflags', '+faststart'],
+        'stream_args': ['-f', 'mp4', '-movflags', 'empty_moov+default_base_moof', '-frag_duration', '2000000'],
+    },
+    'mp3': {
+        'mimetype': 'audio/mpeg',
+        'quality': 'High Quality (192kbps)',
+        'bitrate': 192,
+        'transcode_args': ['-c:a', 'libmp3lame', '-b:a', '192k'],
+        'file_args': ['-f', 'mp3'],
+        'stream_args': ['-f', 'mp3'],
+    },
+}
+DEFAULT_OUTPUT_FORMAT = os.environ.get('DEFAULT_OUTPUT_FORMAT', 'm4a').lower()
+
+# Parallel HLS segment fetching
+HLS_CONCURRENCY = int(os.environ.get('HLS_CONCURRENCY', 8))
+HLS_SEGMENT_RETRIES = int(os.environ.get('HLS_SEGMENT_RETRIES', 5))
+HLS_RETRY_BACKOFF = float(os.environ.get('HLS_RETRY_BACKOFF', 0.5))
+HLS_CHECKPOINT_EVERY = int(os.environ.get('HLS_CHECKPOINT_EVERY', 20))
+
+# Raw segments of unfinished downloads, kept across worker restarts so they can resume
+PARTIAL_DIR = os.path.join(DOWNLOAD_DIR, 'partial')
+
+# Live Spaces are recorded from their growing playlist into PARTIAL_DIR/<space_id>.live
+LIVE_MAX_DURATION = int(os.environ.get('LIVE_MAX_DURATION', 6 * 3600))
+LIVE_MAX_REFRESH = float(os.environ.get('LIVE_MAX_REFRESH', 30))
+LIVE_STALL_TIMEOUT = int(os.environ.get('LIVE_STALL_TIMEOUT', 300))
+# Recordings run in workers of their own, so they cannot hold up other downloads for hours
+LIVE_MAX_RECORDINGS = int(os.environ.get('LIVE_MAX_RECORDINGS', 2))
+# Space segments are ADTS AAC, so the rolling file plays as it grows
+LIVE_MIMETYPE = 'audio/aac'
+
+# Finished audio is stored by Space id and format, not by title. 'local' keeps
+# it in DOWNLOAD_DIR; 's3' keeps it in an S3-compatible bucket every node
+# shares, and /download/<key> redirects to a presigned URL for it
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local').lower()
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_PREFIX = os.environ.get('S3_PREFIX', '')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+S3_PUBLIC_ENDPOINT_URL = os.environ.get('S3_PUBLIC_ENDPOINT_URL') or None
+S3_REGION = os.environ.get('S3_REGION') or None
+S3_PART_SIZE = int(os.environ.get('S3_PART_SIZE', 16 * 1024 ** 2))
+S3_UPLOAD_CONCURRENCY = int(os.environ.get('S3_UPLOAD_CONCURRENCY', 4))
+S3_URL_TTL = int(os.environ.get('S3_URL_TTL', 3600))
+S3_INDEX_TTL = int(os.environ.get('S3_INDEX_TTL', 30))
+S3_USAGE_TTL = int(os.environ.get('S3_USAGE_TTL', 300))
+# Seconds local serve statistics are buffered before they are written to the index
+STORE_TOUCH_INTERVAL = int(os.environ.get('STORE_TOUCH_INTERVAL', 30))
+
+if STORAGE_BACKEND == 's3':
+    if not S3_BUCKET:
+        raise ValueError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+    file_store = S3FileStore(
+        S3_BUCKET,
+        prefix=S3_PREFIX,
+        endpoint_url=S3_ENDPOINT_URL,
+        public_endpoint_url=S3_PUBLIC_ENDPOINT_URL,
+        region=S3_REGION,
+        part_size=S3_PART_SIZE,
+        upload_concurrency=S3_UPLOAD_CONCURRENCY,
+        url_ttl=S3_URL_TTL,
+        index_ttl=S3_INDEX_TTL,
+        content_types={fmt: spec['mimetype'] for fmt, spec in OUTPUT_FORMATS.items()},
+        usage_ttl=S3_USAGE_TTL,
+        # Job workers are fresh processes; the file saves each of them a listing
+        usage_file=os.path.join(DOWNLOAD_DIR, '.s3-usage.json'),
+    )
+elif STORAGE_BACKEND == 'local':
+    file_store = FileStore(os.path.join(DOWNLOAD_DIR, 'store'), touch_interval=STORE_TOUCH_INTERVAL)
+else:
+    raise ValueError(f"Unknown storage backend: {STORAGE_BACKEND}")
+
+# Byte budget for the file store (the bucket with STORAGE_BACKEND=s3); least
+# recently (lru) or least often (lfu) served files go first
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 5 * 1024 ** 3))
+CACHE_EVICTION_POLICY = os.environ.get('CACHE_EVICTION_POLICY', 'lru').lower()
+CACHE_SWEEP_INTERVAL = int(os.environ.get('CACHE_SWEEP_INTERVAL', 300))
+CACHE_ORPHAN_AGE = int(os.environ.get('CACHE_ORPHAN_AGE', 3600))
+
+cache_manager = CacheManager(
+    file_store,
+    DOWNLOAD_DIR,
+    partial_dir=PARTIAL_DIR,
+    max_bytes=CACHE_MAX_BYTES,
+    policy=CACHE_EVICTION_POLICY,
+    sweep_interval=CACHE_SWEEP_INTERVAL,
+    orphan_age=CACHE_ORPHAN_AGE,
+)
+# Job worker processes import this module too, but only the server sweeps
+if not in_worker_process():
+    cache_manager.start()
+    atexit.register(file_store.flush_touches)
+
+# Hand file transfers to the front-end server (Apache/lighttpd mod_xsendfile)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', 'False').lower() == 'true'
+
+# Background download jobs
+JOB_MAX_WORKERS = int(os.environ.get('JOB_MAX_WORKERS', 2))
+JOB_MAX_QUEUE = int(os.environ.get('JOB_MAX_QUEUE', 50))
+JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 1800))
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 3600))
+
+# Streaming transcodes run ffmpeg in the web process; beyond STREAM_MAX_CONCURRENT
+# clients get 429, and one is stopped after STREAM_MAX_SECONDS
+STREAM_MAX_CONCURRENT = int(os.environ.get('STREAM_MAX_CONCURRENT', 4))
+STREAM_MAX_SECONDS = int(os.environ.get('STREAM_MAX_SECONDS', 1800))
+STREAM_RETRY_AFTER = 30
+
+# Batch submissions
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 500))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+
+# Cluster mode: the nodes in CLUSTER_NODES (or CLUSTER_NODES_FILE, re-read when
+# it changes) shard Spaces by id, and CLUSTER_SELF_URL is this node's entry.
+# Requests for another node's Spaces are proxied to it (forward) or answered
+# with a 307 to it (redirect); forward needs a CLUSTER_SECRET all nodes share
+CLUSTER_SELF_URL = os.environ.get('CLUSTER_SELF_URL', '')
+CLUSTER_NODES = [node.strip() for node in os.environ.get('CLUSTER_NODES', '').split(',') if node.strip()]
+CLUSTER_NODES_FILE = os.environ.get('CLUSTER_NODES_FILE') or None
+CLUSTER_MODE = os.environ.get('CLUSTER_MODE', 'forward').lower()
+CLUSTER_SECRET = os.environ.get('CLUSTER_SECRET', '')
+CLUSTER_VNODES = int(os.environ.get('CLUSTER_VNODES', 160))
+CLUSTER_PROBE_INTERVAL = float(os.environ.get('CLUSTER_PROBE_INTERVAL', 10))
+CLUSTER_CONNECT_TIMEOUT = float(os.environ.get('CLUSTER_CONNECT_TIMEOUT', 5))
+CLUSTER_READ_TIMEOUT = float(os.environ.get('CLUSTER_READ_TIMEOUT', 300))
+
+if CLUSTER_SELF_URL and CLUSTER_MODE == 'forward' and not CLUSTER_SECRET:
+    raise ValueError("CLUSTER_MODE=forward needs CLUSTER_SECRET")
+cluster = Cluster(
+    CLUSTER_SELF_URL,
+    nodes=CLUSTER_NODES,
+    nodes_file=CLUSTER_NODES_FILE,
+    vnodes=CLUSTER_VNODES,
+    mode=CLUSTER_MODE,
+    secret=CLUSTER_SECRET,
+    probe_interval=CLUSTER_PROBE_INTERVAL,
+    timeout=CLUSTER_CONNECT_TIMEOUT,
+)
+if not in_worker_process():
+    cluster.start()
+
+# Notification emails; without SMTP_HOST they are only logged
+SMTP_HOST = os.environ.get('SMTP_HOST', '')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_USERNAME = os.environ.get('SMTP_USERNAME', '')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
+SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'True').lower() == 'true'
+SMTP_SENDER = os.environ.get('SMTP_SENDER', 'noreply@localhost')
+EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', 20))
+EMAIL_MAX_RETRIES = int(os.environ.get('EMAIL_MAX_RETRIES', 5))
+EMAIL_DOMAIN_RATE = int(os.environ.get('EMAIL_DOMAIN_RATE', 30))
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', '')
+
+notifier = EmailNotifier(
+    host=SMTP_HOST or None,
+    port=SMTP_PORT,
+    username=SMTP_USERNAME or None,
+    password=SMTP_PASSWORD or None,
+    use_tls=SMTP_USE_TLS,
+    sender=SMTP_SENDER,
+    batch_size=EMAIL_BATCH_SIZE,
+    max_retries=EMAIL_MAX_RETRIES,
+    domain_rate=EMAIL_DOMAIN_RATE,
+)
+
+# extract_info metadata cache; set METADATA_CACHE_DB to share it between processes
+METADATA_CACHE_SIZE = int(os.environ.get('METADATA_CACHE_SIZE', 512))
+METADATA_CACHE_TTL = int(os.environ.get('METADATA_CACHE_TTL', 21600))
+METADATA_CACHE_LIVE_TTL = int(os.environ.get('METADATA_CACHE_LIVE_TTL', 30))
+METADATA_CACHE_DB = os.environ.get('METADATA_CACHE_DB', '')
+
+metadata_cache = MetadataCache(
+    max_entries=METADATA_CACHE_SIZE,
+    ttl=METADATA_CACHE_TTL,
+    live_ttl=METADATA_CACHE_LIVE_TTL,
+    db_path=METADATA_CACHE_DB or None,
+)
+
+# Prometheus metrics, rendered by /metrics; job workers forward theirs to this process
+PHASE_SECONDS = metrics.Histogram('xspace_phase_duration_seconds', 'Time spent in each phase of a Space download')
+STORE_LOOKUPS = metrics.Counter('xspace_store_lookups_total', 'Download requests answered from the file store (hit) or not (miss)')
+SERVED_BYTES = metrics.Counter('xspace_served_bytes_total', 'Bytes sent by /download responses')
+ERRORS = metrics.Counter('xspace_errors_total', 'Errors by type')
+CLUSTER_ROUTED = metrics.Counter('xspace_cluster_routed_total', 'Requests sent on to the node owning their Space or job')
+
+# /api/health fails below this much free space in DOWNLOAD_DIR
+HEALTH_MIN_FREE_BYTES = int(os.environ.get('HEALTH_MIN_FREE_BYTES', 512 * 1024 ** 2))
+
+# Reused yt-dlp instances; each is recycled after this many calls or seconds
+YDL_MAX_USES = int(os.environ.get('YDL_MAX_USES', 100))
+YDL_MAX_AGE = int(os.environ.get('YDL_MAX_AGE', 1800))
+
+ydl_pool = YDLPool(max_uses=YDL_MAX_USES, max_age=YDL_MAX_AGE)
+
+# t.co and status -> Space id expansions, so repeat requests key on the Space id without yt-dlp
+RESOLVER_CACHE_SIZE = int(os.environ.get('RESOLVER_CACHE_SIZE', 4096))
+RESOLVER_CACHE_TTL = int(os.environ.get('RESOLVER_CACHE_TTL', 86400))
+RESOLVER_EXPAND_SHORT_LINKS = os.environ.get('RESOLVER_EXPAND_SHORT_LINKS', 'True').lower() == 'true'
+RESOLVER_FAILURE_TTL = int(os.environ.get('RESOLVER_FAILURE_TTL', 300))
+
+space_resolver = SpaceResolver(
+    max_entries=RESOLVER_CACHE_SIZE,
+    ttl=RESOLVER_CACHE_TTL,
+    expand_short_links=RESOLVER_EXPAND_SHORT_LINKS,
+    failure_ttl=RESOLVER_FAILURE_TTL,
+)
+
+# Admission control: a token bucket per client IP, or per API key listed in
+# RATE_LIMIT_API_KEYS (sent as X-API-Key). Rates are tokens per second; set
+# RATE_LIMIT_DB to share the buckets between server processes
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+RATE_LIMIT_RATE = float(os.environ.get('RATE_LIMIT_RATE', 0.2))
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', 120))
+RATE_LIMIT_API_KEYS = [key.strip() for key in os.environ.get('RATE_LIMIT_API_KEYS', '').split(',') if key.strip()]
+RATE_LIMIT_KEY_RATE = float(os.environ.get('RATE_LIMIT_KEY_RATE', 1))
+RATE_LIMIT_KEY_BURST = float(os.environ.get('RATE_LIMIT_KEY_BURST', 600))
+RATE_LIMIT_PROXY_HOPS = int(os.environ.get('RATE_LIMIT_PROXY_HOPS', 0))
+RATE_LIMIT_DB = os.environ.get('RATE_LIMIT_DB', '')
+
+# What requests cost: answers from the caches, metadata lookups, and downloads per hour of audio
+RATE_LIMIT_COST_CACHED = float(os.environ.get('RATE_LIMIT_COST_CACHED', 1))
+RATE_LIMIT_COST_LOOKUP = float(os.environ.get('RATE_LIMIT_COST_LOOKUP', 2))
+RATE_LIMIT_COST_PER_HOUR = float(os.environ.get('RATE_LIMIT_COST_PER_HOUR', 30))
+
+rate_limiter = RateLimiter(
+    rate=RATE_LIMIT_RATE,
+    burst=RATE_LIMIT_BURST,
+    key_rate=RATE_LIMIT_KEY_RATE,
+    key_burst=RATE_LIMIT_KEY_BURST,
+    api_keys=RATE_LIMIT_API_KEYS,
+    proxy_hops=RATE_LIMIT_PROXY_HOPS,
+    db_path=RATE_LIMIT_DB or None,
+    enabled=RATE_LIMIT_ENABLED,
+)
+RATE_LIMITED = metrics.Counter('xspace_rate_limited_total', 'Requests rejected by admission control')
+
+# Request tracing: spans are appended as JSON lines to TRACE_FILE (unset disables tracing)
+TRACE_FILE = os.environ.get('TRACE_FILE', '')
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 1.0))
+
+# Opt-in profiling: a PROFILE_SAMPLE_RATE share of requests and jobs is profiled,
+# and profiles of runs slower than PROFILE_SLOW_MS are written to PROFILE_DIR
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.1))
+PROFILE_SLOW_MS = int(os.environ.get('PROFILE_SLOW_MS', 5000))
+PROFILER = os.environ.get('PROFILER', 'cprofile').lower()
+
+tracing.tracer.configure(TRACE_FILE or None, TRACE_SAMPLE_RATE)
+tracing.profiler.configure(PROFILE_DIR or None, PROFILE_SLOW_MS, PROFILE_SAMPLE_RATE, PROFILER)
 
 class TwitterSpaceDownloader:
     def __init__(self):
         self.ydl_opts = {
-            'format': 'best[ext=m4a]/best[ext=mp3]/best',
-            'outtmpl': os.path.join(DOWNLOAD_DIR, '%(title)s.%(ext)s'),
+            'format': 'bestaudio/best',
             'noplaylist': True,
             'extract_flat': False,
             'writeinfojson': False,
-            'extractaudio': True,
-            'audioformat': 'mp3',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
         }
     
     def normalize_twitter_url(self, url):
         """Normalize Twitter/X URLs to ensure compatibility"""
-        # Handle t.co redirects and convert x.com to twitter.com for yt-dlp compatibility
-        url = url.strip()
-        
-        # Basic URL validation
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
-        
-        # Convert x.com to twitter.com for better compatibility
-        url = url.replace('x.com', 'twitter.com')
-        
-        return url
+        # Request bodies are arbitrary JSON, so the URL may not even be a string
+        if not isinstance(url, str) or not url.strip():
+            raise ValueError("Invalid Twitter Space URL")
+        return space_resolver.normalize(url)
     
     def validate_twitter_space_url(self, url):
         """Validate if the URL is a valid Twitter Space URL"""
-        patterns = [
-            r'https?://(www\.)?(twitter\.com|x\.com)/i/spaces/[a-zA-Z0-9]+',
-            r'https?://(www\.)?(twitter\.com|x\.com)/.+/status/\d+',
-            r'https?://t\.co/.+'
-        ]
-        
-        return any(re.match(pattern, url) for pattern in patterns)
-    
-    def generate_safe_filename(self, title):
-        """Generate a safe filename from the space title"""
-        if not title:
-            title = "twitter_space"
-        
-        # Remove or replace invalid characters
-        safe_title = re.sub(r'[<>:"/\\|?*]', '', title)
-        safe_title = safe_title.strip().replace(' ', '_')
-        
-        # Limit length and add hash for uniqueness
-        url_hash = hashlib.md5(title.encode()).hexdigest()[:8]
-        safe_title = safe_title[:30] + f"_{url_hash}"
-        
-        return f"{safe_title}.mp3"
+        return space_resolver.is_supported(url)
     
-    def download_space_audio(self, url):
-        """Actually download the Twitter Space audio file"""
+    def download_space_audio(self, url, fmt=DEFAULT_OUTPUT_FORMAT, clip=None):
+        """Actually download the Twitter Space audio file, or only the (start, end) clip of it"""
         try:
-            url = self.normalize_twitter_url(url)
-            
-            if not self.validate_twitter_space_url(url):
-                raise ValueError("Invalid Twitter Space URL")
+            with tracing.tracer.span('resolve_url'):
+                url = self.normalize_twitter_url(url)
+                fmt = self.validate_output_format(fmt)
+                
+                if not self.validate_twitter_space_url(url):
+                    raise ValueError("Invalid Twitter Space URL")
             
             logger.info(f"Starting download for Space: {url}")
+            report_progress(phase='extract')
             
-            # First, extract info to get title
-            with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                if not info:
-                    raise ValueError("Could not extract Space information")
+            # Answer straight from the store index when the URL names the Space
+            space_id = self.extract_space_id(url)
+            entry = self.lookup_stored(space_id, fmt, clip) if space_id else None
+            if entry:
+                logger.info(f"File already exists: {entry['key']}")
+                STORE_LOOKUPS.inc(result='hit')
+                return self.build_download_result(entry)
+            
+            # Otherwise resolve the Space id from its metadata
+            space_info = self.fetch_space_info(url)
+            space_id = space_info.get('id')
+            if not space_id:
+                raise ValueError("Could not determine the Space id")
+            
+            if clip:
+                if is_live_info(space_info):
+                    raise ValueError("Clips can only be cut once the Space has ended")
+                clip = self.resolve_clip(clip, space_info)
+            
+            entry = self.lookup_stored(space_id, fmt, clip)
+            if entry:
+                logger.info(f"File already exists: {entry['key']}")
+                STORE_LOOKUPS.inc(result='hit')
+                return self.build_download_result(entry)
+            
+            STORE_LOOKUPS.inc(result='miss')
+            if space_info.get('live_status') == 'is_upcoming':
+                raise ValueError("This Space has not started yet")
+            
+            # Only one download per Space runs at a time; concurrent callers
+            # wait here and then pick up the finished file
+            with ExitStack() as stack:
+                with tracing.tracer.span('single_flight_wait') as span:
+                    flight_key = file_store.storage_key(space_id, fmt, clip) if clip else space_id
+                    waited = stack.enter_context(single_flight.acquire(flight_key))
+                    span.set(waited=waited)
                 
-                # Check if it contains audio
-                if 'entries' in info:
-                    space_info = info['entries'][0] if info['entries'] else None
-                else:
-                    space_info = info
+                entry = file_store.lookup(space_id, fmt, clip)
+                if entry:
+                    logger.info(f"Reusing file downloaded by concurrent request: {entry['key']}")
+                    return self.build_download_result(entry)
                 
-                if not space_info:
-                    raise ValueError("No Space found in the provided URL")
+                if waited:
+                    logger.info(f"Previous download of {space_id} did not produce a file, retrying")
+                    if is_live_info(space_info):
+                        # The Space may have ended while we waited
+                        space_info = self.fetch_space_info(url)
                 
-                title = space_info.get('title', 'Twitter Space')
-                author = space_info.get('uploader', 'Unknown')
-                duration = self.format_duration(space_info.get('duration'))
-                thumbnail = space_info.get('thumbnail', '')
-            
-            # Generate safe filename
-            filename = self.generate_safe_filename(title)
-            filepath = os.path.join(DOWNLOAD_DIR, filename)
-            
-            # Check if file already exists
-            if os.path.exists(filepath):
-                logger.info(f"File already exists: {filename}")
-                return {
-                    'title': title,
-                    'author': author,
-                    'duration': duration,
-                    'thumbnail': thumbnail,
-                    'filename': filename,
-                    'filepath': filepath,
-                    'download_url': f'/download/{filename}',
-                    'filesize': self.format_filesize(os.path.getsize(filepath))
-                }
-            
-            # Configure yt-dlp for actual download
-            download_opts = self.ydl_opts.copy()
-            download_opts['outtmpl'] = filepath.replace('.mp3', '.%(ext)s')
-            
-            # Download the audio
-            with yt_dlp.YoutubeDL(download_opts) as ydl:
-                logger.info(f"Downloading Space audio: {title}")
-                ydl.download([url])
-            
-            # Check if download was successful
-            if not os.path.exists(filepath):
-                # Sometimes the extension might be different, look for the file
-                base_name = filepath.replace('.mp3', '')
-                for ext in ['.mp3', '.m4a', '.webm', '.mp4']:
-                    alt_path = base_name + ext
-                    if os.path.exists(alt_path):
-                        # Rename to .mp3
-                        os.rename(alt_path, filepath)
-                        break
+                if is_live_info(space_info):
+                    # Continues in a recording worker, which fetches the metadata afresh
+                    move_to_lane('live')
+                    entry = self.record_live_space(space_info, fmt)
                 else:
-                    raise ValueError("Download completed but file not found")
+                    # Make room for the new file before fetching it
+                    with tracing.tracer.span('cache_enforce'):
+                        cache_manager.enforce(reserve_bytes=self.estimate_filesize(space_info, fmt, clip))
+                    
+                    if clip:
+                        entry = self.download_clip(url, space_info, fmt, clip)
+                    else:
+                        entry = self.download_to_store(url, space_info, fmt)
             
-            logger.info(f"Successfully downloaded: {filename}")
+            logger.info(f"Successfully downloaded: {entry['key']}")
             
-            return {
-                'title': title,
-                'author': author,
-                'duration': duration,
-                'thumbnail': thumbnail,
-                'filename': filename,
-                'filepath': filepath,
-                'download_url': f'/download/{filename}',
-                'filesize': self.format_filesize(os.path.getsize(filepath))
-            }
+            return self.build_download_result(entry, downloaded=True)
                 
         except Exception as e:
             logger.error(f"Error downloading Space: {str(e)}")
+            ERRORS.inc(type=type(e).__name__)
             raise ValueError(f"Failed to download Space: {str(e)}")
 
-    def extract_space_info(self, url):
-        """Extract Space information without downloading (legacy method)"""
+    def stream_space_audio(self, url, fmt=DEFAULT_OUTPUT_FORMAT, client=None):
+        """Start transcoding a Space straight to the client
+
+        Returns (entry, None) when the file is already stored, otherwise
+        (space_info, stream) where stream is a running TeeTranscode whose
+        output is committed to the store once it completes.
+        """
+        url = self.normalize_twitter_url(url)
+        fmt = self.validate_output_format(fmt)
+        
+        if not self.validate_twitter_space_url(url):
+            raise ValueError("Invalid Twitter Space URL")
+        
+        # Streaming needs the metadata in this request anyway
+        charged, _ = self.admit_download(url, fmt, client, lookup=True)
+        
+        space_id = self.extract_space_id(url)
+        entry = file_store.lookup(space_id, fmt) if space_id else None
+        if entry:
+            return entry, None
+        
+        space_info = self.fetch_space_info(url)
+        space_id = space_info.get('id')
+        if not space_id:
+            raise ValueError("Could not determine the Space id")
+        
+        entry = file_store.lookup(space_id, fmt)
+        if entry:
+            return entry, None
+        
+        # ffmpeg would start at the live edge, and its output must not be stored as the whole Space
+        if is_live_info(space_info):
+            raise ValueError(f"This Space is still live; queue it with /api/download-space to record it, "
+                             f"then follow the recording at /api/live/{space_id}")
+        if space_info.get('live_status') == 'is_upcoming':
+            raise ValueError("This Space has not started yet")
+        
+        media = self.select_audio_format(space_info)
+        if not media:
+            raise ValueError("No streamable audio found for this Space")
+        
+        title = space_info.get('title', 'Twitter Space')
+        processing = self.processing_path(space_info, fmt)
+        metadata = {
+            'title': title,
+            'author': space_info.get('uploader', 'Unknown'),
+            'duration': space_info.get('duration'),
+            'thumbnail': space_info.get('thumbnail', ''),
+            'download_name': f"{self.sanitize_filename(title)}.{fmt}",
+            'processing': processing
+        }
+        
+        output_args = self.ffmpeg_output_args(fmt, processing, streaming=True)
+        file_args = self.ffmpeg_output_args(fmt, processing)
+        
+        def commit(path):
+            if output_args != file_args:
+                # Fragmented MP4 suits streaming; the stored file gets the regular layout
+                stored_path = f"{path}.{fmt}"
+                try:
+                    self.run_ffmpeg(build_ffmpeg_command(
+                        path, output_args=['-c', 'copy'] + OUTPUT_FORMATS[fmt]['file_args'], output=stored_path
+                    ), space_info.get('duration'))
+                except (ValueError, OSError) as e:
+                    # The client already has every byte; only the cached copy is lost
+                    logger.error(f"Could not store streamed {space_id}: {str(e)}")
+                    return
+                path = stored_path
+            file_store.commit(space_id, fmt, path, metadata)
+        
+        if not stream_slots.acquire(blocking=False):
+            rate_limiter.refund(client, charged)
+            raise RateLimitedError(STREAM_RETRY_AFTER)
         try:
-            url = self.normalize_twitter_url(url)
-            
-            if not self.validate_twitter_space_url(url):
-                raise ValueError("Invalid Twitter Space URL")
-            
-            # Extract info only
-            with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+            cache_manager.enforce(reserve_bytes=self.estimate_filesize(space_info, fmt))
+            stream = TeeTranscode(
+                build_ffmpeg_command(media['url'], media.get('http_headers'), output_args),
+                tempfile.mkdtemp(prefix='.staging-', dir=DOWNLOAD_DIR),
+                lock=lambda: single_flight.acquire(space_id, blocking=False),
+                on_complete=commit,
+                on_exit=stream_slots.release,
+                max_seconds=STREAM_MAX_SECONDS
+            )
+        except BaseException:
+            stream_slots.release()
+            raise
+        logger.info(f"Streaming Space audio ({processing} to {fmt}): {title}")
+        return space_info, stream
+    
+    def validate_output_format(self, fmt):
+        """Return the normalized output format, or raise ValueError if it is not supported"""
+        fmt = (fmt or DEFAULT_OUTPUT_FORMAT).lower()
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}', expected one of: {', '.join(OUTPUT_FORMATS)}")
+        return fmt
+    
+    def processing_path(self, space_info, fmt):
+        """Return 'remux' when the source audio can be copied into fmt as-is, else 'transcode'"""
+        media = self.select_audio_format(space_info) or {}
+        acodec = (media.get('acodec') or '').lower()
+        # Space recordings are AAC; an unknown codec is assumed to be AAC as well
+        is_aac = acodec in ('', 'aac') or acodec.startswith('mp4a')
+        return 'remux' if 'remux_args' in OUTPUT_FORMATS[fmt] and is_aac else 'transcode'
+    
+    def ffmpeg_output_args(self, fmt, processing, streaming=False):
+        """Return the ffmpeg codec and container arguments for fmt"""
+        output = OUTPUT_FORMATS[fmt]
+        codec_args = output['remux_args'] if processing == 'remux' else output['transcode_args']
+        return codec_args + output['stream_args' if streaming else 'file_args']
+    
+    def build_download_opts(self, fmt):
+        """Return yt-dlp options that download and convert to fmt; the target directory is set per call via paths"""
+        download_opts = self.ydl_opts.copy()
+        download_opts['outtmpl'] = 'audio.%(ext)s'
+        download_opts['concurrent_fragment_downloads'] = HLS_CONCURRENCY
+        download_opts['fragment_retries'] = HLS_SEGMENT_RETRIES
+        download_opts['progress_hooks'] = [self.report_ydl_progress]
+        download_opts['postprocessor_hooks'] = [self.report_ydl_postprocessing]
+        # FFmpegExtractAudio copies the stream when it already matches the codec
+        # (AAC into m4a) and only re-encodes otherwise
+        download_opts['postprocessors'] = [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': fmt,
+            'preferredquality': str(OUTPUT_FORMATS[fmt]['bitrate']),
+        }]
+        return download_opts
+    
+    def report_ydl_progress(self, status):
+        """yt-dlp progress hook: forward download progress to the job"""
+        if status.get('status') != 'downloading':
+            return
+        total = status.get('total_bytes') or status.get('total_bytes_estimate')
+        downloaded = status.get('downloaded_bytes') or 0
+        report_progress(
+            phase='download',
+            downloaded_bytes=downloaded,
+            total_bytes=total,
+            segments_done=status.get('fragment_index'),
+            segments_total=status.get('fragment_count'),
+            percent=round(100 * downloaded / total, 1) if total else None,
+            eta=status.get('eta')
+        )
+    
+    def report_ydl_postprocessing(self, status):
+        """yt-dlp post-processor hook: FFmpeg conversion runs in the 'convert' phase"""
+        if status.get('status') == 'started':
+            report_progress(phase='convert', postprocessor=status.get('postprocessor'))
+    
+    def select_audio_format(self, space_info):
+        """Pick the best audio-bearing format from an extract_info result"""
+        if space_info.get('url'):
+            return space_info
+        audio_formats = [fmt for fmt in space_info.get('formats') or []
+                         if fmt.get('acodec') != 'none' and fmt.get('url')]
+        if not audio_formats:
+            return None
+        return max(audio_formats, key=lambda fmt: fmt.get('abr') or fmt.get('tbr') or 0)
+    
+    def fetch_space_info(self, url, refresh=False):
+        """Return the extract_info result for a normalized Space URL, served from the metadata cache when possible
+
+        refresh looks the Space up again even if it is cached, e.g. once its media URLs have expired.
+        """
+        def fetch():
+            span.set(cached=False)
+            # The Twitter API calls happen inside extract_info
+            with tracing.tracer.span('extract_info'), PHASE_SECONDS.time(phase='extract_info'), \
+                    ydl_pool.acquire('metadata') as ydl:
                 info = ydl.extract_info(url, download=False)
                 
                 if not info:
@@ -192,64 +595,560 @@ class TwitterSpaceDownloader:
                 # Check if it contains audio
                 if 'entries' in info:
                     # It's a playlist, get the first entry
-                    space_info = info['entries'][0] if info['entries'] else None
+                    space_info = next(iter(info['entries'] or []), None)
                 else:
                     space_info = info
                 
                 if not space_info:
                     raise ValueError("No Space found in the provided URL")
                 
-                # Extract available formats (audio only)
-                formats = []
-                if 'formats' in space_info and space_info['formats']:
-                    # Filter for audio formats only
-                    audio_formats = {}
-                    for fmt in space_info['formats']:
-                        if fmt.get('acodec') != 'none' and fmt.get('vcodec') == 'none':  # Audio only
-                            quality = self.get_audio_quality_label(fmt)
-                            # Get current format file size
-                            try:
-                                current_size = int(fmt.get('filesize') or 0)
-                            except Exception:
-                                current_size = 0
-                            try:
-                                prev_size = int(audio_formats[quality].get('raw_filesize', 0)) if quality in audio_formats else 0
-                            except Exception:
-                                prev_size = 0
-                            # Keep the format with larger file size (better quality)
-                            if quality not in audio_formats or current_size > prev_size:
-                                audio_formats[quality] = {
-                                    'format_id': fmt.get('format_id', ''),
-                                    'url': fmt.get('url', ''),
-                                    'ext': 'mp3',  # Convert all to MP3
-                                    'quality': quality,
-                                    'filesize': self.format_filesize(fmt.get('filesize')),
-                                    'raw_filesize': current_size,
-                                    'filename': f"{self.sanitize_filename(space_info.get('title', 'space'))}.mp3"
-                                }
-                    
-                    # Convert to list without raw_filesize
-                    formats = [{k: v for k, v in f.items() if k != 'raw_filesize'} for f in audio_formats.values()]
+                # Make the result JSON-serialisable so it can be cached on disk
+                return ydl.sanitize_info(space_info)
+        
+        keys = [url]
+        space_id = self.extract_space_id(url)
+        if space_id:
+            keys.insert(0, space_id)
+        with tracing.tracer.span('fetch_space_info', cached=True) as span:
+            space_info = metadata_cache.get_or_fetch(keys, fetch, refresh)
+        space_resolver.remember(url, space_info.get('id'))
+        return space_info
+    
+    def lookup_stored(self, space_id, fmt, clip=None):
+        """Look a Space, or a clip of it, up in the file store index, as a traced stage"""
+        if clip and clip[1] is None:
+            # A clip to the end of the Space has no key until its duration is known
+            return None
+        with tracing.tracer.span('store_lookup', space_id=space_id) as span:
+            entry = file_store.lookup(space_id, fmt, clip)
+            span.set(hit=entry is not None)
+            return entry
+    
+    def download_to_store(self, url, space_info, fmt):
+        """Download the Space audio into a private staging directory, then commit it to the file store"""
+        # Staging keeps half-written files out of the store, so a lookup
+        # never returns a partial download
+        title = space_info.get('title', 'Twitter Space')
+        staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=DOWNLOAD_DIR)
+        try:
+            processing = self.processing_path(space_info, fmt)
+            staged_path = os.path.join(staging_dir, f'audio.{fmt}')
+            logger.info(f"Downloading Space audio ({processing} to {fmt}): {title}")
+            
+            media = self.select_audio_format(space_info) or {}
+            fetched = False
+            if (media.get('protocol') or '').startswith('m3u8'):
+                try:
+                    self.download_hls(space_info['id'], media, staged_path, fmt, processing)
+                    fetched = True
+                except HLSError as e:
+                    # The cached playlist URL may have expired; let yt-dlp resolve it afresh
+                    logger.warning(f"Segment download failed, falling back to yt-dlp: {str(e)}")
+            
+            if not fetched:
+                # Includes yt-dlp's own FFmpeg post-processing
+                with tracing.tracer.span('ytdlp_download'), PHASE_SECONDS.time(phase='download'), \
+                        ydl_pool.acquire(f'download:{fmt}', paths={'home': staging_dir}) as ydl:
+                    ydl.download([url])
+            
+            # Both paths leave the converted audio at staged_path
+            if not os.path.exists(staged_path):
+                raise ValueError("Download completed but file not found")
+            
+            with tracing.tracer.span('commit'):
+                return file_store.commit(
+                    space_info['id'], fmt, staged_path, self.store_metadata(space_info, fmt, processing)
+                )
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    
+    def store_metadata(self, space_info, fmt, processing, clip=None):
+        """Index metadata recorded with a stored file"""
+        title = space_info.get('title', 'Twitter Space')
+        name = self.sanitize_filename(title)
+        if clip:
+            name += f"_{self.clip_label(clip[0])}-{self.clip_label(clip[1])}"
+        return {
+            'title': title,
+            'author': space_info.get('uploader', 'Unknown'),
+            'duration': round(clip[1] - clip[0], 3) if clip else space_info.get('duration'),
+            'thumbnail': space_info.get('thumbnail', ''),
+            'download_name': f"{name}.{fmt}",
+            'processing': processing
+        }
+    
+    def live_dir(self, space_id):
+        """Directory holding the rolling recording and state of a live Space"""
+        return os.path.join(PARTIAL_DIR, f"{re.sub(r'[^A-Za-z0-9_-]', '', str(space_id))}.live")
+    
+    def record_live_space(self, space_info, fmt):
+        """Record a live Space until it ends, then convert the recording and commit it to the store
+
+        Segments are appended to PARTIAL_DIR/<space_id>.live/recording as they
+        appear, and state.json next to it tells /api/live readers whether the
+        recording is still growing.
+        """
+        space_id = space_info['id']
+        title = space_info.get('title', 'Twitter Space')
+        media = self.select_audio_format(space_info) or {}
+        if not (media.get('protocol') or '').startswith('m3u8'):
+            raise ValueError("Live Space has no HLS stream to record")
+        
+        # Recording runs as long as the Space, then conversion needs the usual time limit
+        set_job_timeout(LIVE_MAX_DURATION + JOB_TIMEOUT)
+        
+        live_dir = self.live_dir(space_id)
+        os.makedirs(live_dir, exist_ok=True)
+        recording_path = os.path.join(live_dir, 'recording')
+        state = Checkpoint(os.path.join(live_dir, 'state.json'))
+        started_at = time.time()
+        
+        def save_state(status, **fields):
+            state.save(dict(fields, status=status, title=title, mimetype=LIVE_MIMETYPE, job_id=current_job_id(),
+                            started_at=started_at, updated_at=time.time()))
+        
+        def on_progress(segments, size, seconds):
+            save_state('recording', segments=segments, bytes=size, duration=round(seconds, 1))
+            report_progress(phase='record', segments_done=segments, downloaded_bytes=size,
+                            recorded_seconds=round(seconds), live_url=f'/api/live/{space_id}')
+        
+        logger.info(f"Recording live Space: {title}")
+        save_state('recording', segments=0, bytes=0, duration=0)
+        report_progress(phase='record', segments_done=0, downloaded_bytes=0, live_url=f'/api/live/{space_id}')
+        
+        deadline = time.monotonic() + LIVE_MAX_DURATION
+        try:
+            with tracing.tracer.span('record_live') as span, PHASE_SECONDS.time(phase='record'), SegmentFetcher(
+                concurrency=HLS_CONCURRENCY,
+                retries=HLS_SEGMENT_RETRIES,
+                backoff=HLS_RETRY_BACKOFF,
+                headers=media.get('http_headers')
+            ) as fetcher, open(recording_path, 'wb') as out:
+                summary = fetcher.follow_live(
+                    media['url'], out, on_progress,
+                    max_refresh=LIVE_MAX_REFRESH,
+                    stall_timeout=LIVE_STALL_TIMEOUT,
+                    should_stop=lambda: time.monotonic() >= deadline
+                )
+                span.set(segments=summary['segments'], bytes=summary['bytes'], gaps=summary['gaps'])
+            
+            logger.info(f"Recorded {summary['segments']} live segments ({self.format_filesize(summary['bytes'])}, "
+                        f"{summary['gaps']} missed, ended={summary['ended']})")
+            if not summary['segments']:
+                raise ValueError("The live Space produced no audio")
+            save_state('converting', segments=summary['segments'], bytes=summary['bytes'],
+                       duration=round(summary['duration'], 1))
+            
+            cache_manager.enforce(reserve_bytes=summary['bytes'])
+            staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=DOWNLOAD_DIR)
+            try:
+                processing = self.processing_path(space_info, fmt)
+                staged_path = os.path.join(staging_dir, f'audio.{fmt}')
+                self.run_ffmpeg(build_ffmpeg_command(
+                    recording_path, output_args=self.ffmpeg_output_args(fmt, processing), output=staged_path
+                ), summary['duration'])
+                metadata = dict(self.store_metadata(space_info, fmt, processing), duration=round(summary['duration']))
+                with tracing.tracer.span('commit'):
+                    entry = file_store.commit(space_id, fmt, staged_path, metadata)
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+        except BaseException:
+            # Readers stop following; the partial recording is left for the orphan sweep
+            save_state('failed')
+            raise
+        
+        # Readers keep their open handles, so the directory can go right away
+        shutil.rmtree(live_dir, ignore_errors=True)
+        return entry
+    
+    def download_hls(self, space_id, media, staged_path, fmt, processing):
+        """Fetch an HLS recording segment by segment, then convert it locally with ffmpeg
+
+        The raw segments are kept in a per-Space partial directory with a
+        checkpoint, so a download cut short by a worker restart resumes from
+        the last saved segment. The directory is removed once conversion succeeds.
+        """
+        partial_dir = os.path.join(PARTIAL_DIR, space_id)
+        os.makedirs(partial_dir, exist_ok=True)
+        source_path = os.path.join(partial_dir, 'source')
+        with SegmentFetcher(
+            concurrency=HLS_CONCURRENCY,
+            retries=HLS_SEGMENT_RETRIES,
+            backoff=HLS_RETRY_BACKOFF,
+            headers=media.get('http_headers')
+        ) as fetcher:
+            with tracing.tracer.span('fetch_playlist'):
+                playlist = fetcher.fetch_playlist(media['url'])
+            total = len(playlist['segments'])
+            started = time.monotonic()
+            first = {}
+            
+            def on_progress(done, size):
+                # ETA from this run's rate, so segments resumed from a checkpoint do not skew it
+                first.setdefault('done', done - 1)
+                rate = (done - first['done']) / max(time.monotonic() - started, 0.001)
+                report_progress(
+                    phase='download',
+                    segments_done=done,
+                    segments_total=total,
+                    downloaded_bytes=size,
+                    percent=round(100 * done / total, 1) if total else None,
+                    eta=round((total - done) / rate) if rate else None
+                )
+            
+            report_progress(phase='download', segments_done=0, segments_total=total)
+            with tracing.tracer.span('fetch_segments', segments=total) as span, PHASE_SECONDS.time(phase='download'):
+                size = fetcher.download_resumable(
+                    playlist, source_path, checkpoint_every=HLS_CHECKPOINT_EVERY, on_progress=on_progress
+                )
+                span.set(bytes=size)
+        
+        logger.info(f"Fetched {total} segments ({self.format_filesize(size)})")
+        
+        duration = sum(segment.duration for segment in playlist['segments'])
+        self.run_ffmpeg(build_ffmpeg_command(
+            source_path, output_args=self.ffmpeg_output_args(fmt, processing), output=staged_path
+        ), duration)
+        
+        shutil.rmtree(partial_dir, ignore_errors=True)
+    
+    def download_clip(self, url, space_info, fmt, clip):
+        """Fetch only the HLS segments covering clip, then cut it out with ffmpeg and commit it to the store
+
+        Bytes fetched and ffmpeg time grow with the clip, not the Space: at
+        most one partial segment is fetched on either side.
+        """
+        try:
+            return self.cut_clip(space_info, fmt, clip)
+        except HLSError as e:
+            # The cached playlist URL may have expired; look the Space up afresh and try once more
+            logger.warning(f"Segment download failed, retrying with fresh metadata: {str(e)}")
+            return self.cut_clip(self.fetch_space_info(url, refresh=True), fmt, clip)
+    
+    def cut_clip(self, space_info, fmt, clip):
+        """Fetch the segments covering clip from space_info's playlist and cut the clip out of them"""
+        start, end = clip
+        title = space_info.get('title', 'Twitter Space')
+        media = self.select_audio_format(space_info) or {}
+        if not (media.get('protocol') or '').startswith('m3u8'):
+            raise ValueError("Clips need the Space's HLS recording")
+        
+        processing = self.processing_path(space_info, fmt)
+        staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=DOWNLOAD_DIR)
+        try:
+            source_path = os.path.join(staging_dir, 'source')
+            staged_path = os.path.join(staging_dir, f'audio.{fmt}')
+            logger.info(f"Downloading clip {start}-{end}s of Space ({processing} to {fmt}): {title}")
+            
+            with SegmentFetcher(
+                concurrency=HLS_CONCURRENCY,
+                retries=HLS_SEGMENT_RETRIES,
+                backoff=HLS_RETRY_BACKOFF,
+                headers=media.get('http_headers')
+            ) as fetcher:
+                with tracing.tracer.span('fetch_playlist'):
+                    playlist = fetcher.fetch_playlist(media['url'])
+                segments = covering_segments(playlist['segments'], start, end)
+                if not segments:
+                    raise ValueError("The clip is outside the recording")
+                total = len(segments)
                 
-                # If no formats found, try the direct URL
-                if not formats and space_info.get('url'):
-                    formats.append({
-                        'format_id': 'direct',
-                        'url': space_info['url'],
-                        'ext': 'mp3',
-                        'quality': 'Standard Quality',
-                        'filesize': self.format_filesize(space_info.get('filesize')),
-                        'filename': f"{self.sanitize_filename(space_info.get('title', 'space'))}.mp3"
-                    })
+                def on_progress(done, size):
+                    report_progress(phase='download', segments_done=done, segments_total=total,
+                                    downloaded_bytes=size, percent=round(100 * done / total, 1))
                 
-                return {
-                    'title': space_info.get('title', 'Twitter Space'),
-                    'author': space_info.get('uploader', 'Unknown'),
-                    'duration': self.format_duration(space_info.get('duration')),
-                    'thumbnail': space_info.get('thumbnail', ''),
-                    'formats': formats[:3] if formats else []  # Limit to 3 formats
-                }
+                report_progress(phase='download', segments_done=0, segments_total=total)
+                with tracing.tracer.span('fetch_segments', segments=total, clip=True) as span, \
+                        PHASE_SECONDS.time(phase='download'), open(source_path, 'wb') as out:
+                    size = fetcher.download(segments, out, playlist.get('init_url'), on_progress)
+                    span.set(bytes=size)
+            
+            logger.info(f"Fetched {total} of {len(playlist['segments'])} segments for the clip "
+                        f"({self.format_filesize(size)})")
+            
+            # The fetched audio begins at the first segment's start. Placed after
+            # the input, -ss trims decoded audio, so the cut is not limited to
+            # segment boundaries (with a remux, it is exact to an AAC frame)
+            offset = max(0.0, start - segments[0].start)
+            trim_args = ['-ss', f'{offset:.3f}', '-t', f'{end - start:.3f}']
+            self.run_ffmpeg(build_ffmpeg_command(
+                source_path, output_args=trim_args + self.ffmpeg_output_args(fmt, processing), output=staged_path
+            ), end - start)
+            
+            with tracing.tracer.span('commit'):
+                return file_store.commit(
+                    space_info['id'], fmt, staged_path, self.store_metadata(space_info, fmt, processing, clip), clip=clip
+                )
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    
+    def run_ffmpeg(self, command, duration=None):
+        """Run an ffmpeg conversion, reporting 'convert' progress from its -progress output"""
+        report_progress(phase='convert', percent=0)
+        # -progress writes key=value lines to stdout, which is free since output goes to a file
+        command = command[:1] + ['-progress', 'pipe:1', '-nostats'] + command[1:]
+        with tracing.tracer.span('ffmpeg', duration=duration), PHASE_SECONDS.time(phase='ffmpeg'), \
+                tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, text=True)
+            for line in process.stdout:
+                key, _, value = line.strip().partition('=')
+                if key == 'out_time_us' and duration and value.isdigit():
+                    done = int(value) / 1e6
+                    report_progress(phase='convert', percent=round(min(100.0, 100 * done / duration), 1))
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise ValueError(f"ffmpeg failed: {stderr.read().decode(errors='replace').strip()[-500:]}")
+        report_progress(phase='convert', percent=100)
+    
+    def build_download_result(self, entry, downloaded=False):
+        """Describe a stored Space file for API responses, using only its index entry
+
+        downloaded marks a file this call fetched, rather than found stored.
+        """
+        return {
+            'title': entry['title'],
+            'author': entry['author'],
+            'duration': self.format_duration(entry['duration']),
+            'thumbnail': entry['thumbnail'],
+            'filename': entry['download_name'],
+            'format': entry['format'],
+            'processing': entry.get('processing', 'transcode'),
+            'storage_key': entry['key'],
+            'space_id': entry['space_id'],
+            'download_url': f"/download/{entry['key']}",
+            'filesize': self.format_filesize(entry['size']),
+            'clip': entry.get('clip'),
+            'downloaded': downloaded,
+            'duration_seconds': entry['duration']
+        }
+    
+    def estimate_filesize(self, space_info, fmt, clip=None):
+        """Estimate the size of the output file from the Space (or clip) duration"""
+        if self.processing_path(space_info, fmt) == 'remux':
+            if (space_info.get('filesize') or space_info.get('filesize_approx')) and not clip:
+                return int(space_info.get('filesize') or space_info.get('filesize_approx'))
+            bitrate = space_info.get('abr') or space_info.get('tbr') or OUTPUT_FORMATS[fmt]['bitrate']
+        else:
+            bitrate = OUTPUT_FORMATS[fmt]['bitrate']
+        duration = clip[1] - clip[0] if clip else space_info.get('duration') or 0
+        return int(duration * bitrate * 1000 / 8)
+    
+    def extract_space_id(self, url):
+        """Return the Space id of a normalized URL, or None until a metadata fetch has resolved it"""
+        return space_resolver.space_id(url)
+    
+    def job_key(self, url, fmt, clip=None):
+        """Key under which requests for the same Space (or clip) and format share one job"""
+        key = f"{self.extract_space_id(url) or url}:{fmt}"
+        return f"{key}:{clip[0]}-{clip[1]}" if clip else key
+    
+    def parse_timestamp(self, value):
+        """Seconds from a number or an [HH:]MM:SS[.mmm] string"""
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"Invalid time: {value}")
+        parts = str(value).strip().split(':')
+        try:
+            if len(parts) > 3 or any(float(part) < 0 for part in parts):
+                raise ValueError
+            seconds = sum(float(part) * 60 ** power for power, part in enumerate(reversed(parts)))
+        except ValueError:
+            raise ValueError(f"Invalid time: {value}")
+        if not math.isfinite(seconds):
+            raise ValueError(f"Invalid time: {value}")
+        return round(seconds, 3)
+    
+    def parse_clip(self, start=None, end=None):
+        """Return the (start, end) seconds of a requested clip, or None for the whole Space
+
+        A missing start means the beginning; a missing end means the end of
+        the Space, filled in by resolve_clip once its duration is known.
+        """
+        if start in (None, '') and end in (None, ''):
+            return None
+        start = self.parse_timestamp(start) if start not in (None, '') else 0.0
+        end = self.parse_timestamp(end) if end not in (None, '') else None
+        if end is not None and end <= start:
+            raise ValueError("The clip end must be after its start")
+        return start, end
+    
+    def resolve_clip(self, clip, space_info):
+        """Clamp a clip to the Space's duration, filling in a missing end"""
+        start, end = clip
+        duration = space_info.get('duration')
+        if duration:
+            if start >= duration:
+                raise ValueError("The clip starts after the end of the Space")
+            end = duration if end is None else min(end, duration)
+        elif end is None:
+            raise ValueError("The length of this Space is unknown, so the clip needs an end")
+        return start, round(end, 3)
+    
+    def clip_label(self, seconds):
+        """Clip bound for file names, e.g. 1h02m03s"""
+        minutes, secs = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}h{minutes:02d}m{secs:02d}s" if hours else f"{minutes}m{secs:02d}s"
+    
+    def download_cost(self, space_info, clip=None):
+        """Tokens a fresh download costs, by the hours of audio it fetches and converts"""
+        if clip:
+            seconds = (clip[1] or space_info.get('duration') or 3600) - clip[0]
+        elif is_live_info(space_info):
+            # A live recording can run until LIVE_MAX_DURATION
+            seconds = LIVE_MAX_DURATION
+        else:
+            # Assume an hour when extract_info does not say
+            seconds = space_info.get('duration') or 3600
+        return self.audio_cost(seconds)
+    
+    def audio_cost(self, seconds):
+        """Tokens for fetching and converting seconds of audio"""
+        return max(RATE_LIMIT_COST_LOOKUP, math.ceil(seconds / 3600 * RATE_LIMIT_COST_PER_HOUR))
+    
+    def admit_lookup(self, url, client):
+        """Charge client for looking up url's metadata, which costs less when it is cached"""
+        if client is None:
+            return 0
+        space_id = self.extract_space_id(url)
+        cached = any(metadata_cache.peek(key) for key in (space_id, url) if key)
+        return rate_limiter.acquire(client, RATE_LIMIT_COST_CACHED if cached else RATE_LIMIT_COST_LOOKUP)
+    
+    def admit_download(self, url, fmt, client, clip=None, job_key=None, lookup=False):
+        """Charge client for downloading url; returns (tokens charged, whether the charge is provisional)
+
+        job_key is the key the download will be queued under, by default that
+        of the resolved Space id. A stored Space, or one whose job is already
+        queued or running, costs as much as a cached lookup. Otherwise the
+        download is charged by the Space's duration (or the clip's length).
+
+        Without cached metadata the lookup is left to the job, as yt-dlp can
+        take seconds. The client is charged a provisional hour (or the clip's
+        length) instead, which settle_download corrects once the job ends.
+        lookup=True fetches the metadata here, for callers that need it anyway.
+        """
+        if client is None:
+            return 0, False
+        space_id = self.extract_space_id(url)
+        if (space_id and self.lookup_stored(space_id, fmt, clip)) or (job_key and job_queue.is_active(job_key)):
+            return rate_limiter.acquire(client, RATE_LIMIT_COST_CACHED), False
+        
+        space_info = self.peek_space_info(url)
+        if space_info is None and not lookup:
+            return rate_limiter.acquire(client, RATE_LIMIT_COST_LOOKUP + self.download_cost({}, clip)), True
+        
+        charged, cost = 0, RATE_LIMIT_COST_CACHED
+        if space_info is None:
+            # Charged up front, so a stream of unknown URLs is throttled as well
+            charged = rate_limiter.acquire(client, RATE_LIMIT_COST_LOOKUP)
+            space_info = self.fetch_space_info(url)
+            cost = 0
+        
+        if clip:
+            clip = self.resolve_clip(clip, space_info)
+        space_id = space_info.get('id')
+        job_key = job_key or self.job_key(space_id, fmt, clip)
+        if not (space_id and (self.lookup_stored(space_id, fmt, clip) or job_queue.is_active(job_key))):
+            cost += self.download_cost(space_info, clip)
+        # One charge, so a download bigger than the bucket is admitted once the bucket is full
+        return charged + rate_limiter.acquire(client, cost), False
+    
+    def settle_download(self, client, charged):
+        """Job callback settling a provisional download charge at what the job turned out to cost"""
+        def settle(job):
+            cost = RATE_LIMIT_COST_LOOKUP
+            result = job['result'] or {}
+            if job['status'] == 'finished' and result.get('downloaded'):
+                cost += self.audio_cost(result.get('duration_seconds') or 3600)
+            rate_limiter.settle(client, charged, cost)
+        return settle
+    
+    def job_callbacks(self, *callbacks):
+        """One on_finish callback running each of callbacks that is set, in order"""
+        def run(job):
+            for callback in callbacks:
+                if callback:
+                    callback(job)
+        return run
+    
+    def peek_space_info(self, url):
+        """Return the cached metadata of a normalized Space URL, or None, without counting a cache hit or miss"""
+        space_id = self.extract_space_id(url)
+        return next(filter(None, (metadata_cache.peek(key) for key in (space_id, url) if key)), None)
+    
+    def remember_space_id(self, url):
+        """Job callback teaching this process the Space id a worker resolved url to"""
+        def remember(job):
+            if job['status'] == 'finished':
+                space_resolver.remember(url, job['result'].get('space_id'))
+        return remember
+
+    def extract_space_info(self, url, client=None):
+        """Extract Space information without downloading (legacy method)"""
+        try:
+            with tracing.tracer.span('resolve_url'):
+                url = self.normalize_twitter_url(url)
                 
+                if not self.validate_twitter_space_url(url):
+                    raise ValueError("Invalid Twitter Space URL")
+            
+            self.admit_lookup(url, client)
+            
+            # Extract info only
+            space_info = self.fetch_space_info(url)
+            
+            # Extract available formats (audio only)
+            formats = []
+            if 'formats' in space_info and space_info['formats']:
+                # Filter for audio formats only
+                audio_formats = {}
+                for fmt in space_info['formats']:
+                    if fmt.get('acodec') != 'none' and fmt.get('vcodec') == 'none':  # Audio only
+                        quality = self.get_audio_quality_label(fmt)
+                        # Get current format file size
+                        try:
+                            current_size = int(fmt.get('filesize') or 0)
+                        except Exception:
+                            current_size = 0
+                        try:
+                            prev_size = int(audio_formats[quality].get('raw_filesize', 0)) if quality in audio_formats else 0
+                        except Exception:
+                            prev_size = 0
+                        # Keep the format with larger file size (better quality)
+                        if quality not in audio_formats or current_size > prev_size:
+                            audio_formats[quality] = {
+                                'format_id': fmt.get('format_id', ''),
+                                'url': fmt.get('url', ''),
+                                'ext': 'mp3',  # Convert all to MP3
+                                'quality': quality,
+                                'filesize': self.format_filesize(fmt.get('filesize')),
+                                'raw_filesize': current_size,
+                                'filename': f"{self.sanitize_filename(space_info.get('title', 'space'))}.mp3"
+                            }
+                
+                # Convert to list without raw_filesize
+                formats = [{k: v for k, v in f.items() if k != 'raw_filesize'} for f in audio_formats.values()]
+            
+            # If no formats found, try the direct URL
+            if not formats and space_info.get('url'):
+                formats.append({
+                    'format_id': 'direct',
+                    'url': space_info['url'],
+                    'ext': 'mp3',
+                    'quality': 'Standard Quality',
+                    'filesize': self.format_filesize(space_info.get('filesize')),
+                    'filename': f"{self.sanitize_filename(space_info.get('title', 'space'))}.mp3"
+                })
+            
+            return {
+                'title': space_info.get('title', 'Twitter Space'),
+                'author': space_info.get('uploader', 'Unknown'),
+                'duration': self.format_duration(space_info.get('duration')),
+                'thumbnail': space_info.get('thumbnail', ''),
+                'formats': formats[:3] if formats else []  # Limit to 3 formats
+            }
+            
+        except RateLimitedError:
+            raise
         except Exception as e:
             logger.error(f"Error extracting Space info: {str(e)}")
             raise ValueError(f"Failed to extract Space information: {str(e)}")
@@ -280,58 +1179,198 @@ class TwitterSpaceDownloader:
         else:
             return "Standard Quality"
     
-    def process_space_download(self, url, email):
-        """Process Space download and send email notification"""
+    def queue_download(self, url, fmt=None, client=None, clip=None):
+        """Queue a Space download, or a (start, end) clip of it, and return the job's links
+
+        A Space already in the store is answered right away with status
+        'finished' and its download links, without a job.
+        """
+        normalized_url = self.normalize_twitter_url(url)
+        
+        # Reject obviously invalid requests before they take up a queue slot
+        if not self.validate_twitter_space_url(normalized_url):
+            raise ValueError("Invalid Twitter Space URL")
+        
+        fmt = self.validate_output_format(fmt)
+        job_key = self.job_key(normalized_url, fmt, clip)
+        charged, provisional = self.admit_download(normalized_url, fmt, client, clip, job_key)
+        
+        # A worker process would only look the file up again
+        space_id = self.extract_space_id(normalized_url)
+        entry = self.lookup_stored(space_id, fmt, clip) if space_id else None
+        if entry:
+            STORE_LOOKUPS.inc(result='hit')
+            return {
+                'status': 'finished',
+                'result': build_space_download_response(self.build_download_result(entry))
+            }
+        
+        # Requests for a Space that is already queued share the existing job
+        try:
+            job_id = job_queue.submit(run_download_job, url, fmt, clip, self.peek_space_info(normalized_url),
+                                      job_key=job_key, on_finish=self.job_callbacks(
+                                          self.remember_space_id(normalized_url),
+                                          self.settle_download(client, charged) if provisional else None
+                                      ))
+        except QueueFullError:
+            rate_limiter.refund(client, charged)
+            raise
+        
+        return {
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/api/jobs/{job_id}',
+            'result_url': f'/api/jobs/{job_id}/result'
+        }
+    
+    def queue_batch_item(self, url, fmt, client=None, route=True):
+        """Resolve one normalized batch URL and queue its download; returns the item's result"""
+        charged = 0
         try:
-            # Extract Space info
-            space_info = self.extract_space_info(url)
+            owner = cluster.remote_owner(self.extract_space_id(url)) if route else None
+            if owner:
+                item = self.forward_batch_item(owner, url, fmt, client)
+                if item is not None:
+                    return item
             
-            # In a real implementation, you would:
-            # 1. Add the download job to a queue
-            # 2. Process the download in the background
-            # 3. Send email when complete
+            # A batch resolves every URL for its per-item results anyway
+            charged, _ = self.admit_download(url, fmt, client, lookup=True)
+            space_info = self.fetch_space_info(url)
+            space_id = space_info.get('id')
+            if not space_id:
+                raise ValueError("Could not determine the Space id")
             
-            # For MVP, we'll simulate the process
-            logger.info(f"Processing Space download for: {space_info['title']} -> {email}")
+            item = {'space_id': space_id, 'title': space_info.get('title', 'Twitter Space')}
+            entry = file_store.lookup(space_id, fmt)
+            if entry:
+                item.update(status='finished', result=build_space_download_response(self.build_download_result(entry)))
+                return item
             
-            # Simulate email sending
-            self.send_notification_email(email, space_info)
+            # Keyed on the resolved id, so a status URL and a Space URL share one job
+            job_id = job_queue.submit(run_download_job, url, fmt, None, space_info, job_key=self.job_key(space_id, fmt),
+                                      on_finish=self.remember_space_id(url))
+            item.update(
+                status='queued',
+                job_id=job_id,
+                status_url=f'/api/jobs/{job_id}',
+                result_url=f'/api/jobs/{job_id}/result'
+            )
+            return item
+            
+        except ValueError as e:
+            return {'status': 'invalid', 'error': str(e)}
+        except RateLimitedError as e:
+            return {'status': 'rate_limited', 'error': 'Too many requests, please try again later',
+                    'retry_after': e.retry_after}
+        except QueueFullError:
+            rate_limiter.refund(client, charged)
+            return {'status': 'rejected', 'error': 'Server is busy, please try again later'}
+        except Exception as e:
+            logger.error(f"Batch item {url} failed: {str(e)}")
+            return {'status': 'error', 'error': 'Could not resolve Space'}
+    
+    def forward_batch_item(self, node, url, fmt, client=None):
+        """Queue a batch URL on the node owning its Space, as a one-URL batch there; None if it cannot be reached"""
+        import requests
+        
+        try:
+            response = requests.post(
+                f"{node}/api/download-batch",
+                json={'urls': [url], 'format': fmt},
+                headers=cluster.forward_headers(client),
+                timeout=(CLUSTER_CONNECT_TIMEOUT, CLUSTER_READ_TIMEOUT)
+            )
+            response.raise_for_status()
+            item = json.loads(response.text.splitlines()[0])
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logger.warning(f"Could not forward {url} to {node}: {str(e)}")
+            cluster.mark_down(node)
+            return None
+        
+        CLUSTER_ROUTED.inc(mode='forward')
+        # The index and URL are those of the one-URL batch
+        item.pop('index', None)
+        item.pop('url', None)
+        return item
+    
+    def process_space_download(self, url, email, base_url, fmt=DEFAULT_OUTPUT_FORMAT, client=None, clip=None):
+        """Queue a Space download and email the recipient when it is ready"""
+        charged = 0
+        try:
+            url = self.normalize_twitter_url(url)
+            fmt = self.validate_output_format(fmt)
+            
+            if not self.validate_twitter_space_url(url):
+                raise ValueError("Invalid Twitter Space URL")
+            
+            logger.info(f"Processing Space download for: {url} -> {email}")
+            
+            # The notification is sent from the job's completion callback, so
+            # neither the download nor SMTP ever blocks this request
+            def notify(job):
+                self.send_notification_email(email, job, base_url)
+            
+            job_key = self.job_key(url, fmt, clip)
+            charged, provisional = self.admit_download(url, fmt, client, clip, job_key)
+            job_id = job_queue.submit(run_download_job, url, fmt, clip, self.peek_space_info(url),
+                                      job_key=job_key, on_finish=self.job_callbacks(
+                                          self.remember_space_id(url),
+                                          self.settle_download(client, charged) if provisional else None,
+                                          notify
+                                      ))
             
             return {
                 'success': True,
                 'message': 'Your Space download request has been queued',
-                'space_info': space_info
+                'job_id': job_id,
+                'status_url': f'/api/jobs/{job_id}'
             }
             
+        except QueueFullError:
+            rate_limiter.refund(client, charged)
+            raise
+        except RateLimitedError:
+            raise
         except Exception as e:
             logger.error(f"Error processing Space download: {str(e)}")
             raise ValueError(f"Failed to process Space download: {str(e)}")
     
-    def send_notification_email(self, email, space_info):
-        """Send download notification email (simulated for MVP)"""
-        # In a real implementation, you would configure SMTP settings
-        # and send actual emails with download links
-        logger.info(f"Simulating email to {email} for Space: {space_info['title']}")
-        
-        # For MVP, we just log the email content
-        email_content = f"""
-        Subject: Your Twitter Space Download is Ready!
+    def send_notification_email(self, email, job, base_url):
+        """Queue the download-ready (or failure) email for a finished job"""
+        if job['status'] != 'finished':
+            notifier.send(
+                email,
+                'Your Twitter Space download failed',
+                f"Hi there!\n\n"
+                f"Unfortunately we could not download your Twitter Space:\n\n"
+                f"{job['error']}\n\n"
+                f"Please check the link and try again.\n"
+            )
+            return
         
-        Hi there!
-        
-        Your Twitter Space download is ready:
-        
-        Title: {space_info['title']}
-        Author: {space_info['author']}
-        Duration: {space_info['duration']}
-        
-        Download Link: [This would be a real download link in production]
-        
-        Thank you for using our Twitter Space Downloader!
-        """
-        
-        logger.info(f"Email content:\n{email_content}")
-        return True
+        result = job['result']
+        download_link = base_url.rstrip('/') + result['download_url']
+        text = (
+            f"Hi there!\n\n"
+            f"Your Twitter Space download is ready:\n\n"
+            f"Title: {result['title']}\n"
+            f"Author: {result['author']}\n"
+            f"Duration: {result['duration']}\n"
+            f"Size: {result['filesize']}\n\n"
+            f"Download Link: {download_link}\n\n"
+            f"Thank you for using our Twitter Space Downloader!\n"
+        )
+        html = (
+            f"<p>Hi there!</p>"
+            f"<p>Your Twitter Space download is ready:</p>"
+            f"<ul><li>Title: {escape(result['title'])}</li>"
+            f"<li>Author: {escape(result['author'])}</li>"
+            f"<li>Duration: {result['duration']}</li>"
+            f"<li>Size: {result['filesize']}</li></ul>"
+            f"<p><a href=\"{escape(download_link)}\">Download {escape(result['filename'])}</a></p>"
+            f"<p>Thank you for using our Twitter Space Downloader!</p>"
+        )
+        notifier.send(email, 'Your Twitter Space Download is Ready!', text, html)
 
     def format_filesize(self, size):
         """Format file size in human readable format"""
@@ -370,6 +1409,229 @@ class TwitterSpaceDownloader:
 
 # Initialize downloader
 downloader = TwitterSpaceDownloader()
+ydl_pool.register('metadata', {'quiet': True})
+for output_format in OUTPUT_FORMATS:
+    ydl_pool.register(f'download:{output_format}', downloader.build_download_opts(output_format))
+job_queue = JobQueue(
+    max_workers=JOB_MAX_WORKERS,
+    max_queue=JOB_MAX_QUEUE,
+    job_timeout=JOB_TIMEOUT,
+    result_ttl=JOB_RESULT_TTL,
+    id_prefix=cluster.job_prefix,
+    lanes={'live': LIVE_MAX_RECORDINGS},
+)
+
+stream_slots = threading.BoundedSemaphore(max(1, STREAM_MAX_CONCURRENT))
+
+# Batch lookups of all requests share these threads, so concurrent batches
+# together make at most BATCH_CONCURRENCY lookups at a time
+batch_pool = ThreadPoolExecutor(max_workers=max(1, BATCH_CONCURRENCY), thread_name_prefix='batch')
+
+def run_download_job(url, fmt, clip=None, space_info=None):
+    """Job entry point: download a Space (or a clip of it) in a worker process
+
+    space_info is the metadata the queueing process had cached, handed over
+    so the worker does not look the Space up again.
+    """
+    if space_info and space_info.get('id') and not is_live_info(space_info):
+        space_resolver.remember(downloader.normalize_twitter_url(url), space_info['id'])
+        metadata_cache.set(space_info['id'], space_info)
+    return downloader.download_space_audio(url, fmt, clip)
+
+def collect_metrics():
+    """Gauges read at scrape time"""
+    stats = job_queue.stats()
+    hits, misses = STORE_LOOKUPS.value(result='hit'), STORE_LOOKUPS.value(result='miss')
+    store_bytes, store_files = file_store.usage()
+    return [
+        ('xspace_job_queue_depth', 'gauge', 'Jobs waiting for a worker process', [({}, stats['queued'])]),
+        ('xspace_job_queue_capacity', 'gauge', 'Jobs that can wait before requests get 503', [({}, stats['max_queue'])]),
+        ('xspace_job_workers_busy', 'gauge', 'Worker processes running a job', [({}, stats['running'])]),
+        ('xspace_job_workers', 'gauge', 'Configured worker processes', [({}, stats['max_workers'])]),
+        ('xspace_live_recordings', 'gauge', 'Live Spaces being recorded', [({}, stats['lanes']['live']['running'])]),
+        ('xspace_store_hit_ratio', 'gauge', 'Share of download requests answered from the file store',
+         [({}, hits / (hits + misses) if hits + misses else 0.0)]),
+        ('xspace_metadata_cache_hit_ratio', 'gauge', 'Share of metadata lookups answered from the cache',
+         [({}, float(metadata_cache.stats()['hit_ratio']))]),
+        ('xspace_store_bytes', 'gauge', 'Bytes held by the file store', [({}, store_bytes)]),
+        ('xspace_store_files', 'gauge', 'Files held by the file store', [({}, store_files)]),
+        ('xspace_disk_free_bytes', 'gauge', 'Free space on the DOWNLOAD_DIR filesystem',
+         [({}, shutil.disk_usage(DOWNLOAD_DIR).free)]),
+    ]
+
+metrics.registry.add_collector(collect_metrics)
+
+def health_report():
+    """Return (report, status_code); 503 when the disk is nearly full or no job can be accepted"""
+    free = shutil.disk_usage(DOWNLOAD_DIR).free
+    stats = job_queue.stats()
+    checks = {
+        'disk': {'ok': free >= HEALTH_MIN_FREE_BYTES, 'free_bytes': free, 'min_free_bytes': HEALTH_MIN_FREE_BYTES},
+        # Every worker busy and the queue full: new downloads are being turned away
+        'workers': dict(stats, ok=stats['queued'] < stats['max_queue']),
+    }
+    healthy = all(check['ok'] for check in checks.values())
+    report = {
+        'status': 'healthy' if healthy else 'unhealthy',
+        'timestamp': datetime.now().isoformat(),
+        'checks': checks
+    }
+    if cluster.enabled:
+        report['cluster'] = cluster.stats()
+    return report, 200 if healthy else 503
+
+def build_space_download_response(result):
+    """Build the API response for a finished Space download"""
+    return {
+        'title': result['title'],
+        'author': result['author'],
+        'duration': result['duration'],
+        'thumbnail': result['thumbnail'],
+        'clip': result.get('clip'),
+        'formats': [{
+            'format_id': result['format'],
+            'url': result['download_url'],
+            'ext': result['format'],
+            'quality': OUTPUT_FORMATS[result['format']]['quality'],
+            'filesize': result['filesize'],
+            'filename': result['filename'],
+            'processing': result['processing']
+        }]
+    }
+
+def rate_limit_client():
+    """Bucket key of the current request, or None while rate limiting is off"""
+    forwarded = cluster.forwarded_client(request.headers)
+    if forwarded and rate_limiter.enabled:
+        # Charged here, on the owning node, for the client the forwarding node saw
+        return forwarded
+    return rate_limiter.client(
+        request.headers.get('X-API-Key'), request.remote_addr, request.headers.get('X-Forwarded-For')
+    )
+
+def rate_limited(error):
+    """429 response telling the client when its bucket will cover the request"""
+    logger.warning(f"Rate limiting {rate_limit_client()}: {str(error)}")
+    RATE_LIMITED.inc()
+    response = jsonify({'error': 'Too many requests, please try again later', 'retry_after': error.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+@app.before_request
+def start_request_trace():
+    """Open the request's root span, and start the profiler if this request is sampled"""
+    g.trace_span = tracing.tracer.start_span('http.request', method=request.method, path=request.path)
+    g.profile = tracing.profiler.start()
+
+@app.after_request
+def record_response_status(response):
+    span = g.get('trace_span')
+    if span is not None:
+        span.set(status_code=response.status_code)
+    return response
+
+@app.teardown_request
+def end_request_trace(error=None):
+    span = g.pop('trace_span', None)
+    if span is not None:
+        span.end(error)
+    run = g.pop('profile', None)
+    if run is not None:
+        run.stop(f"{request.method}-{request.path}")
+
+# Hop-by-hop headers, and those the serving side sets itself, are not copied when proxying
+PROXY_SKIP_HEADERS = frozenset({
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailer',
+    'transfer-encoding', 'upgrade', 'date', 'server',
+})
+
+def routing_space_id(url=None, filename=None):
+    """Space id to route a request by, from its Space URL or stored file name; None if any node can serve it"""
+    if filename is not None:
+        # A shared bucket serves every file from every node
+        if STORAGE_BACKEND != 'local':
+            return None
+        # Files are served where they are. A node also stores Spaces it does not
+        # own: links whose Space id was unknown when they were routed, and
+        # Spaces taken over while their owner was down
+        if file_store.get(os.path.basename(filename)):
+            return None
+        # Storage keys are <space_id>.<format>, or <space_id>.<start>-<end>.<format> for clips
+        return os.path.basename(filename).split('.', 1)[0]
+    if not isinstance(url, str) or not url.strip():
+        return None
+    try:
+        return downloader.extract_space_id(downloader.normalize_twitter_url(url))
+    except ValueError:
+        return None
+
+def request_owner():
+    """Node that should serve the current request, if it is not this one"""
+    endpoint = request.endpoint
+    if endpoint in ('job_status', 'job_result', 'job_events'):
+        return cluster.job_node(request.view_args['job_id'])
+    if endpoint in ('download_video', 'download_space_direct', 'process_space'):
+        data = request.get_json(silent=True)
+        space_id = routing_space_id(url=data.get('url') if isinstance(data, dict) else None)
+    elif endpoint == 'stream_space':
+        space_id = routing_space_id(url=request.args.get('url'))
+    elif endpoint == 'live_recording':
+        space_id = request.view_args['space_id']
+    elif endpoint == 'download_file':
+        space_id = routing_space_id(filename=request.view_args['filename'])
+    else:
+        return None
+    return cluster.remote_owner(space_id)
+
+def forward_request(node):
+    """Proxy the current request to node and stream its response back unchanged"""
+    import requests
+    
+    headers = {name: value for name, value in request.headers if name.lower() not in PROXY_SKIP_HEADERS}
+    headers.update(cluster.forward_headers(rate_limit_client()))
+    upstream = requests.request(
+        request.method,
+        node + request.full_path.rstrip('?'),
+        headers=headers,
+        data=request.get_data(),
+        stream=True,
+        allow_redirects=False,
+        timeout=(CLUSTER_CONNECT_TIMEOUT, CLUSTER_READ_TIMEOUT)
+    )
+    
+    def body():
+        try:
+            # Raw bytes, so Content-Encoding and Content-Length still hold
+            yield from upstream.raw.stream(64 * 1024, decode_content=False)
+        finally:
+            upstream.close()
+    
+    response_headers = [(name, value) for name, value in upstream.raw.headers.items()
+                        if name.lower() not in PROXY_SKIP_HEADERS]
+    return Response(body(), status=upstream.status_code, headers=response_headers)
+
+@app.before_request
+def route_to_owner():
+    """Send requests about another node's Spaces or jobs to that node"""
+    if not cluster.enabled or cluster.is_forwarded(request.headers):
+        return None
+    node = request_owner()
+    if node is None:
+        return None
+    
+    CLUSTER_ROUTED.inc(mode=cluster.mode)
+    if cluster.mode == 'redirect':
+        return redirect(node + request.full_path.rstrip('?'), code=307)
+    
+    import requests
+    try:
+        return forward_request(node)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        # Better served here than not at all; the probe brings the node back
+        logger.warning(f"Could not forward {request.path} to {node}: {str(e)}")
+        cluster.mark_down(node)
+        return None
 
 @app.route('/favicon.ico')
 def favicon():
@@ -396,16 +1658,54 @@ def download_file(filename):
     """Serve downloaded audio files"""
     try:
         # Sanitize filename to prevent path traversal
-        safe_filename = os.path.basename(filename)
-        filepath = os.path.join(DOWNLOAD_DIR, safe_filename)
+        storage_key = os.path.basename(filename)
+        entry = file_store.get(storage_key)
         
-        if not os.path.exists(filepath):
-            logger.error(f"File not found: {filepath}")
+        if entry is None:
+            logger.error(f"File not found: {storage_key}")
             abort(404)
         
-        logger.info(f"Serving file: {safe_filename}")
-        return send_file(filepath, as_attachment=True, download_name=safe_filename)
+        redirect_url = file_store.redirect_url(entry)
+        if redirect_url:
+            # The object store serves the bytes, ranges and conditional requests itself
+            logger.info(f"Redirecting to stored object: {storage_key}")
+            cache_manager.record_served(storage_key)
+            return redirect(redirect_url)
+        
+        filepath = file_store.path_for(storage_key)
+        logger.info(f"Serving file: {storage_key}")
+        
+        # Conditional responses handle Range/If-Range (206) and If-None-Match (304);
+        # full responses go out via wsgi.file_wrapper, which gunicorn maps to sendfile()
+        response = send_file(
+            filepath,
+            as_attachment=True,
+            download_name=entry['download_name'],
+            conditional=True,
+            etag=file_store.etag(entry),
+            last_modified=entry['created_at']
+        )
+        
+        # Advertise resumability on full responses too, so clients know they can resume
+        response.headers['Accept-Ranges'] = 'bytes'
+        
+        # Count each transfer once: skip revalidations and resumed ranges. A
+        # Range whose If-Range no longer matches gets the whole file (200)
+        resumed = response.status_code == 206 and request.range.ranges[0][0] != 0
+        if response.status_code in (200, 206) and not resumed:
+            cache_manager.record_served(storage_key)
+        if response.status_code in (200, 206) and response.content_length:
+            SERVED_BYTES.inc(response.content_length)
+        
+        return response
         
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        # The index outlived its file; drop the stale entry
+        logger.error(f"Indexed file missing on disk: {filename}")
+        file_store.remove(os.path.basename(filename))
+        abort(404)
     except Exception as e:
         logger.error(f"Error serving file: {str(e)}")
         abort(500)
@@ -428,15 +1728,23 @@ def process_space():
         logger.info(f"Processing Space download request for: {url} -> {email}")
         
         # Process the Space download
-        result = downloader.process_space_download(url, email)
+        base_url = PUBLIC_BASE_URL or request.host_url
+        clip = downloader.parse_clip(data.get('start'), data.get('end'))
+        result = downloader.process_space_download(url, email, base_url, data.get('format'), rate_limit_client(), clip)
         
-        logger.info(f"Successfully queued Space download: {result['space_info']['title']}")
+        logger.info(f"Successfully queued Space download: job {result['job_id']}")
         
-        return jsonify(result)
+        return jsonify(result), 202
         
     except ValueError as e:
         logger.error(f"Validation error: {str(e)}")
         return jsonify({'error': str(e)}), 400
+    except RateLimitedError as e:
+        return rate_limited(e)
+    except QueueFullError as e:
+        logger.warning(f"Rejecting download: {str(e)}")
+        ERRORS.inc(type='QueueFullError')
+        return jsonify({'error': 'Server is busy, please try again later'}), 503
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         return jsonify({'error': 'Internal server error occurred'}), 500
@@ -454,7 +1762,7 @@ def download_video():
         logger.info(f"Legacy endpoint called for: {url}")
         
         # Extract Space information for legacy compatibility
-        space_info = downloader.extract_space_info(url)
+        space_info = downloader.extract_space_info(url, rate_limit_client())
         
         logger.info(f"Successfully extracted Space info: {space_info['title']}")
         
@@ -463,13 +1771,15 @@ def download_video():
     except ValueError as e:
         logger.error(f"Validation error: {str(e)}")
         return jsonify({'error': str(e)}), 400
+    except RateLimitedError as e:
+        return rate_limited(e)
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         return jsonify({'error': 'Internal server error occurred'}), 500
 
 @app.route('/api/download-space', methods=['POST'])
 def download_space_direct():
-    """API endpoint to download Twitter Spaces and provide download links"""
+    """API endpoint to queue a Twitter Space download and return a job id"""
     try:
         data = request.get_json()
         if not data or 'url' not in data:
@@ -477,40 +1787,257 @@ def download_space_direct():
         
         url = data['url']
         
-        logger.info(f"Processing direct Space download for: {url}")
-        
-        # Download the Space audio file
-        result = downloader.download_space_audio(url)
-        
-        logger.info(f"Successfully downloaded Space: {result['title']}")
-        
-        # Return the local download information
-        return jsonify({
-            'title': result['title'],
-            'author': result['author'],
-            'duration': result['duration'],
-            'thumbnail': result['thumbnail'],
-            'formats': [{
-                'format_id': 'mp3',
-                'url': result['download_url'],
-                'ext': 'mp3',
-                'quality': 'High Quality (192kbps)',
-                'filesize': result['filesize'],
-                'filename': result['filename']
-            }]
-        })
+        logger.info(f"Queueing direct Space download for: {url}")
+        
+        clip = downloader.parse_clip(data.get('start'), data.get('end'))
+        result = downloader.queue_download(url, data.get('format'), rate_limit_client(), clip)
+        return jsonify(result), 200 if result['status'] == 'finished' else 202
         
     except ValueError as e:
         logger.error(f"Validation error: {str(e)}")
         return jsonify({'error': str(e)}), 400
+    except RateLimitedError as e:
+        return rate_limited(e)
+    except QueueFullError as e:
+        logger.warning(f"Rejecting download: {str(e)}")
+        ERRORS.inc(type='QueueFullError')
+        return jsonify({'error': 'Server is busy, please try again later'}), 503
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         return jsonify({'error': 'Internal server error occurred'}), 500
 
+@app.route('/api/download-batch', methods=['POST'])
+def download_batch():
+    """Resolve and queue many Space downloads, streaming one NDJSON line per URL as it completes"""
+    try:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get('urls'), list):
+            return jsonify({'error': 'A list of URLs is required'}), 400
+        
+        urls = data['urls']
+        if len(urls) > BATCH_MAX_URLS:
+            return jsonify({'error': f'At most {BATCH_MAX_URLS} URLs per batch'}), 400
+        
+        fmt = downloader.validate_output_format(data.get('format'))
+        
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    
+    logger.info(f"Queueing batch of {len(urls)} Space URLs")
+    # The request context is gone by the time the generator runs
+    client = rate_limit_client()
+    route = not cluster.is_forwarded(request.headers)
+    
+    def line(item):
+        return json.dumps(item) + '\n'
+    
+    def generate():
+        # Invalid and duplicate URLs are answered up front, without any lookups
+        first_seen = {}
+        pending = []
+        for index, url in enumerate(urls):
+            item = {'index': index, 'url': url}
+            normalized = downloader.normalize_twitter_url(url) if isinstance(url, str) and url.strip() else None
+            if not normalized or not downloader.validate_twitter_space_url(normalized):
+                item.update(status='invalid', error='Invalid Twitter Space URL')
+                yield line(item)
+            elif normalized in first_seen:
+                item.update(status='duplicate', duplicate_of=first_seen[normalized])
+                yield line(item)
+            else:
+                first_seen[normalized] = index
+                pending.append((item, normalized))
+        
+        futures = {
+            batch_pool.submit(downloader.queue_batch_item, normalized, fmt, client, route): item
+            for item, normalized in pending
+        }
+        try:
+            for future in as_completed(futures):
+                yield line(dict(futures[future], **future.result()))
+        finally:
+            # A client that disconnects stops the lookups that have not started yet
+            for future in futures:
+                future.cancel()
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/stream-space', methods=['GET'])
+def stream_space():
+    """Stream a Space while it is being converted"""
+    try:
+        url = request.args.get('url')
+        if not url:
+            return jsonify({'error': 'URL is required'}), 400
+        
+        logger.info(f"Streaming Space for: {url}")
+        
+        fmt = downloader.validate_output_format(request.args.get('format'))
+        result, stream = downloader.stream_space_audio(url, fmt, rate_limit_client())
+        if stream is None:
+            # Already stored: the regular download route supports ranges and caching
+            return redirect(f"/download/{result['key']}")
+        
+        chunks = stream.iter_chunks()
+        stream.start()
+        
+        title = result.get('title', 'Twitter Space')
+        response = Response(chunks, mimetype=OUTPUT_FORMATS[fmt]['mimetype'])
+        response.headers.set(
+            'Content-Disposition', 'attachment',
+            filename=f"{downloader.sanitize_filename(title)}.{fmt}"
+        )
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+        
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except RateLimitedError as e:
+        return rate_limited(e)
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return jsonify({'error': 'Internal server error occurred'}), 500
+
+def recorder_alive(state):
+    """Whether the job that wrote a live recording's state is still queued or running
+
+    A recorder killed on timeout or by a restart never updates its state, so
+    the job's own status is what tells readers to stop waiting.
+    """
+    if not state.get('job_id'):
+        # Recorded outside the job queue
+        return True
+    job = job_queue.get(state['job_id'])
+    return job is not None and job['status'] in ('queued', 'running')
+
+@app.route('/api/live/<space_id>', methods=['GET'])
+def live_recording(space_id):
+    """Serve a live Space's recording while it is still being captured"""
+    try:
+        fmt = downloader.validate_output_format(request.args.get('format'))
+        entry = file_store.lookup(space_id, fmt)
+        if entry:
+            # Recording finished and stored: the regular download route supports ranges and caching
+            return redirect(f"/download/{entry['key']}")
+        
+        live_dir = downloader.live_dir(space_id)
+        state = Checkpoint(os.path.join(live_dir, 'state.json'))
+        current = state.load()
+        if not current or current['status'] not in ('recording', 'converting') or not recorder_alive(current):
+            return jsonify({'error': 'No live recording for this Space'}), 404
+        
+        # Opened eagerly so the reader survives the directory being removed on completion
+        recording = open(os.path.join(live_dir, 'recording'), 'rb')
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({'error': 'No live recording for this Space'}), 404
+    
+    def follow(f):
+        with f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if chunk:
+                    yield chunk
+                    continue
+                # At the live edge: stop once the recorder has moved on or died, otherwise wait for more
+                latest = state.load() or {}
+                if latest.get('status') != 'recording' or not recorder_alive(latest):
+                    yield f.read()
+                    return
+                time.sleep(1)
+    
+    response = Response(follow(recording), mimetype=current['mimetype'])
+    response.headers.set(
+        'Content-Disposition', 'attachment',
+        filename=f"{downloader.sanitize_filename(current.get('title', 'Twitter Space'))} (live).aac"
+    )
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report the status of a queued download job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify({
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'progress': job['progress'],
+        'error': job['error']
+    })
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Return the download links of a finished job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if job['status'] in ('queued', 'running'):
+        return jsonify({'job_id': job_id, 'status': job['status']}), 202
+    
+    if job['status'] == 'failed':
+        status_code = {'invalid': 400, 'timeout': 504}.get(job['error_type'], 500)
+        return jsonify({'error': job['error']}), status_code
+    
+    return jsonify(build_space_download_response(job['result']))
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream a job's progress as Server-Sent Events until it finishes"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    def generate(job):
+        # Every subscriber just waits on the queue's condition; nothing is polled per client
+        version = None
+        while job is not None:
+            if job['version'] == version:
+                yield ": keep-alive\n\n"
+            else:
+                version = job['version']
+                yield sse('progress', {'status': job['status'], 'progress': job['progress']})
+            
+            if job['status'] == 'finished':
+                yield sse('done', {'status': 'finished', 'result': build_space_download_response(job['result'])})
+                return
+            if job['status'] == 'failed':
+                yield sse('done', {'status': 'failed', 'error': job['error']})
+                return
+            job = job_queue.wait_for_update(job_id, version, timeout=15)
+    
+    return Response(generate(job), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+    report, status_code = health_report()
+    return jsonify(report), status_code
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.errorhandler(404)
 def not_found(error):
@@ -518,6 +2045,7 @@ def not_found(error):
 
 @app.errorhandler(500)
 def internal_error(error):
+    ERRORS.inc(type='InternalServerError')
     return jsonify({'error': 'Internal server error'}), 500
 
 if __name__ == '__main__':
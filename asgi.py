@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+ASGI variant of the Twitter Space Downloader API
+Serves the main routes of app.py from an event loop, so a slow client costs a
+coroutine instead of a thread. Blocking yt-dlp and file-store calls run on
+bounded thread pools; downloads themselves still run in the job queue's worker
+processes.
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+
+import os
+import re
+import asyncio
+import logging
+import functools
+import contextvars
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, RedirectResponse, Response
+from starlette.routing import Route
+
+from app import (
+    CORS_ORIGINS,
+    PUBLIC_BASE_URL,
+    build_space_download_response,
+    cache_manager,
+    cluster,
+    CLUSTER_ROUTED,
+    downloader,
+    file_store,
+    health_report,
+    job_queue,
+    rate_limiter,
+    RATE_LIMITED,
+    routing_space_id,
+    SERVED_BYTES,
+)
+from jobs import QueueFullError
+from rate_limit import RateLimitedError
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Thread pools for blocking calls; work beyond max_pending is turned away with 503
+ASGI_EXTRACT_WORKERS = int(os.environ.get('ASGI_EXTRACT_WORKERS', 16))
+ASGI_EXTRACT_MAX_PENDING = int(os.environ.get('ASGI_EXTRACT_MAX_PENDING', 200))
+ASGI_IO_WORKERS = int(os.environ.get('ASGI_IO_WORKERS', 8))
+ASGI_IO_MAX_PENDING = int(os.environ.get('ASGI_IO_MAX_PENDING', 1000))
+
+
+class BlockingPool:
+    """Runs blocking calls on a fixed thread pool, with a cap on calls waiting for a thread"""
+
+    def __init__(self, name, max_workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.max_pending = max_pending
+        # Only touched from the event loop thread, so no lock is needed
+        self.pending = 0
+
+    async def run(self, func, *args):
+        if self.pending >= self.max_pending:
+            raise QueueFullError(f"{self.pending} blocking calls already pending")
+        self.pending += 1
+        # Run in a copy of the caller's context so spans opened in the thread join the request's trace
+        context = contextvars.copy_context()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, functools.partial(context.run, func, *args)
+            )
+        finally:
+            self.pending -= 1
+
+    def submit(self, func, *args):
+        """Run func in the background without waiting for it or counting it against max_pending"""
+        self.executor.submit(func, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+extract_pool = BlockingPool('asgi-extract', ASGI_EXTRACT_WORKERS, ASGI_EXTRACT_MAX_PENDING)
+io_pool = BlockingPool('asgi-io', ASGI_IO_WORKERS, ASGI_IO_MAX_PENDING)
+
+
+def error(message, status_code):
+    return JSONResponse({'error': message}, status_code=status_code)
+
+
+async def read_json(request):
+    """Return the request's JSON object, or None if the body is not one"""
+    try:
+        data = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def client_of(request):
+    """Rate limiting bucket key of a request, or None while rate limiting is off"""
+    forwarded = cluster.forwarded_client(request.headers)
+    if forwarded and rate_limiter.enabled:
+        return forwarded
+    return rate_limiter.client(
+        request.headers.get('x-api-key'),
+        request.client.host if request.client else None,
+        request.headers.get('x-forwarded-for'),
+    )
+
+
+async def route_to_owner(request):
+    """Redirect (307) to the node owning the request's Space or job, or return None to serve it here
+
+    Unlike app.py, this server never proxies, whatever CLUSTER_MODE says.
+    """
+    if not cluster.enabled or cluster.is_forwarded(request.headers):
+        return None
+    if 'job_id' in request.path_params:
+        node = cluster.job_node(request.path_params['job_id'])
+    elif 'filename' in request.path_params:
+        # Looks the file up in the local store first
+        node = cluster.remote_owner(await io_pool.run(routing_space_id, None, request.path_params['filename']))
+    elif request.method == 'POST':
+        data = await read_json(request)
+        # Resolving a short link may take a lookup
+        space_id = await extract_pool.run(routing_space_id, data.get('url')) if data else None
+        node = cluster.remote_owner(space_id)
+    else:
+        return None
+    if node is None:
+        return None
+
+    CLUSTER_ROUTED.inc(mode='redirect')
+    query = f'?{request.url.query}' if request.url.query else ''
+    return RedirectResponse(f'{node}{request.url.path}{query}', status_code=307)
+
+
+def api_route(handler):
+    """Map the exceptions the Flask routes handle to the same JSON errors, inside a request span"""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        with tracing.tracer.span('http.request', method=request.method, path=request.url.path) as span:
+            response = await handle(request)
+            span.set(status_code=response.status_code)
+            return response
+
+    async def handle(request):
+        try:
+            return await route_to_owner(request) or await handler(request)
+        except ValueError as e:
+            logger.error(f"Validation error: {str(e)}")
+            return error(str(e), 400)
+        except RateLimitedError as e:
+            logger.warning(f"Rate limiting {client_of(request)}: {str(e)}")
+            RATE_LIMITED.inc()
+            return JSONResponse(
+                {'error': 'Too many requests, please try again later', 'retry_after': e.retry_after},
+                status_code=429, headers={'Retry-After': str(e.retry_after)}
+            )
+        except QueueFullError as e:
+            logger.warning(f"Rejecting request: {str(e)}")
+            return error('Server is busy, please try again later', 503)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            return error('Internal server error occurred', 500)
+    return wrapper
+
+
+@api_route
+async def download_video(request):
+    """Legacy API endpoint - extract Space information"""
+    data = await read_json(request)
+    if not data or 'url' not in data:
+        return error('URL is required', 400)
+
+    url = data['url']
+    logger.info(f"Legacy endpoint called for: {url}")
+
+    space_info = await extract_pool.run(downloader.extract_space_info, url, client_of(request))
+    logger.info(f"Successfully extracted Space info: {space_info['title']}")
+    return JSONResponse(space_info)
+
+
+@api_route
+async def download_space_direct(request):
+    """Queue a Twitter Space download and return a job id"""
+    data = await read_json(request)
+    if not data or 'url' not in data:
+        return error('URL is required', 400)
+
+    logger.info(f"Queueing direct Space download for: {data['url']}")
+    clip = downloader.parse_clip(data.get('start'), data.get('end'))
+    # Admission may look the Space up to price it, so this runs off the event loop
+    result = await extract_pool.run(
+        downloader.queue_download, data['url'], data.get('format'), client_of(request), clip
+    )
+    return JSONResponse(result, status_code=200 if result['status'] == 'finished' else 202)
+
+
+@api_route
+async def process_space(request):
+    """Queue a Space download and email the requester when it is ready"""
+    data = await read_json(request)
+    if not data or 'url' not in data or 'email' not in data:
+        return error('URL and email are required', 400)
+
+    url = data['url']
+    email = data['email']
+    if not re.match(r'^[^\s@]+@[^\s@]+\.[^\s@]+$', email):
+        return error('Invalid email format', 400)
+
+    logger.info(f"Processing Space download request for: {url} -> {email}")
+
+    base_url = PUBLIC_BASE_URL or str(request.base_url)
+    clip = downloader.parse_clip(data.get('start'), data.get('end'))
+    result = await extract_pool.run(
+        downloader.process_space_download, url, email, base_url, data.get('format'), client_of(request), clip
+    )
+
+    logger.info(f"Successfully queued Space download: job {result['job_id']}")
+    return JSONResponse(result, status_code=202)
+
+
+def etag_matches(header, etag):
+    """Weak comparison of an If-None-Match header against a quoted entity tag"""
+    if header.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in header.split(','))
+
+
+class CountedFileResponse(FileResponse):
+    """FileResponse that counts the bytes it sends, whole file or range, in SERVED_BYTES"""
+
+    async def __call__(self, scope, receive, send):
+        async def counting_send(message):
+            if message['type'] == 'http.response.start' and message['status'] in (200, 206):
+                length = dict(message['headers']).get(b'content-length')
+                if length:
+                    SERVED_BYTES.inc(int(length))
+            await send(message)
+        await super().__call__(scope, receive, counting_send)
+
+
+def resumes_transfer(request, headers):
+    """Whether FileResponse will answer with a range that does not start at byte 0
+
+    Like FileResponse, a range is only honoured while If-Range (if any) still
+    names the file's entity tag or modification date.
+    """
+    range_header = request.headers.get('range', '').replace(' ', '')
+    if not range_header or range_header.startswith('bytes=0-'):
+        return False
+    if_range = request.headers.get('if-range')
+    return if_range is None or if_range in (headers['etag'], headers['last-modified'])
+
+
+@api_route
+async def download_file(request):
+    """Serve a stored audio file with Range, If-Range and If-None-Match support"""
+    # Sanitize filename to prevent path traversal
+    storage_key = os.path.basename(request.path_params['filename'])
+    entry = await io_pool.run(file_store.get, storage_key)
+    if entry is None:
+        logger.error(f"File not found: {storage_key}")
+        return error('Endpoint not found', 404)
+
+    redirect_url = file_store.redirect_url(entry)
+    if redirect_url:
+        # The object store serves the bytes, ranges and conditional requests itself
+        logger.info(f"Redirecting to stored object: {storage_key}")
+        io_pool.submit(cache_manager.record_served, storage_key)
+        return RedirectResponse(redirect_url, status_code=302)
+
+    filepath = file_store.path_for(storage_key)
+    try:
+        stat_result = await io_pool.run(os.stat, filepath)
+    except FileNotFoundError:
+        # The index outlived its file; drop the stale entry
+        logger.error(f"Indexed file missing on disk: {storage_key}")
+        io_pool.submit(file_store.remove, storage_key)
+        return error('Endpoint not found', 404)
+
+    headers = {
+        'etag': f'"{file_store.etag(entry)}"',
+        'last-modified': formatdate(entry['created_at'], usegmt=True),
+    }
+    if etag_matches(request.headers.get('if-none-match', ''), headers['etag']):
+        return Response(status_code=304, headers=headers)
+
+    logger.info(f"Serving file: {storage_key}")
+
+    # Count each transfer once: skip resumed ranges, but not a full response to a stale If-Range
+    if not resumes_transfer(request, headers):
+        io_pool.submit(cache_manager.record_served, storage_key)
+
+    # FileResponse reads the file in chunks off the event loop, or hands the
+    # path to the server (http.response.pathsend) when it supports that
+    return CountedFileResponse(filepath, filename=entry['download_name'], stat_result=stat_result, headers=headers)
+
+
+@api_route
+async def job_status(request):
+    """Report the status of a queued download job"""
+    job = job_queue.get(request.path_params['job_id'])
+    if job is None:
+        return error('Job not found', 404)
+
+    return JSONResponse({
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'progress': job['progress'],
+        'error': job['error']
+    })
+
+
+@api_route
+async def job_result(request):
+    """Return the download links of a finished job"""
+    job_id = request.path_params['job_id']
+    job = job_queue.get(job_id)
+    if job is None:
+        return error('Job not found', 404)
+
+    if job['status'] in ('queued', 'running'):
+        return JSONResponse({'job_id': job_id, 'status': job['status']}, status_code=202)
+
+    if job['status'] == 'failed':
+        status_code = {'invalid': 400, 'timeout': 504}.get(job['error_type'], 500)
+        return error(job['error'], status_code)
+
+    return JSONResponse(build_space_download_response(job['result']))
+
+
+@api_route
+async def health_check(request):
+    """Health check endpoint"""
+    report, status_code = await io_pool.run(health_report)
+    return JSONResponse(report, status_code=status_code)
+
+
+async def not_found(request, exc):
+    if exc.status_code == 404:
+        return error('Endpoint not found', 404)
+    return error(exc.detail, exc.status_code)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    extract_pool.shutdown()
+    io_pool.shutdown()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/download', download_video, methods=['POST']),
+        Route('/api/download-space', download_space_direct, methods=['POST']),
+        Route('/api/process-space', process_space, methods=['POST']),
+        Route('/download/{filename}', download_file, methods=['GET', 'HEAD']),
+        Route('/api/jobs/{job_id}', job_status, methods=['GET']),
+        Route('/api/jobs/{job_id}/result', job_result, methods=['GET']),
+        Route('/api/health', health_check, methods=['GET']),
+    ],
+    middleware=[Middleware(
+        CORSMiddleware, allow_origins=CORS_ORIGINS.split(','), allow_methods=['*'], allow_headers=['*'],
+        expose_headers=['Retry-After']
+    )],
+    exception_handlers={HTTPException: not_found},
+    lifespan=lifespan,
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get('PORT', 5000))
+    logger.info(f"Starting Twitter Space Downloader ASGI API on port {port}")
+    uvicorn.run(app, host='0.0.0.0', port=port)
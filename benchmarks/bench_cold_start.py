@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold-start latency of the Vercel function in api/download.py
+Every run starts a fresh interpreter, the way a serverless cold start does, and
+times three stages: the old eager start (import yt_dlp and build a YoutubeDL
+with every extractor), importing api/download.py, and importing it plus the
+warm-up hook. The heaviest imports, from python -X importtime, are included so
+regressions can be traced to a module. Record one report per release.
+
+Usage: python benchmarks/bench_cold_start.py --runs 10 --output cold-start-$(git describe --tags).json
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each stage prints its in-process time in milliseconds
+STAGES = {
+    'eager_yt_dlp': (
+        "import time; t = time.perf_counter(); import yt_dlp; yt_dlp.YoutubeDL({'quiet': True}); "
+        "print((time.perf_counter() - t) * 1000)"
+    ),
+    'lazy_import': (
+        "import time, sys; t = time.perf_counter(); sys.path.insert(0, 'api'); import download; "
+        "print((time.perf_counter() - t) * 1000)"
+    ),
+    'lazy_import_and_warm_up': (
+        "import time, sys; t = time.perf_counter(); sys.path.insert(0, 'api'); import download; "
+        "download.warm_up(); print((time.perf_counter() - t) * 1000)"
+    ),
+}
+
+
+def run_stage(code, env):
+    completed = subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+def import_profile(env, top):
+    """Return the modules with the largest cumulative import time for import + warm-up"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STAGES['lazy_import_and_warm_up']],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split(':', 1)[1].split('|')
+        # Nested imports are indented two spaces per level; keep top-level imports and their direct children
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            modules.append((int(cumulative), depth, name.strip()))
+    modules.sort(reverse=True)
+    return [
+        {'module': name, 'depth': depth, 'cumulative_ms': round(us / 1000, 1)}
+        for us, depth, name in modules[:top]
+    ]
+
+
+def release():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--tags', '--always', '--dirty'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per stage')
+    parser.add_argument('--top', type=int, default=15, help='heaviest imports to list')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    # Prewarming on import would hide the lazy path
+    env = dict(os.environ, YDL_PREWARM='false')
+
+    results = {}
+    for name, code in STAGES.items():
+        timings = [run_stage(code, env) for _ in range(args.runs)]
+        results[name] = {
+            'median_ms': round(statistics.median(timings), 1),
+            'max_ms': round(max(timings), 1),
+        }
+
+    import yt_dlp.version
+
+    report = {
+        'benchmark': 'cold_start',
+        'release': release(),
+        'python': sys.version.split()[0],
+        'yt_dlp': yt_dlp.version.__version__,
+        'runs': args.runs,
+        'results': results,
+        'heaviest_imports': import_profile(env, args.top),
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
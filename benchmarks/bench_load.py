@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Load test the API offline against a local stand-in for Twitter
+Starts a FakeOrigin (see fake_origin.py) serving synthetic Spaces of
+--space-duration seconds, then runs the API server in a child process with
+yt-dlp's Space extractor pointed at it. Each scenario is driven at every
+--concurrency level:
+
+  api_download     POST /api/download for a new Space each time (metadata path)
+  download_space   POST /api/download-space for a new Space, polled until the job ends
+  download_file    GET /download/<key> of a stored file of the same length,
+                   following the redirect to the object store with --storage s3
+
+Per level the report has latency percentiles, throughput, the status codes
+seen, and the server's CPU time and peak RSS (job worker processes included).
+Pass --baseline with an earlier report to add ratios against it. --storage s3
+stores files in a FakeS3 (see fake_s3.py) instead of DOWNLOAD_DIR.
+
+Usage: python benchmarks/bench_load.py --concurrency 1,4,16 --output load-$(git describe --tags).json
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from collections import Counter
+from urllib.parse import urlsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+from fake_origin import FakeOrigin, ORIGIN_ENV
+from fake_s3 import FakeS3
+from jobs import in_worker_process
+
+SCENARIOS = ('api_download', 'download_space', 'download_file')
+S3_BUCKET = 'bench'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def use_fake_extractor():
+    """Point every yt-dlp profile of the app at the FakeOrigin; returns the app module"""
+    import app as app_module
+
+    pool = app_module.ydl_pool
+    for profile, opts in list(pool.profiles.items()):
+        pool.register(profile, opts, extractors=['fake_origin.FakeSpacesIE'])
+    return app_module
+
+
+def serve(port, server, seed_bytes):
+    """Child process entry point: run the API with the fake extractor and a seeded stored file"""
+    app_module = use_fake_extractor()
+
+    # A stored file for the download_file scenario, independent of ffmpeg
+    staged_path = os.path.join(app_module.DOWNLOAD_DIR, '.bench-seed')
+    with open(staged_path, 'wb') as f:
+        f.write(os.urandom(seed_bytes))
+    entry = app_module.file_store.commit('benchseed', 'm4a', staged_path, {
+        'title': 'Benchmark seed', 'author': 'bench', 'duration': None, 'thumbnail': '',
+        'download_name': 'benchmark-seed.m4a', 'processing': 'remux',
+    })
+    print(json.dumps({'seed_key': entry['key']}), flush=True)
+
+    if server == 'asgi':
+        import uvicorn
+        from asgi import app as asgi_app
+        uvicorn.run(asgi_app, host='127.0.0.1', port=port, log_level='warning')
+    else:
+        app_module.app.run(host='127.0.0.1', port=port, threaded=True)
+
+
+class ServerProcess:
+    """The API server under test, with CPU and memory read from /proc"""
+
+    def __init__(self, port, server, seed_bytes, origin_url, work_dir, rate_limit=False, s3_url=None):
+        env = dict(
+            os.environ,
+            # DOWNLOAD_DIR lives under the temp dir; keep the run's files out of the real one
+            TMPDIR=work_dir,
+            **{ORIGIN_ENV: origin_url},
+            PYTHONPATH=os.pathsep.join([ROOT, BENCH_DIR]),
+            YDL_PREWARM='false',
+        )
+        if not rate_limit:
+            # Every client comes from 127.0.0.1 and would share one bucket
+            env['RATE_LIMIT_ENABLED'] = 'false'
+        if s3_url:
+            env.update(
+                STORAGE_BACKEND='s3', S3_BUCKET=S3_BUCKET, S3_ENDPOINT_URL=s3_url, S3_REGION='us-east-1',
+                AWS_ACCESS_KEY_ID='bench', AWS_SECRET_ACCESS_KEY='bench',
+            )
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', str(port), '--server', server,
+             '--seed-bytes', str(seed_bytes)],
+            cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        self.seed_key = json.loads(self.process.stdout.readline())['seed_key']
+        # Keep reading so server output can never fill the pipe and stall it
+        threading.Thread(target=self.process.stdout.read, daemon=True).start()
+        self.port = port
+        self._peak_rss = 0
+        self._sampling = False
+
+    def wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                status, _, _, _ = request('127.0.0.1', self.port, 'GET', '/api/health')
+                if status in (200, 503):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError('API server did not start')
+
+    def _tree(self):
+        pids, pending = [], [self.process.pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            try:
+                for task in os.listdir(f'/proc/{pid}/task'):
+                    with open(f'/proc/{pid}/task/{task}/children') as f:
+                        pending.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+        return pids
+
+    def rss_bytes(self):
+        total = 0
+        for pid in self._tree():
+            try:
+                with open(f'/proc/{pid}/statm') as f:
+                    total += int(f.read().split()[1]) * PAGE_SIZE
+            except OSError:
+                continue
+        return total
+
+    def cpu_seconds(self):
+        """User + system time of the server, including reaped job workers"""
+        with open(f'/proc/{self.process.pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        # utime, stime, cutime, cstime
+        return sum(int(value) for value in fields[11:15]) / CLOCK_TICKS
+
+    def start_sampling(self, interval=0.1):
+        self._peak_rss = self.rss_bytes()
+        self._sampling = True
+
+        def sample():
+            while self._sampling:
+                self._peak_rss = max(self._peak_rss, self.rss_bytes())
+                time.sleep(interval)
+
+        self._sampler = threading.Thread(target=sample, daemon=True)
+        self._sampler.start()
+
+    def stop_sampling(self):
+        self._sampling = False
+        self._sampler.join()
+        return self._peak_rss
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def request(host, port, method, path, body=None, connection=None):
+    """Send one request and read the whole response; returns (status, body bytes, headers, connection)"""
+    connection = connection or http.client.HTTPConnection(host, port, timeout=600)
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = connection.getresponse()
+    data = response.read()
+    return response.status, data, response.headers, connection
+
+
+class JobFailed(Exception):
+    pass
+
+
+class Client:
+    """One simulated user; keeps its connections between requests when the servers allow it"""
+
+    def __init__(self, port, seed_key, poll_interval):
+        self.port = port
+        self.seed_key = seed_key
+        self.poll_interval = poll_interval
+        self.connections = {}
+
+    def call(self, method, path, body=None, host='127.0.0.1', port=None):
+        address = (host, port or self.port)
+        try:
+            status, data, headers, self.connections[address] = request(
+                *address, method, path, body, self.connections.get(address)
+            )
+        except (OSError, http.client.HTTPException):
+            connection = self.connections.pop(address, None)
+            if connection is not None:
+                connection.close()
+            raise
+        return status, data, headers
+
+    def api_download(self, space_id):
+        status, data, _ = self.call('POST', '/api/download', {'url': f'https://x.com/i/spaces/{space_id}'})
+        return status, len(data)
+
+    def download_space(self, space_id):
+        status, data, _ = self.call('POST', '/api/download-space', {'url': f'https://x.com/i/spaces/{space_id}'})
+        if status != 202:
+            return status, len(data)
+        job_id = json.loads(data)['job_id']
+        while True:
+            time.sleep(self.poll_interval)
+            status, data, _ = self.call('GET', f'/api/jobs/{job_id}')
+            job = json.loads(data)
+            if job['status'] == 'finished':
+                return 200, len(data)
+            if job['status'] == 'failed':
+                raise JobFailed(job['error'])
+
+    def download_file(self, space_id):
+        status, data, headers = self.call('GET', f'/download/{self.seed_key}')
+        if status == 302:
+            # An object store backend hands out a presigned URL instead of the bytes
+            location = urlsplit(headers['Location'])
+            status, data, _ = self.call('GET', f'{location.path}?{location.query}', host=location.hostname,
+                                        port=location.port)
+        return status, len(data)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_level(server, scenario, concurrency, total, poll_interval):
+    """Run total requests of one scenario from concurrency clients"""
+    run_token = uuid.uuid4().hex[:8]
+    counter = iter(range(total))
+    lock = threading.Lock()
+    latencies, statuses, transferred, errors = [], Counter(), [0], []
+
+    def worker():
+        client = Client(server.port, server.seed_key, poll_interval)
+        call = getattr(client, scenario)
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            # A Space id nobody has asked for yet, so every request takes the uncached path
+            space_id = f'bench{run_token}{index}'
+            started = time.perf_counter()
+            try:
+                status, size = call(space_id)
+            except JobFailed as e:
+                status, size = 'job_failed', 0
+                errors.append(str(e))
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                status, size = f'exception:{type(e).__name__}', 0
+                errors.append(str(e))
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed * 1000)
+                statuses[str(status)] += 1
+                transferred[0] += size
+
+    cpu_before = server.cpu_seconds()
+    server.start_sampling()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    peak_rss = server.stop_sampling()
+    cpu = server.cpu_seconds() - cpu_before
+
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if status in ('200', '202'))
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'ok': ok,
+        'status_codes': dict(statuses),
+        'first_error': errors[0][:300] if errors else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50), 2),
+            'p95': round(percentile(latencies, 0.95), 2),
+            'p99': round(percentile(latencies, 0.99), 2),
+            'max': round(latencies[-1], 2),
+        },
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(ok / wall, 2),
+        'response_bytes_per_second': round(transferred[0] / wall),
+        'server_cpu_seconds': round(cpu, 2),
+        'server_cpu_percent': round(100 * cpu / wall, 1),
+        'server_peak_rss_mb': round(peak_rss / 1024 ** 2, 1),
+    }
+
+
+def compare(results, baseline):
+    """Add p50 latency and throughput ratios against a baseline report, level by level"""
+    for scenario, levels in results.items():
+        previous = {level['concurrency']: level for level in baseline.get('results', {}).get(scenario, [])}
+        for level in levels:
+            before = previous.get(level['concurrency'])
+            if not before:
+                continue
+            level['vs_baseline'] = {
+                'p50_ratio': round(level['latency_ms']['p50'] / before['latency_ms']['p50'], 2)
+                if before['latency_ms']['p50'] else None,
+                'throughput_ratio': round(level['throughput_rps'] / before['throughput_rps'], 2)
+                if before['throughput_rps'] else None,
+            }
+
+
+def release():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--tags', '--always', '--dirty'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', default='1,4,16', help='comma-separated client counts to step through')
+    parser.add_argument('--requests', type=int, default=100, help='requests per level for api_download and download_file')
+    parser.add_argument('--downloads', type=int, default=20, help='requests per level for download_space')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated subset of ' + ', '.join(SCENARIOS))
+    parser.add_argument('--space-duration', type=int, default=600, help='length of each synthetic Space in seconds')
+    parser.add_argument('--segment-seconds', type=int, default=3, help='HLS segment length')
+    parser.add_argument('--bitrate', type=int, default=64, help='synthetic audio bitrate in kbps')
+    parser.add_argument('--server', choices=('flask', 'asgi'), default='flask', help='app.py or asgi.py')
+    parser.add_argument('--storage', choices=('local', 's3'), default='local', help='file store backend')
+    parser.add_argument('--rate-limit', action='store_true', help='keep admission control on (RATE_LIMIT_* apply)')
+    parser.add_argument('--poll-interval', type=float, default=0.05, help='seconds between job status polls')
+    parser.add_argument('--baseline', help='earlier report to compare against')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--seed-bytes', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.server, args.seed_bytes)
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    scenarios = [scenario for scenario in args.scenarios.split(',') if scenario]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    origin = FakeOrigin(args.space_duration, args.segment_seconds, args.bitrate).start()
+    object_store = FakeS3(buckets=[S3_BUCKET]).start() if args.storage == 's3' else None
+    work_dir = tempfile.mkdtemp(prefix='xspace-bench-')
+    seed_bytes = int(args.space_duration * args.bitrate * 1000 / 8)
+    server = ServerProcess(free_port(), args.server, seed_bytes, origin.url, work_dir, args.rate_limit,
+                           object_store.url if object_store else None)
+    try:
+        server.wait_ready()
+        results = {}
+        for scenario in scenarios:
+            total = args.downloads if scenario == 'download_space' else args.requests
+            results[scenario] = [
+                run_level(server, scenario, concurrency, total, args.poll_interval) for concurrency in levels
+            ]
+    finally:
+        server.stop()
+        origin.stop()
+        if object_store:
+            object_store.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'benchmark': 'load',
+        'release': release(),
+        'python': sys.version.split()[0],
+        'server': args.server,
+        'config': {
+            'space_duration_seconds': args.space_duration,
+            'segment_seconds': args.segment_seconds,
+            'bitrate_kbps': args.bitrate,
+            'real_audio': origin.real_audio,
+            'requests_per_level': args.requests,
+            'downloads_per_level': args.downloads,
+            'job_max_workers': int(os.environ.get('JOB_MAX_WORKERS', 2)),
+            'rate_limit': args.rate_limit,
+            'storage': args.storage,
+        },
+        'origin': origin.stats(),
+        'object_store': object_store.stats() if object_store else None,
+        'results': results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+# Job workers are spawned from the server and import this file again as their main module
+if in_worker_process():
+    use_fake_extractor()
+
+if __name__ == '__main__':
+    main()
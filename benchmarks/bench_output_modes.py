@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark the m4a remux path against the mp3 transcode path
+Generates a synthetic AAC recording shaped like a Space (mono 64 kbps AAC in
+MPEG-TS), runs the ffmpeg arguments each output format uses in production,
+and reports wall time and CPU time per path.
+
+Usage: python benchmarks/bench_output_modes.py --duration 3600 --runs 3
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import OUTPUT_FORMATS
+
+
+def make_source(path, duration):
+    """Create a Space-like AAC source file of the given length in seconds"""
+    subprocess.run([
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={duration}',
+        '-ac', '1', '-c:a', 'aac', '-b:a', '64k', '-f', 'mpegts', path
+    ], check=True)
+
+
+def run_once(source, output_args, output_path):
+    """Run one conversion; returns (wall seconds, child CPU seconds)"""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    subprocess.run(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', source, '-vn'] + output_args + [output_path],
+        check=True
+    )
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=int, default=1800, help='length of the synthetic recording in seconds')
+    parser.add_argument('--runs', type=int, default=3, help='repetitions per path')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    paths = {
+        'm4a (remux)': OUTPUT_FORMATS['m4a']['remux_args'] + OUTPUT_FORMATS['m4a']['file_args'],
+        'mp3 (transcode)': OUTPUT_FORMATS['mp3']['transcode_args'] + OUTPUT_FORMATS['mp3']['file_args'],
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        source = os.path.join(work_dir, 'source.ts')
+        make_source(source, args.duration)
+
+        results = {}
+        for name, output_args in paths.items():
+            walls, cpus = [], []
+            for _ in range(args.runs):
+                wall, cpu = run_once(source, output_args, os.path.join(work_dir, 'out'))
+                walls.append(wall)
+                cpus.append(cpu)
+            results[name] = {
+                'wall_seconds_median': round(statistics.median(walls), 3),
+                'cpu_seconds_median': round(statistics.median(cpus), 3),
+                'output_bytes': os.path.getsize(os.path.join(work_dir, 'out')),
+            }
+
+    report = {
+        'benchmark': 'output_modes',
+        'source_duration_seconds': args.duration,
+        'runs': args.runs,
+        'results': results,
+    }
+    remux, transcode = results['m4a (remux)'], results['mp3 (transcode)']
+    if remux['cpu_seconds_median']:
+        report['cpu_speedup'] = round(transcode['cpu_seconds_median'] / remux['cpu_seconds_median'], 1)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-request yt-dlp overhead: a fresh YoutubeDL per call against the pool
+Serves a small HLS playlist from a local keep-alive HTTP server and resolves it
+with extract_info, once building a new YoutubeDL for every call (the old
+behaviour) and once borrowing a pooled instance. Reports latency per call.
+
+Usage: python benchmarks/bench_ydl_pool.py --requests 200
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import yt_dlp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ydl_pool import YDLPool
+
+PLAYLIST = '#EXTM3U\n#EXT-X-TARGETDURATION:4\n' + ''.join(
+    f'#EXTINF:4.0,\nsegment{i}.aac\n' for i in range(30)
+) + '#EXT-X-ENDLIST\n'
+
+OPTS = {'quiet': True, 'no_warnings': True}
+
+
+class PlaylistHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+
+    def do_GET(self):
+        PlaylistHandler.connections.add(self.client_address)
+        body = PLAYLIST.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.apple.mpegurl')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Fresh YoutubeDL instances drop their connections on close; that is expected here
+        pass
+
+
+def measure(call, requests):
+    """Run call requests times; returns per-call latencies in milliseconds"""
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies, connections):
+    first = latencies[0]
+    latencies = sorted(latencies)
+    return {
+        'first_ms': round(first, 2),
+        'median_ms': round(statistics.median(latencies), 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        'total_seconds': round(sum(latencies) / 1000, 3),
+        'tcp_connections': connections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='extract_info calls per mode')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    server = QuietServer(('127.0.0.1', 0), PlaylistHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/media.m3u8'
+
+    def fresh():
+        with yt_dlp.YoutubeDL(dict(OPTS)) as ydl:
+            ydl.extract_info(url, download=False)
+
+    pool = YDLPool(profiles={'metadata': OPTS})
+
+    def pooled():
+        with pool.acquire('metadata') as ydl:
+            ydl.extract_info(url, download=False)
+
+    results = {}
+    for name, call in (('fresh', fresh), ('pooled', pooled)):
+        PlaylistHandler.connections.clear()
+        latencies = measure(call, args.requests)
+        results[name] = summarize(latencies, len(PlaylistHandler.connections))
+
+    pool.close()
+    server.shutdown()
+
+    report = {
+        'benchmark': 'ydl_pool',
+        'requests': args.requests,
+        'results': results,
+        'pool': pool.stats(),
+    }
+    if results['pooled']['median_ms']:
+        report['median_speedup'] = round(results['fresh']['median_ms'] / results['pooled']['median_ms'], 1)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
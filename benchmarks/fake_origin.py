@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Twitter Space origin, for offline benchmarks
+FakeOrigin serves synthetic Space metadata and an ended HLS recording of
+configurable length from a local HTTP server. FakeSpacesIE is a yt-dlp
+extractor for twitter.com/i/spaces/<id> URLs that resolves them against that
+server (found through BENCH_ORIGIN) instead of Twitter, so yt-dlp, the segment
+fetcher and ffmpeg all run as they do in production.
+
+Segments are real AAC (ADTS) audio when ffmpeg is available to make one, and
+filler bytes otherwise.
+"""
+
+import os
+import re
+import json
+import shutil
+import subprocess
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from yt_dlp.extractor.common import InfoExtractor
+
+ORIGIN_ENV = 'BENCH_ORIGIN'
+
+
+def make_segment(seconds, bitrate):
+    """Return one segment of mono AAC audio, or filler of the same size without ffmpeg"""
+    size = int(seconds * bitrate * 1000 / 8)
+    if not shutil.which('ffmpeg'):
+        return b'\0' * size, False
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'segment.aac')
+        subprocess.run([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={seconds}',
+            '-ac', '1', '-c:a', 'aac', '-b:a', f'{bitrate}k', '-f', 'adts', path
+        ], check=True)
+        with open(path, 'rb') as f:
+            return f.read(), True
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        origin = self.server.origin
+        match = re.fullmatch(r'/spaces/(\w+)(?:\.json|/playlist\.m3u8|/(\d+)\.aac)', self.path)
+        if not match:
+            return self.reply(404, b'not found', 'text/plain')
+
+        space_id, segment = match.group(1), match.group(2)
+        if self.path.endswith('.json'):
+            body = json.dumps({
+                'id': space_id,
+                'title': f'Benchmark Space {space_id}',
+                'uploader': 'bench',
+                'duration': origin.segments * origin.segment_seconds,
+                'bitrate': origin.bitrate,
+                'playlist': f'{origin.url}/spaces/{space_id}/playlist.m3u8',
+            }).encode()
+            self.reply(200, body, 'application/json')
+        elif self.path.endswith('.m3u8'):
+            self.reply(200, origin.playlist.encode(), 'application/vnd.apple.mpegurl')
+        elif int(segment) < origin.segments:
+            self.reply(200, origin.segment, 'audio/aac')
+        else:
+            self.reply(404, b'not found', 'text/plain')
+
+    def reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.origin.lock:
+            self.server.origin.requests += 1
+            self.server.origin.bytes_sent += len(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that drop keep-alive connections are expected
+        pass
+
+
+class FakeOrigin:
+    """Serves every Space id as an ended recording of duration seconds"""
+
+    def __init__(self, duration=600, segment_seconds=3, bitrate=64, host='127.0.0.1', port=0):
+        self.segment_seconds = segment_seconds
+        self.segments = max(1, int(duration // segment_seconds))
+        self.bitrate = bitrate
+        self.segment, self.real_audio = make_segment(segment_seconds, bitrate)
+        self.playlist = f'#EXTM3U\n#EXT-X-TARGETDURATION:{segment_seconds}\n' + ''.join(
+            f'#EXTINF:{segment_seconds:.1f},\n{i}.aac\n' for i in range(self.segments)
+        ) + '#EXT-X-ENDLIST\n'
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.server = QuietServer((host, port), OriginHandler)
+        self.server.origin = self
+        self.url = f'http://{host}:{self.server.server_port}'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'bytes_sent': self.bytes_sent}
+
+
+class FakeSpacesIE(InfoExtractor):
+    """Resolves Space URLs against the FakeOrigin named by BENCH_ORIGIN"""
+
+    IE_NAME = 'bench:spaces'
+    _VALID_URL = r'https?://(?:(?:www|mobile)\.)?(?:twitter|x)\.com/i/spaces/(?P<id>[0-9a-zA-Z]+)'
+
+    def _real_extract(self, url):
+        space_id = self._match_id(url)
+        data = self._download_json(f'{os.environ[ORIGIN_ENV]}/spaces/{space_id}.json', space_id)
+        return {
+            'id': space_id,
+            'title': data['title'],
+            'uploader': data['uploader'],
+            'duration': data['duration'],
+            'live_status': 'was_live',
+            'formats': [{
+                'format_id': 'hls',
+                'url': data['playlist'],
+                'ext': 'aac',
+                'protocol': 'm3u8_native',
+                'acodec': 'aac',
+                'vcodec': 'none',
+                'abr': data['bitrate'],
+            }],
+        }
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for an S3-compatible object store, for offline benchmarks
+FakeS3 keeps objects in memory and speaks the part of the S3 API the
+S3FileStore uses, path-style like a default MinIO setup: PUT/GET/HEAD/DELETE
+of objects (GET with Range and the response-* overrides of presigned URLs),
+ListObjectsV2, and multipart uploads. Signatures are not checked.
+"""
+
+import re
+import time
+import uuid
+import hashlib
+import threading
+from collections import Counter
+from email.utils import formatdate
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.sax.saxutils import escape
+from http.server import BaseHTTPRequestHandler
+
+from fake_origin import QuietServer
+
+XMLNS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+def decode_aws_chunked(data):
+    """Strip the chunk framing of a streaming (aws-chunked) upload body"""
+    body, pos = bytearray(), 0
+    while True:
+        end = data.index(b'\r\n', pos)
+        size = int(data[pos:end].split(b';')[0], 16)
+        pos = end + 2
+        if size == 0:
+            return bytes(body)
+        body += data[pos:pos + size]
+        pos += size + 2
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def parse(self):
+        url = urlsplit(self.path)
+        bucket, _, key = unquote(url.path).lstrip('/').partition('/')
+        return bucket, key, parse_qs(url.query, keep_blank_values=True)
+
+    def read_body(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if 'aws-chunked' in self.headers.get('Content-Encoding', '') or \
+                self.headers.get('x-amz-content-sha256', '').startswith('STREAMING-'):
+            data = decode_aws_chunked(data)
+        self.server.store.count('bytes_received', len(data))
+        return data
+
+    def do_PUT(self):
+        store = self.server.store
+        bucket, key, query = self.parse()
+        body = self.read_body()
+        if not key:
+            store.create_bucket(bucket)
+            return self.reply(200)
+        if bucket not in store.buckets:
+            return self.error(404, 'NoSuchBucket')
+        if 'uploadId' in query:
+            upload = store.uploads.get(query['uploadId'][0])
+            if upload is None:
+                return self.error(404, 'NoSuchUpload')
+            upload['parts'][int(query['partNumber'][0])] = body
+            store.count('upload_part')
+            return self.reply(200, headers={'ETag': f'"{hashlib.md5(body).hexdigest()}"'})
+        etag = store.put(bucket, key, body, self.headers.get('Content-Type', 'binary/octet-stream'))
+        store.count('put_object')
+        self.reply(200, headers={'ETag': etag})
+
+    def do_POST(self):
+        store = self.server.store
+        bucket, key, query = self.parse()
+        body = self.read_body()
+        if bucket not in store.buckets:
+            return self.error(404, 'NoSuchBucket')
+        if 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            store.uploads[upload_id] = {
+                'bucket': bucket, 'key': key, 'parts': {},
+                'content_type': self.headers.get('Content-Type', 'binary/octet-stream'),
+            }
+            store.count('create_multipart_upload')
+            return self.xml(200, 'InitiateMultipartUploadResult',
+                            f'<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>')
+        if 'uploadId' in query:
+            upload = store.uploads.pop(query['uploadId'][0], None)
+            if upload is None:
+                return self.error(404, 'NoSuchUpload')
+            numbers = [int(n) for n in re.findall(rb'<PartNumber>(\d+)</PartNumber>', body)]
+            etag = store.put(bucket, key, b''.join(upload['parts'][n] for n in numbers), upload['content_type'],
+                             parts=len(numbers))
+            store.count('complete_multipart_upload')
+            return self.xml(200, 'CompleteMultipartUploadResult',
+                            f'<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><ETag>{escape(etag)}</ETag>')
+        self.error(400, 'InvalidRequest')
+
+    def do_DELETE(self):
+        store = self.server.store
+        bucket, key, query = self.parse()
+        if 'uploadId' in query:
+            store.uploads.pop(query['uploadId'][0], None)
+            store.count('abort_multipart_upload')
+        else:
+            store.objects.pop((bucket, key), None)
+            store.count('delete_object')
+        self.reply(204)
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        store = self.server.store
+        bucket, key, query = self.parse()
+        if bucket not in store.buckets:
+            return self.error(404, 'NoSuchBucket')
+        if not key:
+            return self.list_objects(bucket, query)
+
+        obj = store.objects.get((bucket, key))
+        if obj is None:
+            return self.error(404, 'NoSuchKey', head)
+        body, content_type, etag, modified = obj
+        headers = {
+            'ETag': etag,
+            'Last-Modified': formatdate(modified, usegmt=True),
+            'Accept-Ranges': 'bytes',
+            # Presigned URLs can override these headers
+            'Content-Type': query.get('response-content-type', [content_type])[0],
+        }
+        if 'response-content-disposition' in query:
+            headers['Content-Disposition'] = query['response-content-disposition'][0]
+        if self.headers.get('If-None-Match') == etag:
+            return self.reply(304, headers=headers)
+
+        status = 200
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if match and body:
+            start, end = match.groups()
+            if start:
+                start, end = int(start), min(int(end) if end else len(body) - 1, len(body) - 1)
+            else:
+                start, end = max(0, len(body) - int(end)), len(body) - 1
+            if start >= len(body):
+                return self.error(416, 'InvalidRange', head)
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(body)}'
+            body, status = body[start:end + 1], 206
+        store.count('get_object')
+        self.reply(status, b'' if head else body, headers, length=len(body))
+
+    def list_objects(self, bucket, query):
+        store = self.server.store
+        prefix = query.get('prefix', [''])[0]
+        after = query.get('continuation-token', query.get('start-after', ['']))[0]
+        max_keys = int(query.get('max-keys', ['1000'])[0])
+        keys = sorted(key for b, key in list(store.objects) if b == bucket and key.startswith(prefix) and key > after)
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+
+        contents = []
+        for key in page:
+            obj = store.objects.get((bucket, key))
+            if obj is None:
+                continue
+            modified = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(obj[3]))
+            contents.append(
+                f'<Contents><Key>{escape(key)}</Key><LastModified>{modified}</LastModified>'
+                f'<ETag>{escape(obj[2])}</ETag><Size>{len(obj[0])}</Size><StorageClass>STANDARD</StorageClass></Contents>'
+            )
+        store.count('list_objects')
+        self.xml(200, 'ListBucketResult', (
+            f'<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(contents)}</KeyCount>'
+            f'<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{str(truncated).lower()}</IsTruncated>'
+            + (f'<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>' if truncated else '')
+            + ''.join(contents)
+        ))
+
+    def xml(self, status, root, inner):
+        body = f'<?xml version="1.0" encoding="UTF-8"?>\n<{root} xmlns="{XMLNS}">{inner}</{root}>'.encode()
+        self.reply(status, body, {'Content-Type': 'application/xml'})
+
+    def error(self, status, code, head=False):
+        body = f'<?xml version="1.0" encoding="UTF-8"?>\n<Error><Code>{code}</Code><Message>{code}</Message></Error>'
+        self.reply(status, b'' if head else body.encode(), {'Content-Type': 'application/xml'}, length=len(body))
+
+    def reply(self, status, body=b'', headers=None, length=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status not in (204, 304):
+            self.send_header('Content-Length', str(len(body) if length is None else length))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.store.count('bytes_sent', len(body))
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeS3:
+    """An in-memory object store; buckets must exist before objects are written to them"""
+
+    def __init__(self, buckets=(), host='127.0.0.1', port=0):
+        self.buckets = set(buckets)
+        self.objects = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.server = QuietServer((host, port), S3Handler)
+        self.server.store = self
+        self.url = f'http://{host}:{self.server.server_port}'
+
+    def create_bucket(self, bucket):
+        self.buckets.add(bucket)
+
+    def put(self, bucket, key, body, content_type, parts=0):
+        digest = hashlib.md5(body).hexdigest()
+        # Like S3, multipart objects get an ETag of the form <hash>-<part count>
+        etag = f'"{digest}-{parts}"' if parts else f'"{digest}"'
+        self.objects[(bucket, key)] = (body, content_type, etag, time.time())
+        return etag
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['objects'] = len(self.objects)
+        stats['stored_bytes'] = sum(len(obj[0]) for obj in list(self.objects.values()))
+        return stats
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Disk-quota management for DOWNLOAD_DIR
+Keeps the file store under a byte budget by evicting the least recently (LRU)
+or least frequently (LFU) served files, and removes leftovers of crashed
+downloads.
+"""
+
+import os
+import shutil
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Extensions yt-dlp and FFmpeg leave behind when a download dies half-way
+PARTIAL_EXTENSIONS = ('.part', '.ytdl', '.temp', '.m4a', '.webm', '.mp4', '.mp3')
+
+
+class CacheManager:
+    """Enforces a byte budget on the file store and sweeps orphaned files"""
+
+    def __init__(self, store, download_dir, max_bytes, policy='lru', sweep_interval=300, orphan_age=3600,
+                 partial_dir=None):
+        if policy not in ('lru', 'lfu'):
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.store = store
+        self.download_dir = download_dir
+        self.partial_dir = partial_dir
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.sweep_interval = sweep_interval
+        self.orphan_age = orphan_age
+
+        self._evict_lock = threading.Lock()
+        self._thread = None
+
+    def record_served(self, key):
+        """Note that a file was served so eviction can favour popular files"""
+        try:
+            self.store.touch(key)
+        except OSError as e:
+            logger.warning(f"Could not record access to {key}: {str(e)}")
+
+    def usage(self):
+        """Return the number of bytes held by the store, according to its index"""
+        return self.store.usage()[0]
+
+    def _eviction_order(self, entries):
+        def last_used(entry):
+            return entry.get('last_served') or entry.get('created_at', 0)
+
+        if self.policy == 'lfu':
+            return sorted(entries, key=lambda e: (e.get('serve_count', 0), last_used(e)))
+        return sorted(entries, key=last_used)
+
+    def enforce(self, reserve_bytes=0):
+        """Evict files until the store plus reserve_bytes fits the budget; returns bytes freed"""
+        with self._evict_lock:
+            # The store's total is cheap; listing every entry is only needed to choose what to evict
+            if self.store.usage()[0] + reserve_bytes <= self.max_bytes:
+                return 0
+            # Eviction order depends on serve statistics that may still be buffered
+            self.store.flush_touches()
+            entries = self.store.entries()
+            used = sum(entry.get('size', 0) for entry in entries)
+            freed = 0
+            for entry in self._eviction_order(entries):
+                if used - freed + reserve_bytes <= self.max_bytes:
+                    break
+                self.store.remove(entry['key'])
+                freed += entry.get('size', 0)
+                logger.info(f"Evicted {entry['key']} ({entry.get('size', 0)} bytes, policy={self.policy})")
+
+            if used - freed + reserve_bytes > self.max_bytes:
+                logger.warning(f"Cache budget exceeded even after eviction: "
+                               f"{used - freed} used + {reserve_bytes} reserved > {self.max_bytes}")
+            return freed
+
+    def clean_orphans(self):
+        """Remove staging directories, partial files and unindexed objects left by crashed downloads
+
+        Partial downloads are kept for orphan_age so a restarted job can resume them.
+        """
+        cutoff = time.time() - self.orphan_age
+        removed = 0
+
+        for name in os.listdir(self.download_dir):
+            path = os.path.join(self.download_dir, name)
+            if name.startswith('.staging-') and os.path.isdir(path):
+                if self._newest_mtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+            elif name.endswith(PARTIAL_EXTENSIONS) and os.path.isfile(path):
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+
+        # Resumable downloads nobody came back for
+        if self.partial_dir and os.path.isdir(self.partial_dir):
+            for name in os.listdir(self.partial_dir):
+                path = os.path.join(self.partial_dir, name)
+                if os.path.isdir(path) and self._newest_mtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+
+        # Only a local store keeps its objects in DOWNLOAD_DIR
+        if self.store.objects_dir:
+            indexed = {entry['key'] for entry in self.store.entries()}
+            for name in os.listdir(self.store.objects_dir):
+                path = os.path.join(self.store.objects_dir, name)
+                if name not in indexed and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+
+        if removed:
+            logger.info(f"Removed {removed} orphaned download files")
+        return removed
+
+    def _newest_mtime(self, directory):
+        """Return the latest mtime inside directory; partial files keep growing while a download is alive"""
+        newest = os.path.getmtime(directory)
+        for root, _, files in os.walk(directory):
+            for name in files:
+                try:
+                    newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+                except FileNotFoundError:
+                    pass
+        return newest
+
+    def sweep(self):
+        """Run one eviction and orphan-cleanup pass"""
+        try:
+            self.clean_orphans()
+            self.enforce()
+        except Exception as e:
+            logger.error(f"Cache sweep failed: {str(e)}")
+
+    def start(self):
+        """Start the periodic background sweep"""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                self.sweep()
+                time.sleep(self.sweep_interval)
+
+        self._thread = threading.Thread(target=loop, name='cache-sweeper', daemon=True)
+        self._thread.start()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Work sharding across app nodes by Space id
+Nodes form a consistent-hash ring over canonical Space ids, so each Space has
+one owning node that downloads and stores it. Other nodes forward or redirect
+requests for it there. A node joining or leaving only moves the Spaces on its
+own arcs of the ring; every other Space keeps its owner and its cached file.
+"""
+
+import os
+import time
+import bisect
+import hashlib
+import hmac
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Set on requests a node forwards, so the owner serves them instead of routing again
+FORWARDED_HEADER = 'X-Cluster-Forwarded'
+# The forwarding node's view of the client, trusted only alongside the shared secret
+CLIENT_HEADER = 'X-Cluster-Client'
+TOKEN_HEADER = 'X-Cluster-Token'
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+def node_id(node):
+    """Short stable id of a node URL, used to prefix the ids of jobs it runs"""
+    return hashlib.sha1(node.encode()).hexdigest()[:8]
+
+
+class HashRing:
+    """Consistent hashing with virtual nodes, which spread each node's share evenly over the ring"""
+
+    def __init__(self, nodes=(), vnodes=160):
+        self.vnodes = vnodes
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        keep = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in keep]
+        self._owners = [owner for _, owner in keep]
+
+    def owner(self, key):
+        """Return the node owning key: the first virtual node clockwise of its hash"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[index]
+
+    def nodes(self):
+        return sorted(set(self._owners))
+
+
+class Cluster:
+    """Ring membership of this node and its peers, with unreachable peers taken out until they answer again
+
+    Peers come from a fixed list, or from nodes_file (one base URL per line),
+    which is re-read when it changes so nodes can join and leave without a
+    restart. With no peers the cluster is disabled and every request is local.
+    """
+
+    def __init__(self, self_url='', nodes=(), nodes_file=None, vnodes=160, mode='forward', secret='',
+                 probe_interval=10, timeout=5):
+        if mode not in ('forward', 'redirect'):
+            raise ValueError(f"Unknown cluster mode: {mode}")
+        self.self_url = self_url.rstrip('/')
+        self.nodes_file = nodes_file
+        self.vnodes = vnodes
+        self.mode = mode
+        self.secret = secret
+        self.probe_interval = probe_interval
+        self.timeout = timeout
+
+        self._members = set()
+        self._down = set()
+        self._nodes_file_mtime = None
+        self._ring = HashRing(vnodes=vnodes)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._set_members(nodes)
+        self._reload_nodes_file()
+
+    @property
+    def enabled(self):
+        return bool(self.self_url) and len(self._members) > 1
+
+    @property
+    def job_prefix(self):
+        """Prefix of job ids created here, so any node can tell where a job runs"""
+        return f"{node_id(self.self_url)}-" if self.self_url else ''
+
+    def _set_members(self, nodes):
+        members = {node.strip().rstrip('/') for node in nodes if node.strip()}
+        if self.self_url:
+            members.add(self.self_url)
+        with self._lock:
+            if members == self._members:
+                return
+            joined, left = members - self._members, self._members - members
+            self._members = members
+            self._down &= members
+            self._rebuild()
+        logger.info(f"Cluster membership changed: joined={sorted(joined)} left={sorted(left)}")
+
+    def _rebuild(self):
+        """Rebuild the ring from the live members; caller holds self._lock"""
+        self._ring = HashRing(sorted(self._members - self._down), self.vnodes)
+
+    def _reload_nodes_file(self):
+        if not self.nodes_file:
+            return
+        try:
+            mtime = os.stat(self.nodes_file).st_mtime_ns
+            if mtime == self._nodes_file_mtime:
+                return
+            with open(self.nodes_file, encoding='utf-8') as f:
+                nodes = [line.split('#', 1)[0] for line in f]
+        except OSError as e:
+            logger.error(f"Could not read cluster nodes file: {str(e)}")
+            return
+        self._nodes_file_mtime = mtime
+        self._set_members(nodes)
+
+    def owner(self, space_id):
+        """Return the base URL of the node that owns space_id"""
+        with self._lock:
+            return self._ring.owner(space_id)
+
+    def remote_owner(self, space_id):
+        """Return the owner of space_id if it is another node, else None"""
+        if not self.enabled or not space_id:
+            return None
+        owner = self.owner(space_id)
+        return owner if owner != self.self_url else None
+
+    def job_node(self, job_id):
+        """Return the base URL of the other node running job_id, else None"""
+        if not self.enabled or '-' not in job_id:
+            return None
+        prefix = job_id.split('-', 1)[0]
+        with self._lock:
+            members = list(self._members)
+        for node in members:
+            if node != self.self_url and node_id(node) == prefix:
+                return node
+        return None
+
+    def is_forwarded(self, headers):
+        """Whether a peer forwarded the request; the header only counts alongside the shared secret"""
+        if FORWARDED_HEADER not in headers:
+            return False
+        token = headers.get(TOKEN_HEADER)
+        return bool(self.secret and token and hmac.compare_digest(token.encode(), self.secret.encode()))
+
+    def forwarded_client(self, headers):
+        """Return the client a peer forwarded the request for, or None unless it proved the shared secret"""
+        if not self.is_forwarded(headers):
+            return None
+        return headers.get(CLIENT_HEADER) or None
+
+    def forward_headers(self, client=None):
+        """Headers that mark a request as forwarded by this node"""
+        headers = {FORWARDED_HEADER: self.self_url}
+        if self.secret:
+            headers[TOKEN_HEADER] = self.secret
+            if client:
+                headers[CLIENT_HEADER] = client
+        return headers
+
+    def mark_down(self, node):
+        """Take an unreachable node out of the ring until a probe finds it again"""
+        with self._lock:
+            if node not in self._members or node in self._down or node == self.self_url:
+                return
+            self._down.add(node)
+            self._rebuild()
+        logger.warning(f"Cluster node {node} is unreachable; its Spaces move to other nodes")
+
+    def _mark_up(self, node):
+        with self._lock:
+            if node not in self._down:
+                return
+            self._down.discard(node)
+            self._rebuild()
+        logger.info(f"Cluster node {node} is reachable again")
+
+    def probe(self):
+        """Check every peer once; any HTTP answer, healthy or not, counts as reachable"""
+        import requests
+
+        self._reload_nodes_file()
+        with self._lock:
+            peers = [node for node in self._members if node != self.self_url]
+        for node in peers:
+            try:
+                requests.get(f"{node}/api/health", timeout=self.timeout, headers=self.forward_headers())
+            except requests.RequestException:
+                self.mark_down(node)
+            else:
+                self._mark_up(node)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'node': self.self_url,
+                'mode': self.mode,
+                'members': sorted(self._members),
+                'down': sorted(self._down),
+            }
+
+    def start(self):
+        """Start probing peers in the background"""
+        if self._thread is not None or not (self.self_url and (self._members - {self.self_url} or self.nodes_file)):
+            return
+
+        def loop():
+            while True:
+                # Peers count as up until a probe or a forward fails, so nodes starting together do not drop each other
+                time.sleep(self.probe_interval)
+                try:
+                    self.probe()
+                except Exception as e:
+                    logger.error(f"Cluster probe failed: {str(e)}")
+
+        self._thread = threading.Thread(target=loop, name='cluster-probe', daemon=True)
+        self._thread.start()
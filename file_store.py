@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store for downloaded Space audio
+Files are stored under a key derived from the Space id and output format, and
+a small JSON index keeps their metadata so cache hits never touch yt-dlp or
+the audio file itself.
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: index updates are only serialised within the process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def seconds_label(seconds):
+    """Seconds to millisecond precision without trailing zeros, e.g. 90.5 -> '90.5'"""
+    return f"{seconds:.3f}".rstrip('0').rstrip('.')
+
+
+class FileStore:
+    """Audio files keyed by Space id and format, with a shared metadata index"""
+
+    def __init__(self, root, touch_interval=30):
+        self.root = root
+        # Serves are counted in memory and written to the index at most this often
+        self.touch_interval = touch_interval
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_path = os.path.join(root, 'index.json')
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._index = {}
+        self._index_version = None
+        self._lock = threading.Lock()
+
+        self._touches = {}
+        self._touches_flushed = time.time()
+        self._touch_lock = threading.Lock()
+
+    def storage_key(self, space_id, fmt, clip=None):
+        """Return the storage key for a Space rendered in the given format, or for a (start, end) clip of it"""
+        safe_id = re.sub(r'[^A-Za-z0-9_-]', '', str(space_id))
+        if not safe_id:
+            raise ValueError("Invalid Space id")
+        if clip:
+            # Clips are kept apart from the full file and from each other; the Space id stays first
+            return f"{safe_id}.{seconds_label(clip[0])}-{seconds_label(clip[1])}.{fmt}"
+        return f"{safe_id}.{fmt}"
+
+    def path_for(self, key):
+        return os.path.join(self.objects_dir, os.path.basename(key))
+
+    def get(self, key):
+        """Return the index entry for a storage key, or None"""
+        with self._lock:
+            self._reload_index()
+            entry = self._index.get(key)
+            return dict(entry) if entry else None
+
+    def lookup(self, space_id, fmt, clip=None):
+        """Return the index entry for a Space (or a clip of it) in the given format, or None"""
+        return self.get(self.storage_key(space_id, fmt, clip))
+
+    def entries(self):
+        """Return a snapshot of every index entry"""
+        with self._lock:
+            self._reload_index()
+            return [dict(entry) for entry in self._index.values()]
+
+    def commit(self, space_id, fmt, staged_path, metadata, clip=None):
+        """Move a finished file into the store and record it in the index"""
+        key = self.storage_key(space_id, fmt, clip)
+        size = os.path.getsize(staged_path)
+        os.replace(staged_path, self.path_for(key))
+
+        entry = self.new_entry(key, space_id, fmt, size, metadata, clip)
+        with self._locked_index() as index:
+            index[key] = entry
+        logger.info(f"Stored {key} ({size} bytes)")
+        return dict(entry)
+
+    def new_entry(self, key, space_id, fmt, size, metadata, clip=None):
+        """Return the index entry for a file that is being committed"""
+        entry = dict(metadata)
+        entry.update({
+            'key': key,
+            'space_id': space_id,
+            'format': fmt,
+            'size': size,
+            'created_at': time.time(),
+        })
+        if clip:
+            entry['clip'] = {'start': clip[0], 'end': clip[1]}
+        entry['etag'] = self.etag(entry)
+        return entry
+
+    def usage(self):
+        """Return the bytes and the number of files held by the store"""
+        entries = self.entries()
+        return sum(entry.get('size', 0) for entry in entries), len(entries)
+
+    def redirect_url(self, entry):
+        """Return a URL clients can fetch a stored file from directly, or None to serve it from here"""
+        return None
+
+    def etag(self, entry):
+        """Return the entity tag of a stored file, derived from its index entry rather than its bytes"""
+        if entry.get('etag'):
+            return entry['etag']
+        # A re-download of the same key gets a new created_at, hence a new tag
+        token = f"{entry['key']}:{entry['size']}:{entry['created_at']}"
+        return hashlib.sha1(token.encode()).hexdigest()[:20]
+
+    def touch(self, key):
+        """Record that a stored file has just been served; the index is updated by flush_touches"""
+        now = time.time()
+        with self._touch_lock:
+            count = self._touches.get(key, (0, 0))[1]
+            self._touches[key] = (now, count + 1)
+            due = now - self._touches_flushed >= self.touch_interval
+        if due:
+            self.flush_touches()
+
+    def flush_touches(self):
+        """Write the serves counted since the last flush to the index in one update"""
+        with self._touch_lock:
+            touches, self._touches = self._touches, {}
+            self._touches_flushed = time.time()
+        if not touches:
+            return
+        with self._locked_index() as index:
+            for key, (last_served, count) in touches.items():
+                entry = index.get(key)
+                if entry is not None:
+                    entry['last_served'] = max(last_served, entry.get('last_served', 0))
+                    entry['serve_count'] = entry.get('serve_count', 0) + count
+
+    def remove(self, key):
+        """Delete a stored file and its index entry"""
+        with self._locked_index() as index:
+            index.pop(key, None)
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+    def _reload_index(self):
+        """Re-read the index if another process has replaced it; caller holds self._lock"""
+        try:
+            # The index is always replaced, never rewritten, so a new inode means new content
+            stat = os.stat(self.index_path)
+            version = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            self._index, self._index_version = {}, None
+            return
+        if version == self._index_version:
+            return
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                self._index = json.load(f)
+            self._index_version = version
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read store index: {str(e)}")
+
+    @contextmanager
+    def _locked_index(self):
+        """Read-modify-write the index under an exclusive cross-process lock"""
+        with self._lock:
+            fd = os.open(self.index_path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                self._index_version = None
+                self._reload_index()
+                index = dict(self._index)
+                yield index
+
+                # Write-then-rename so readers never see a partial index
+                tmp_fd, tmp_path = tempfile.mkstemp(prefix='.index-', dir=self.root)
+                with os.fdopen(tmp_fd, 'w', encoding='utf-8') as f:
+                    json.dump(index, f)
+                os.replace(tmp_path, self.index_path)
+                self._index = index
+                stat = os.stat(self.index_path)
+                self._index_version = (stat.st_ino, stat.st_mtime_ns)
+            finally:
+                os.close(fd)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+HLS segment fetcher for Space recordings
+A recording is a long media playlist of small AAC segments. Segments are
+fetched concurrently over a pooled keep-alive session, retried with
+exponential backoff, and written to the output strictly in playlist order.
+Live playlists can be followed as they grow until the Space ends.
+"""
+
+import os
+import json
+import time
+import random
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+Segment = namedtuple('Segment', ['index', 'sequence', 'url', 'duration', 'start'])
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class HLSError(Exception):
+    """Raised when a playlist cannot be parsed or a segment cannot be fetched"""
+
+
+def parse_playlist(text, base_url):
+    """Parse an M3U8 playlist into variants (master playlist) or segments (media playlist)"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines or lines[0] != '#EXTM3U':
+        raise HLSError("Not an M3U8 playlist")
+
+    playlist = {
+        'variants': [],
+        'segments': [],
+        'init_url': None,
+        'media_sequence': 0,
+        'target_duration': None,
+        'ended': False,
+    }
+    pending_duration = None
+    pending_bandwidth = None
+    start = 0.0
+
+    for line in lines[1:]:
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            match = [p for p in line.split(':', 1)[1].split(',') if p.startswith('BANDWIDTH=')]
+            pending_bandwidth = int(match[0].split('=', 1)[1]) if match else 0
+        elif line.startswith('#EXTINF:'):
+            pending_duration = float(line.split(':', 1)[1].split(',', 1)[0] or 0)
+        elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            playlist['media_sequence'] = int(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            playlist['target_duration'] = float(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-ENDLIST'):
+            playlist['ended'] = True
+        elif line.startswith('#EXT-X-MAP:'):
+            uri = line.split('URI="', 1)[1].split('"', 1)[0]
+            playlist['init_url'] = urljoin(base_url, uri)
+        elif line.startswith('#EXT-X-KEY:') and 'METHOD=NONE' not in line:
+            raise HLSError("Encrypted HLS streams are not supported")
+        elif not line.startswith('#'):
+            if pending_bandwidth is not None:
+                playlist['variants'].append((pending_bandwidth, urljoin(base_url, line)))
+                pending_bandwidth = None
+            else:
+                index = len(playlist['segments'])
+                duration = pending_duration or 0.0
+                playlist['segments'].append(Segment(
+                    index, playlist['media_sequence'] + index, urljoin(base_url, line), duration, start
+                ))
+                start += duration
+                pending_duration = None
+
+    return playlist
+
+
+def covering_segments(segments, start, end):
+    """Return the segments that hold any audio between start and end seconds into the recording"""
+    return [segment for segment in segments if segment.start < end and segment.start + segment.duration > start]
+
+
+class SegmentFetcher:
+    """Downloads HLS segments concurrently through one pooled HTTP session"""
+
+    def __init__(self, concurrency=8, retries=5, backoff=0.5, timeout=30, headers=None):
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        # One keep-alive connection per worker; retries are handled per segment below
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.concurrency, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get(self, url):
+        """GET a URL, retrying transient failures with exponential backoff and jitter"""
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                if response.status_code not in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                    return response.content
+                error = f"HTTP {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+            except requests.HTTPError as e:
+                raise HLSError(f"Failed to fetch {url}: {str(e)}")
+
+            if attempt < self.retries:
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"Retrying {url} in {delay:.1f}s ({error})")
+                time.sleep(delay)
+
+        raise HLSError(f"Failed to fetch {url} after {self.retries + 1} attempts: {error}")
+
+    def fetch_playlist(self, url):
+        """Fetch a playlist, following a master playlist to its highest-bandwidth variant"""
+        playlist = parse_playlist(self._get(url).decode('utf-8', errors='replace'), url)
+        if playlist['variants']:
+            _, variant_url = max(playlist['variants'])
+            return self.fetch_playlist(variant_url)
+        playlist['url'] = url
+        return playlist
+
+    def fetch_segment(self, segment):
+        return self._get(segment.url)
+
+    def download(self, segments, out, init_url=None, on_progress=None):
+        """Fetch segments concurrently and write them to the open file out in order; returns bytes written
+
+        on_progress(segments_written, bytes_written) is called after each segment.
+        """
+        written = 0
+        if init_url:
+            written += out.write(self._get(init_url))
+
+        segments = list(segments)
+        # Bound read-ahead so memory stays flat however long the recording is
+        window = self.concurrency * 2
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='hls') as pool:
+            in_flight = {}
+            upcoming = iter(segments)
+
+            def fill():
+                while len(in_flight) < window:
+                    segment = next(upcoming, None)
+                    if segment is None:
+                        return
+                    in_flight[segment.index] = pool.submit(self.fetch_segment, segment)
+
+            try:
+                fill()
+                for done, segment in enumerate(segments, 1):
+                    data = in_flight.pop(segment.index).result()
+                    written += out.write(data)
+                    if on_progress is not None:
+                        on_progress(done, written)
+                    fill()
+            except BaseException:
+                for future in in_flight.values():
+                    future.cancel()
+                raise
+
+        return written
+
+    def download_resumable(self, playlist, output_path, checkpoint_every=20, on_progress=None):
+        """Download a playlist into output_path, resuming from its checkpoint if one matches
+
+        Progress (segments written and their byte length) is saved to a
+        checkpoint file next to the output every checkpoint_every segments,
+        after the data itself has been synced to disk. on_progress receives the
+        totals including any resumed part.
+        """
+        segments = playlist['segments']
+        checkpoint = Checkpoint(output_path + '.checkpoint.json')
+        fingerprint = {
+            'segments': len(segments),
+            'first_sequence': segments[0].sequence if segments else None,
+            'init': bool(playlist.get('init_url')),
+        }
+
+        state = checkpoint.load()
+        start, offset = 0, 0
+        if (state and state.get('fingerprint') == fingerprint and os.path.exists(output_path)
+                and os.path.getsize(output_path) >= state['bytes']):
+            start, offset = state['completed'], state['bytes']
+            logger.info(f"Resuming {output_path} at segment {start}/{len(segments)} ({offset} bytes)")
+
+        with open(output_path, 'r+b' if start else 'wb') as out:
+            # Drop anything written after the last checkpoint; it may be a torn segment
+            out.truncate(offset)
+            out.seek(offset)
+
+            def save(done, written):
+                out.flush()
+                os.fsync(out.fileno())
+                checkpoint.save({'fingerprint': fingerprint, 'completed': start + done, 'bytes': offset + written})
+
+            def progress(done, written):
+                if done % checkpoint_every == 0:
+                    save(done, written)
+                if on_progress is not None:
+                    on_progress(start + done, offset + written)
+
+            written = self.download(segments[start:], out, None if start else playlist.get('init_url'), progress)
+            save(len(segments) - start, written)
+
+        return offset + written
+
+    def follow_live(self, url, out, on_progress=None, max_refresh=30, stall_timeout=300, should_stop=None):
+        """Record a live playlist into the open file out until it ends; returns a summary dict
+
+        New segments are appended (and flushed) as they appear. The playlist is
+        reloaded after its newest segment's duration while it grows, and with a
+        doubling delay, capped at max_refresh seconds, while it does not. The
+        recording ends on #EXT-X-ENDLIST, once the playlist has not changed for
+        stall_timeout seconds, or when it can no longer be fetched after
+        segments were recorded. on_progress(segments, bytes, seconds) is called
+        after each reload that added segments.
+        """
+        last_sequence = None
+        written = segments = gaps = 0
+        recorded_seconds = 0.0
+        unchanged = 0
+        last_change = time.monotonic()
+        ended = False
+
+        while True:
+            try:
+                playlist = self.fetch_playlist(url)
+            except HLSError as e:
+                if not segments:
+                    raise
+                # Live playlists are often withdrawn as soon as the Space ends
+                logger.info(f"Live playlist no longer available, finishing recording: {str(e)}")
+                break
+            # Stick to the variant the master playlist resolved to
+            url = playlist['url']
+
+            if last_sequence is None:
+                new = playlist['segments']
+            else:
+                new = [segment for segment in playlist['segments'] if segment.sequence > last_sequence]
+                if new and new[0].sequence > last_sequence + 1:
+                    missed = new[0].sequence - last_sequence - 1
+                    gaps += missed
+                    logger.warning(f"{missed} live segments left the playlist before they were fetched")
+
+            if new:
+                written += self.download(new, out, playlist.get('init_url') if last_sequence is None else None)
+                out.flush()
+                last_sequence = new[-1].sequence
+                segments += len(new)
+                recorded_seconds += sum(segment.duration for segment in new)
+                unchanged = 0
+                last_change = time.monotonic()
+                if on_progress is not None:
+                    on_progress(segments, written, recorded_seconds)
+            else:
+                unchanged += 1
+
+            if playlist['ended']:
+                ended = True
+                break
+            if time.monotonic() - last_change >= stall_timeout:
+                logger.warning(f"Live playlist unchanged for {stall_timeout}s, assuming the Space has ended")
+                break
+            if should_stop is not None and should_stop():
+                break
+
+            target = playlist['target_duration'] or 4.0
+            if new:
+                # RFC 8216: wait about one segment before reloading a playlist that changed
+                delay = new[-1].duration or target
+            else:
+                delay = min(max_refresh, target / 2 * (2 ** (unchanged - 1)))
+            time.sleep(delay)
+
+        return {
+            'segments': segments,
+            'bytes': written,
+            'duration': recorded_seconds,
+            'gaps': gaps,
+            'ended': ended,
+        }
+
+
+class Checkpoint:
+    """Progress of a segment download, persisted as JSON next to its partial output"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, state):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
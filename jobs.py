@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Background job queue for long-running Space downloads
+Jobs are executed in short-lived worker processes so a slow yt-dlp/FFmpeg run
+never ties up a web worker, and a stuck job can be killed when it times out.
+Workers are spawned rather than forked, so none inherits a lock that another
+thread of the web process happened to hold, and each runs in its own process
+group so the FFmpeg and yt-dlp processes it starts are killed along with it.
+Jobs that turn out to need a worker for hours can move to a lane, a separate
+set of workers, so they do not hold up the ordinary ones.
+"""
+
+import os
+import signal
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has reached its maximum depth"""
+
+
+class JobMoved(BaseException):
+    """Raised by move_to_lane; not an Exception, so the job's own error handling lets it through"""
+
+    def __init__(self, lane):
+        super().__init__(f"Job moved to lane {lane}")
+        self.lane = lane
+
+
+# Set in worker processes so job code can publish progress through the job's pipe
+_progress_channel = None
+# (job id, lane) of the job running in this worker process
+_current_job = (None, None)
+
+# Name prefix of worker processes, which is set before their job's module is imported
+WORKER_NAME_PREFIX = 'job-'
+
+JOBS_TOTAL = metrics.Counter('xspace_jobs_total', 'Finished background jobs by outcome')
+
+
+class _ProgressChannel:
+    """Sends throttled progress updates from a worker process to the dispatcher"""
+
+    def __init__(self, conn, min_interval=0.5):
+        self.conn = conn
+        self.min_interval = min_interval
+        self._last_sent = 0
+        self._last_phase = None
+        # Metrics can be recorded from helper threads of the job
+        self._send_lock = threading.Lock()
+
+    def _send(self, message):
+        with self._send_lock:
+            self.conn.send(message)
+
+    def send(self, fields):
+        now = time.monotonic()
+        phase = fields.get('phase')
+        # Phase changes always go out; intermediate updates are rate-limited
+        if phase == self._last_phase and now - self._last_sent < self.min_interval:
+            return
+        self._last_sent, self._last_phase = now, phase
+        self._send(('progress', fields))
+
+    def set_timeout(self, seconds):
+        self._send(('set_timeout', seconds))
+
+    def metric(self, name, labels, value):
+        self._send(('metric', (name, labels, value)))
+
+
+def report_progress(**fields):
+    """Publish progress of the current job (phase, bytes, segments, eta); a no-op outside a worker process"""
+    if _progress_channel is not None:
+        _progress_channel.send(fields)
+
+
+def set_job_timeout(seconds):
+    """Change the current job's time limit, counted from when it started; a no-op outside a worker process
+
+    For jobs that only learn once running that they will take longer than usual,
+    such as recording a live Space.
+    """
+    if _progress_channel is not None:
+        _progress_channel.set_timeout(seconds)
+
+
+def current_job_id():
+    """Return the id of the job running in this worker process, or None outside a worker process"""
+    return _current_job[0]
+
+
+def move_to_lane(lane):
+    """Stop the current job and queue it again, with the same arguments, for the workers of lane
+
+    Returns without doing anything when the job already runs in lane, or
+    outside a worker process.
+    """
+    if _progress_channel is not None and _current_job[1] != lane:
+        raise JobMoved(lane)
+
+
+def in_worker_process():
+    """Return True in a job worker process, including while it imports the job's module
+
+    Modules can check this to skip starting background threads that only the
+    serving process needs.
+    """
+    return multiprocessing.current_process().name.startswith(WORKER_NAME_PREFIX)
+
+
+def _run_in_child(conn, func, args, kwargs, job_id=None, trace=None, lane=None):
+    """Worker process entry point: run the job and report the outcome through the pipe"""
+    global _progress_channel, _current_job
+    # Lead a new process group, so a timeout kills the job's subprocesses too
+    os.setsid()
+    _progress_channel = _ProgressChannel(conn)
+    _current_job = (job_id, lane)
+    # Metrics recorded by the job belong to the parent's registry
+    metrics.registry.forward_to(_progress_channel.metric)
+    name = getattr(func, '__name__', 'job')
+    try:
+        # The job's spans continue the trace of the request that queued it
+        with tracing.tracer.span('job', context=trace, job_id=job_id, func=name), \
+                tracing.profiler.profile(f'job-{name}-{job_id}'):
+            result = func(*args, **kwargs)
+        conn.send(('ok', result))
+    except JobMoved as e:
+        conn.send(('move', e.lane))
+    except ValueError as e:
+        conn.send(('invalid', str(e)))
+    except Exception as e:
+        conn.send(('error', str(e)))
+    finally:
+        conn.close()
+
+
+class JobQueue:
+    """Bounded queue of jobs executed by a fixed number of worker processes"""
+
+    def __init__(self, max_workers=2, max_queue=50, job_timeout=1800, result_ttl=3600, id_prefix='', lanes=None):
+        self.max_workers = max_workers
+        # Extra workers by lane name, {lane: max_workers}, for jobs that call move_to_lane
+        self.lanes = dict(lanes or {})
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.result_ttl = result_ttl
+        # Lets a cluster tell from a job id which node runs the job
+        self.id_prefix = id_prefix
+
+        # A fork of this multithreaded process could inherit a lock held by
+        # another thread and hang on it, so workers start from a fresh
+        # interpreter. Job functions must be module-level to be pickled
+        self._mp = multiprocessing.get_context('spawn')
+
+        self._pending = queue.Queue(maxsize=max_queue)
+        self._lane_pending = {lane: queue.Queue(maxsize=max_queue) for lane in self.lanes}
+        self._jobs = {}
+        self._active_keys = {}
+        self._running = 0
+        self._lane_running = dict.fromkeys(self.lanes, 0)
+        self._lock = threading.Lock()
+        # Signalled whenever any job changes, so subscribers can follow progress
+        self._changed = threading.Condition(self._lock)
+        self._started = False
+
+    def _start_workers(self):
+        """Start dispatcher threads lazily so importing the app has no side effects"""
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.max_workers):
+                thread = threading.Thread(target=self._worker_loop, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+            for lane, workers in self.lanes.items():
+                for i in range(workers):
+                    thread = threading.Thread(target=self._worker_loop, args=(lane,),
+                                              name=f'job-worker-{lane}-{i}', daemon=True)
+                    thread.start()
+            self._started = True
+
+    def submit(self, func, *args, job_key=None, on_finish=None, **kwargs):
+        """Queue a job and return its id; raises QueueFullError when the queue is full
+
+        Jobs submitted with the job_key of a job that is still queued or running
+        are coalesced into that job and get its id back. on_finish(job) is
+        called in this process with the job snapshot once it finishes or fails.
+        """
+        self._start_workers()
+        self._prune()
+
+        if job_key is not None:
+            active_id = self._attach(job_key, on_finish)
+            if active_id is not None:
+                logger.info(f"Coalescing request for {job_key} into job {active_id}")
+                return active_id
+
+        job_id = f"{self.id_prefix}{uuid.uuid4().hex}"
+        job = {
+            'job_id': job_id,
+            'status': 'queued',
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None,
+            'error_type': None,
+            'progress': {},
+            'version': 0,
+            '_finished_ts': None,
+            '_trace': tracing.tracer.current_context(),
+            '_key': job_key,
+            '_callbacks': [on_finish] if on_finish else [],
+        }
+
+        with self._lock:
+            # Re-check under the lock so two racing submits cannot both enqueue
+            if job_key is not None:
+                active_id = self._active_keys.get(job_key)
+                if active_id is not None:
+                    if on_finish:
+                        self._jobs[active_id]['_callbacks'].append(on_finish)
+                    return active_id
+                self._active_keys[job_key] = job_id
+            self._jobs[job_id] = job
+        try:
+            self._pending.put_nowait((job_id, func, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job_id]
+                if job_key is not None:
+                    self._active_keys.pop(job_key, None)
+            raise QueueFullError(f"Job queue is full ({self.max_queue} pending jobs)")
+
+        logger.info(f"Queued job {job_id} ({self._pending.qsize()} pending)")
+        return job_id
+
+    def _attach(self, job_key, on_finish):
+        """Return the id of the active job for job_key, registering on_finish on it"""
+        with self._lock:
+            active_id = self._active_keys.get(job_key)
+            if active_id is not None and on_finish:
+                self._jobs[active_id]['_callbacks'].append(on_finish)
+            return active_id
+
+    def is_active(self, job_key):
+        """Return True if a job submitted with job_key is still queued or running"""
+        with self._lock:
+            return job_key in self._active_keys
+
+    def get(self, job_id):
+        """Return a public snapshot of a job, or None if it is unknown or expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {k: v for k, v in job.items() if not k.startswith('_')}
+
+    def wait_for_update(self, job_id, version, timeout=None):
+        """Block until the job's version differs from version (or timeout) and return its snapshot"""
+        with self._changed:
+            self._changed.wait_for(
+                lambda: job_id not in self._jobs or self._jobs[job_id]['version'] != version,
+                timeout=timeout
+            )
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {k: v for k, v in job.items() if not k.startswith('_')}
+
+    def stats(self):
+        """Return current queue depth and worker utilisation"""
+        with self._lock:
+            running = self._running
+            lanes = {lane: {
+                'queued': self._lane_pending[lane].qsize(),
+                'running': self._lane_running[lane],
+                'max_workers': workers,
+            } for lane, workers in self.lanes.items()}
+        return {
+            'queued': self._pending.qsize(),
+            'running': running,
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'lanes': lanes,
+        }
+
+    def _prune(self):
+        """Forget finished jobs whose results are older than result_ttl"""
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['_finished_ts'] and job['_finished_ts'] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _update(self, job_id, progress=None, **fields):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+                if progress:
+                    # A new phase starts from a clean slate so stale ETAs and byte counts do not linger
+                    same_phase = progress.get('phase', job['progress'].get('phase')) == job['progress'].get('phase')
+                    job['progress'] = dict(job['progress'], **progress) if same_phase else dict(progress)
+                job['version'] += 1
+                if job['_finished_ts'] and self._active_keys.get(job['_key']) == job_id:
+                    del self._active_keys[job['_key']]
+                self._changed.notify_all()
+
+    def _adjust_running(self, lane, amount):
+        with self._lock:
+            if lane is None:
+                self._running += amount
+            else:
+                self._lane_running[lane] += amount
+
+    def _worker_loop(self, lane=None):
+        pending = self._pending if lane is None else self._lane_pending[lane]
+        while True:
+            job_id, func, args, kwargs = pending.get()
+            self._adjust_running(lane, 1)
+            self._update(job_id, status='running', started_at=datetime.now().isoformat())
+            try:
+                outcome, payload = self._execute(job_id, func, args, kwargs, lane)
+            except Exception as e:
+                outcome, payload = 'error', str(e)
+            finally:
+                self._adjust_running(lane, -1)
+                pending.task_done()
+
+            if outcome == 'move':
+                outcome, payload = self._move(job_id, func, args, kwargs, payload)
+                if outcome == 'move':
+                    continue
+
+            finished = {'finished_at': datetime.now().isoformat(), '_finished_ts': time.time()}
+            JOBS_TOTAL.inc(outcome=outcome)
+            if outcome == 'ok':
+                self._update(job_id, status='finished', result=payload, **finished)
+                logger.info(f"Job {job_id} finished")
+            else:
+                self._update(job_id, status='failed', error=payload, error_type=outcome, **finished)
+                logger.error(f"Job {job_id} failed ({outcome}): {payload}")
+
+            self._run_callbacks(job_id)
+
+    def _move(self, job_id, func, args, kwargs, lane):
+        """Queue a job again for lane's workers; returns ('move', lane) or the outcome it failed with"""
+        if lane not in self._lane_pending:
+            return 'error', f"Unknown job lane: {lane}"
+        try:
+            self._lane_pending[lane].put_nowait((job_id, func, args, kwargs))
+        except queue.Full:
+            return 'error', f"Job lane {lane} is full ({self.max_queue} pending jobs)"
+        self._update(job_id, status='queued')
+        logger.info(f"Job {job_id} moved to lane {lane}")
+        return 'move', lane
+
+    def _run_callbacks(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            callbacks, job['_callbacks'] = job['_callbacks'], []
+            snapshot = {k: v for k, v in job.items() if not k.startswith('_')}
+        for callback in callbacks:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Callback for job {job_id} failed: {str(e)}")
+
+    def _execute(self, job_id, func, args, kwargs, lane=None):
+        """Run one job in a child process, enforcing the per-job timeout"""
+        with self._lock:
+            trace = self._jobs[job_id]['_trace'] if job_id in self._jobs else None
+        parent_conn, child_conn = self._mp.Pipe(duplex=False)
+        process = self._mp.Process(
+            target=_run_in_child, args=(child_conn, func, args, kwargs, job_id, trace, lane),
+            name=f'{WORKER_NAME_PREFIX}{job_id}', daemon=True
+        )
+        process.start()
+        child_conn.close()
+
+        started = time.monotonic()
+        timeout = self.job_timeout
+        try:
+            while True:
+                remaining = started + timeout - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Job {job_id} exceeded {timeout}s, terminating worker process")
+                    self._signal_group(process, signal.SIGTERM)
+                    return 'timeout', f"Job exceeded the {timeout}s time limit"
+                if not parent_conn.poll(remaining):
+                    continue
+                try:
+                    outcome, payload = parent_conn.recv()
+                except EOFError:
+                    return 'error', 'Worker process exited unexpectedly'
+                if outcome == 'progress':
+                    self._update(job_id, progress=payload)
+                    continue
+                if outcome == 'metric':
+                    metrics.registry.apply(*payload)
+                    continue
+                if outcome == 'set_timeout':
+                    logger.info(f"Job {job_id} time limit set to {payload}s")
+                    timeout = payload
+                    continue
+                return outcome, payload
+        finally:
+            parent_conn.close()
+            process.join(5)
+            # Whatever is left of the job, including a worker that ignored SIGTERM
+            self._signal_group(process, signal.SIGKILL)
+            process.join(1)
+
+    def _signal_group(self, process, sig):
+        """Send sig to the worker's process group, or to the worker alone if it has not started its group yet"""
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            # No group left; the worker, if still alive, died before calling setsid
+            if process.exitcode is None:
+                os.kill(process.pid, sig)
+        except PermissionError:
+            pass
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Metadata cache for yt-dlp extract_info results
+Entries live in an in-process LRU and, optionally, in a SQLite database shared
+by every process on the node. Live Spaces expire quickly and are kept apart from
+ended ones so their churn never evicts long-lived replay metadata.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def is_live_info(info):
+    """Return True if the extract_info result describes a Space that is still live"""
+    return bool(info.get('is_live')) or info.get('live_status') in ('is_live', 'is_upcoming')
+
+
+class LRUStore:
+    """Thread-safe in-memory LRU of (value, expires_at) pairs"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteStore:
+    """On-disk store shared between processes; a new connection is opened per call so it is fork-safe"""
+
+    def __init__(self, db_path, max_entries):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS metadata ('
+                'key TEXT PRIMARY KEY, live INTEGER NOT NULL, '
+                'expires_at REAL NOT NULL, accessed_at REAL NOT NULL, info TEXT NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def get(self, key, live):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT info FROM metadata WHERE key = ? AND live = ? AND expires_at > ?',
+                (key, int(live), now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE metadata SET accessed_at = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, live, value, expires_at):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO metadata (key, live, expires_at, accessed_at, info) VALUES (?, ?, ?, ?, ?)',
+                (key, int(live), expires_at, now, json.dumps(value))
+            )
+            conn.execute('DELETE FROM metadata WHERE expires_at <= ?', (now,))
+            conn.execute(
+                'DELETE FROM metadata WHERE key IN (SELECT key FROM metadata WHERE live = ? '
+                'ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (int(live), self.max_entries)
+            )
+
+
+class MetadataCache:
+    """TTL cache of Space metadata with separate live and ended partitions"""
+
+    def __init__(self, max_entries=512, ttl=21600, live_ttl=30, db_path=None):
+        self.ttl = ttl
+        self.live_ttl = live_ttl
+        self._partitions = {False: LRUStore(max_entries), True: LRUStore(max_entries)}
+        self._db = SQLiteStore(db_path, max_entries) if db_path else None
+        self._hits = 0
+        self._misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        """Return cached metadata for key, or None"""
+        value = self._lookup(key)
+        self._count(hit=value is not None)
+        return value
+
+    def peek(self, key):
+        """Return cached metadata for key without counting a hit or miss"""
+        return self._lookup(key)
+
+    def _lookup(self, key):
+        for live in (False, True):
+            value = self._partitions[live].get(key)
+            if value is None and self._db is not None:
+                try:
+                    value = self._db.get(key, live)
+                except (sqlite3.Error, ValueError) as e:
+                    # A locked or damaged database is a miss; the caller fetches the metadata instead
+                    logger.warning(f"Could not read persisted metadata for {key}: {str(e)}")
+                    value = None
+                if value is not None:
+                    # Promote to the in-process tier for subsequent lookups
+                    ttl = self.live_ttl if live else self.ttl
+                    self._partitions[live].set(key, value, time.time() + ttl)
+            if value is not None:
+                return value
+        return None
+
+    def set(self, key, info):
+        """Cache a JSON-serialisable extract_info result under key"""
+        live = is_live_info(info)
+        expires_at = time.time() + (self.live_ttl if live else self.ttl)
+        self._partitions[live].set(key, info, expires_at)
+        if self._db is not None:
+            try:
+                self._db.set(key, live, info, expires_at)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not persist metadata for {key}: {str(e)}")
+
+    def get_or_fetch(self, keys, fetch, refresh=False):
+        """Return cached metadata for the first key that hits, else call fetch() and cache it under every key
+
+        refresh skips the lookup, replacing entries that are known to be stale.
+        """
+        for key in keys if not refresh else ():
+            info = self._lookup(key)
+            if info is not None:
+                self._count(hit=True)
+                return info
+
+        self._count(hit=False)
+        info = fetch()
+        for key in keys:
+            self.set(key, info)
+        if info.get('id') and info['id'] not in keys:
+            self.set(info['id'], info)
+        return info
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    def stats(self):
+        """Return hit/miss counters and the in-process entry counts"""
+        with self._stats_lock:
+            hits, misses = self._hits, self._misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else 0.0,
+            'ended_entries': len(self._partitions[False]),
+            'live_entries': len(self._partitions[True]),
+        }
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Prometheus-style metrics
+A small in-process registry of counters and histograms rendered in the
+Prometheus text exposition format. Recording is a dict lookup and an addition
+under a lock. Worker processes forward their observations to the parent
+process, which owns the registry that /metrics renders.
+"""
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Seconds; spans a cached lookup up to a multi-hour recording
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Holds the metrics of one process and renders them"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._forward = None
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collect):
+        """Register a callback returning [(name, type, help, [(labels_dict, value), ...]), ...] at scrape time"""
+        self._collectors.append(collect)
+
+    def forward_to(self, send):
+        """Send every observation to send(name, labels, value) instead of recording it here (worker processes)"""
+        self._forward = send
+
+    def apply(self, name, labels, value):
+        """Record an observation forwarded from a worker process"""
+        metric = self._metrics.get(name)
+        if metric is not None:
+            metric._record(tuple(sorted(labels.items())), value)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric._render())
+        for collect in self._collectors:
+            for name, kind, help_text, samples in collect():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, registry=registry):
+        self.name = name
+        self.help = help_text
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._values = {}
+        registry.register(self)
+
+    def _observe(self, value, labels):
+        if self.registry._forward is not None:
+            self.registry._forward(self.name, labels, value)
+        else:
+            self._record(tuple(sorted(labels.items())), value)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._observe(amount, labels)
+
+    def _record(self, key, value):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def _render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = self._header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS, registry=registry):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, registry)
+
+    def observe(self, value, **labels):
+        self._observe(value, labels)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block took, whether or not it raised"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _record(self, key, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Per-bucket counts (last one is +Inf), then sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def _render(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        lines = self._header()
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = key + (('le', _format_value(float(bound)) if bound != float('inf') else '+Inf'),)
+                lines.append(f"{self.name}_bucket{_format_labels(le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
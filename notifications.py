@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Asynchronous email notifications
+Messages are queued in memory and delivered by a background thread over one
+persistent SMTP connection. Deliveries are batched, retried with exponential
+backoff, and rate-limited per recipient domain, so callers never wait on SMTP.
+"""
+
+import heapq
+import itertools
+import logging
+import queue
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.utils import formatdate, make_msgid
+
+logger = logging.getLogger(__name__)
+
+
+class EmailNotifier:
+    """Background SMTP sender with batching, retries and per-domain rate limits"""
+
+    def __init__(self, host=None, port=587, username=None, password=None, use_tls=True,
+                 sender='noreply@localhost', batch_size=20, batch_window=1.0, max_retries=5,
+                 backoff=5.0, domain_rate=30, idle_timeout=60, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.sender = sender
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.domain_rate = domain_rate
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._incoming = queue.Queue()
+        self._scheduled = []
+        self._sequence = itertools.count()
+        self._buckets = {}
+        self._connection = None
+        self._last_used = 0
+        # Consecutive failures to open a connection, which back off every queued message
+        self._connect_failures = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def send(self, recipient, subject, text, html=None):
+        """Queue an email for delivery and return immediately"""
+        if not self.host:
+            # No SMTP server configured (local development): log instead of sending
+            logger.info(f"SMTP_HOST not set, email to {recipient} not sent:\nSubject: {subject}\n\n{text}")
+            return
+
+        message = MIMEMultipart('alternative')
+        message['Subject'] = subject
+        message['From'] = self.sender
+        message['To'] = recipient
+        message['Date'] = formatdate(localtime=True)
+        message['Message-ID'] = make_msgid()
+        message.attach(MIMEText(text, 'plain', 'utf-8'))
+        if html:
+            message.attach(MIMEText(html, 'html', 'utf-8'))
+
+        self._start()
+        self._incoming.put({'recipient': recipient, 'message': message, 'attempts': 0})
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='email-sender', daemon=True)
+                self._thread.start()
+
+    def _schedule(self, item, delay=0):
+        heapq.heappush(self._scheduled, (time.time() + delay, next(self._sequence), item))
+
+    def _next_wakeup(self):
+        """Seconds until the next scheduled delivery or idle check; None to wait indefinitely"""
+        waits = []
+        if self._scheduled:
+            waits.append(max(0, self._scheduled[0][0] - time.time()))
+        if self._connection is not None:
+            waits.append(max(0, self._last_used + self.idle_timeout - time.time()))
+        return min(waits) if waits else None
+
+    def _run(self):
+        while True:
+            try:
+                self._schedule(self._incoming.get(timeout=self._next_wakeup()))
+                # Give a burst of notifications a moment to arrive so it goes out as one batch
+                deadline = time.time() + self.batch_window
+                while len(self._scheduled) < self.batch_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._schedule(self._incoming.get(timeout=remaining))
+            except queue.Empty:
+                pass
+
+            try:
+                self._send_due()
+            except Exception as e:
+                logger.error(f"Email sender error: {str(e)}")
+                self._disconnect()
+
+            if self._connection is not None and time.time() - self._last_used >= self.idle_timeout:
+                self._disconnect()
+
+    def _send_due(self):
+        now = time.time()
+        batch = []
+        while self._scheduled and self._scheduled[0][0] <= now and len(batch) < self.batch_size:
+            batch.append(heapq.heappop(self._scheduled)[2])
+
+        for index, item in enumerate(batch):
+            domain = item['recipient'].rsplit('@', 1)[-1].lower()
+            wait = self._take_token(domain)
+            if wait:
+                self._schedule(item, wait)
+                continue
+
+            try:
+                connection = self._connect()
+            except (smtplib.SMTPException, OSError) as e:
+                # The server is unavailable, whatever its reply code; no message is at fault
+                self._postpone(batch[index:], e)
+                return
+
+            try:
+                connection.sendmail(self.sender, [item['recipient']], item['message'].as_string())
+                self._last_used = time.time()
+                logger.info(f"Sent notification email to {item['recipient']}")
+            except smtplib.SMTPRecipientsRefused as e:
+                logger.error(f"Recipient refused, dropping email to {item['recipient']}: {e.recipients}")
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code >= 500:
+                    logger.error(f"Permanent SMTP failure for {item['recipient']}: {e.smtp_code} {e.smtp_error}")
+                else:
+                    self._retry(item, f"{e.smtp_code} {e.smtp_error}")
+            except (smtplib.SMTPException, OSError) as e:
+                # The connection is unusable; reconnect on the next attempt
+                self._disconnect()
+                self._retry(item, str(e))
+
+    def _postpone(self, items, error):
+        """Put items back with a growing delay after the connection could not be opened, without using up their retries"""
+        self._connect_failures += 1
+        delay = self.backoff * (2 ** min(self._connect_failures - 1, self.max_retries))
+        logger.warning(f"Could not connect to SMTP server ({str(error)}), "
+                       f"retrying {len(items)} emails in {delay:.0f}s")
+        for item in items:
+            self._schedule(item, delay)
+
+    def _retry(self, item, error):
+        item['attempts'] += 1
+        if item['attempts'] > self.max_retries:
+            logger.error(f"Giving up on email to {item['recipient']} after {item['attempts']} attempts: {error}")
+            return
+        delay = self.backoff * (2 ** (item['attempts'] - 1))
+        logger.warning(f"Email to {item['recipient']} failed ({error}), retrying in {delay:.0f}s")
+        self._schedule(item, delay)
+
+    def _take_token(self, domain):
+        """Token bucket per recipient domain; returns 0 if a message may be sent now, else seconds to wait"""
+        now = time.time()
+        refill = self.domain_rate / 60.0
+        tokens, updated = self._buckets.get(domain, (self.domain_rate, now))
+        tokens = min(self.domain_rate, tokens + (now - updated) * refill)
+        if tokens >= 1:
+            self._buckets[domain] = (tokens - 1, now)
+            return 0
+        self._buckets[domain] = (tokens, now)
+        return (1 - tokens) / refill
+
+    def _connect(self):
+        if self._connection is None:
+            connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.use_tls:
+                    connection.starttls()
+                if self.username:
+                    connection.login(self.username, self.password)
+                self._connection, connection = connection, None
+            finally:
+                # Set only if STARTTLS or login failed
+                if connection is not None:
+                    connection.close()
+            self._connect_failures = 0
+            logger.info(f"Opened SMTP connection to {self.host}:{self.port}")
+        return self._connection
+
+    def _disconnect(self):
+        if self._connection is None:
+            return
+        try:
+            self._connection.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._connection = None
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Per-client admission control with token buckets
+Every client (a known API key, otherwise the client IP) has a bucket that
+refills at a steady rate up to a burst size. Requests are charged what they
+cost the server, so a cached answer takes a token while a fresh multi-hour
+download takes most of a bucket. Buckets live in memory, or in a SQLite file
+when several server processes must share them.
+"""
+
+import math
+import time
+import sqlite3
+import threading
+
+
+class RateLimitedError(Exception):
+    """Raised when a client's bucket cannot cover a request; retry_after is in seconds"""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Rate limit exceeded, retry in {retry_after}s")
+
+
+def _take(tokens, updated, now, cost, rate, burst, force=False):
+    """Refill a bucket to now and charge cost; returns (tokens, seconds to wait or 0 if charged)
+
+    With force, cost is charged even if that leaves the bucket in debt.
+    """
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= cost or force:
+        # A negative cost is a refund, which cannot overfill the bucket either
+        return min(burst, tokens - cost), 0
+    return tokens, max(1, math.ceil((cost - tokens) / rate))
+
+
+class MemoryBuckets:
+    """Buckets of this process only; buckets untouched for stale_after seconds are full and can be dropped"""
+
+    def __init__(self, stale_after, max_entries=100000):
+        self.stale_after = stale_after
+        self.max_entries = max_entries
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, rate, burst, force=False):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens, wait = _take(tokens, updated, now, cost, rate, burst, force)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_entries:
+                # A bucket that has refilled completely is the same as no bucket
+                for stale_key, (_, stale_updated) in list(self._buckets.items()):
+                    if stale_updated < now - self.stale_after:
+                        del self._buckets[stale_key]
+        return wait
+
+
+class SQLiteBuckets:
+    """Buckets in a SQLite file shared between processes; a new connection is opened per call so it is fork-safe"""
+
+    def __init__(self, db_path, stale_after):
+        self.db_path = db_path
+        self.stale_after = stale_after
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        # Autocommit mode, so take() can open its own write transaction
+        return sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+
+    def take(self, key, cost, rate, burst, force=False):
+        now = time.time()
+        conn = self._connect()
+        try:
+            # Lock before reading so two processes cannot both spend the same tokens
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, wait = _take(*(row or (burst, now)), now, cost, rate, burst, force)
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+            if row is None:
+                # New clients are rare next to repeat ones; drop buckets that have refilled
+                conn.execute('DELETE FROM buckets WHERE updated < ?', (now - self.stale_after,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return wait
+
+
+class RateLimiter:
+    """Charges clients per request; rates are tokens per second"""
+
+    def __init__(self, rate=0.2, burst=120, key_rate=None, key_burst=None, api_keys=(), proxy_hops=0,
+                 db_path=None, enabled=True):
+        self.rate = rate
+        self.burst = burst
+        self.key_rate = key_rate or rate
+        self.key_burst = key_burst or burst
+        self.api_keys = frozenset(api_keys)
+        self.proxy_hops = proxy_hops
+        self.enabled = enabled
+        # Time for the slowest bucket to refill from empty
+        stale_after = max(self.burst / self.rate, self.key_burst / self.key_rate)
+        self._buckets = SQLiteBuckets(db_path, stale_after) if db_path else MemoryBuckets(stale_after)
+
+    def client(self, api_key=None, remote_addr=None, forwarded_for=None):
+        """Return the bucket key of a request, or None while rate limiting is off
+
+        Unknown API keys are ignored, so minting keys does not get a client
+        fresh buckets. X-Forwarded-For is only used behind proxy_hops trusted
+        proxies, each of which appends the address it saw.
+        """
+        if not self.enabled:
+            return None
+        if api_key and api_key in self.api_keys:
+            return f'key:{api_key}'
+        address = remote_addr
+        if self.proxy_hops and forwarded_for:
+            route = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+            if len(route) >= self.proxy_hops:
+                address = route[-self.proxy_hops]
+        return f'ip:{address or "unknown"}'
+
+    def _limits(self, client):
+        if client.startswith('key:'):
+            return self.key_rate, self.key_burst
+        return self.rate, self.burst
+
+    def acquire(self, client, cost):
+        """Charge client cost tokens, raising RateLimitedError if its bucket is short; returns the cost charged"""
+        if client is None or cost <= 0:
+            return 0
+        rate, burst = self._limits(client)
+        # A request bigger than the bucket is admitted once the bucket is full
+        cost = min(cost, burst)
+        wait = self._buckets.take(client, cost, rate, burst)
+        if wait:
+            raise RateLimitedError(wait)
+        return cost
+
+    def refund(self, client, cost):
+        """Give back tokens for a request that was charged but then turned away"""
+        if client is None or cost <= 0:
+            return
+        rate, burst = self._limits(client)
+        self._buckets.take(client, -cost, rate, burst)
+
+    def settle(self, client, charged, cost):
+        """Correct a provisional charge once the request's real cost is known
+
+        The difference is refunded, or charged even if the bucket cannot cover
+        it, since the work is already done; the client then waits it out on
+        its next request.
+        """
+        if client is None:
+            return
+        rate, burst = self._limits(client)
+        difference = min(cost, burst) - charged
+        if difference:
+            self._buckets.take(client, difference, rate, burst, force=True)
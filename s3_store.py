@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+File store backed by an S3-compatible object store
+Every node reads and writes the same bucket, so a file downloaded on one node
+can be fetched through any other. Audio goes up with multipart uploads and is
+served by redirecting clients to presigned URLs, so the object store handles
+ranges and conditional requests and audio bytes never pass through Python.
+Index entries are small JSON objects next to the audio, cached briefly in
+process. The bytes and objects in the bucket are counted by a listing every
+usage_ttl seconds, shared by the processes of a node through usage_file, and
+kept current in between by this node's own uploads and deletions.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from urllib.parse import quote
+
+from file_store import FileStore
+from metadata_cache import LRUStore
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # Only needed when STORAGE_BACKEND=s3
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+
+def content_disposition(filename):
+    """Return an attachment Content-Disposition with an ASCII fallback and the UTF-8 name"""
+    fallback = filename.encode('ascii', 'replace').decode().replace('?', '_').replace('"', '')
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+class S3FileStore(FileStore):
+    """Audio files and their index entries in a bucket; keys and entity tags match the local FileStore"""
+
+    # No local object directory for the cache manager to sweep
+    objects_dir = None
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, public_endpoint_url=None, region=None,
+                 part_size=16 * 1024 ** 2, upload_concurrency=4, url_ttl=3600, index_ttl=30,
+                 content_types=None, usage_ttl=300, usage_file=None):
+        if boto3 is None:
+            raise RuntimeError("S3 storage needs boto3 (pip install -r requirements-s3.txt)")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        # Presigned URLs must name a host clients can reach, which may not be the one this node uses
+        self.public_endpoint_url = public_endpoint_url or endpoint_url
+        self.region = region
+        self.url_ttl = url_ttl
+        self.index_ttl = index_ttl
+        self.usage_ttl = usage_ttl
+        self.usage_file = usage_file
+        self.content_types = content_types or {}
+        self.transfer_config = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=upload_concurrency,
+        )
+
+        self._entries = LRUStore(4096)
+        self._clients = None
+        self._lock = threading.Lock()
+        # {'bytes', 'objects', 'listed_at'} as of the last listing, plus changes made since
+        self._usage = None
+        self._usage_lock = threading.Lock()
+
+    def _client(self, public=False):
+        """Return the S3 client for this process; clients are not carried across a fork"""
+        with self._lock:
+            if self._clients is None or self._clients[0] != os.getpid():
+                config = Config(signature_version='s3v4', retries={'mode': 'standard'})
+                self._clients = (os.getpid(), {
+                    endpoint: boto3.client('s3', endpoint_url=endpoint, region_name=self.region, config=config)
+                    for endpoint in {self.endpoint_url, self.public_endpoint_url}
+                })
+            return self._clients[1][self.public_endpoint_url if public else self.endpoint_url]
+
+    def object_name(self, key):
+        return f"{self.prefix}objects/{os.path.basename(key)}"
+
+    def index_name(self, key):
+        return f"{self.prefix}index/{os.path.basename(key)}.json"
+
+    def get(self, key):
+        """Return the index entry for a storage key, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            try:
+                response = self._client().get_object(Bucket=self.bucket, Key=self.index_name(key))
+            except ClientError as e:
+                if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                    # Misses are not cached, so a file another node just stored is found at once
+                    return None
+                raise
+            entry = json.loads(response['Body'].read())
+            self._entries.set(key, entry, time.time() + self.index_ttl)
+        return dict(entry)
+
+    def entries(self):
+        """Return an entry per stored object, from one bucket listing
+
+        Listing results carry only size and modification time, so eviction
+        falls back to oldest-first here whatever the policy.
+        """
+        prefix = self.object_name('')
+        entries = []
+        paginator = self._client().get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                entries.append({
+                    'key': obj['Key'][len(prefix):],
+                    'size': obj['Size'],
+                    'created_at': obj['LastModified'].timestamp(),
+                })
+        with self._usage_lock:
+            self._save_usage({
+                'bytes': sum(entry['size'] for entry in entries),
+                'objects': len(entries),
+                'listed_at': time.time(),
+            })
+        return entries
+
+    def usage(self):
+        """Return the bytes and objects in the bucket, listing it only when the last count is usage_ttl old"""
+        with self._usage_lock:
+            usage = self._load_usage()
+        if usage is None:
+            self.entries()
+            with self._usage_lock:
+                usage = self._usage
+        return usage['bytes'], usage['objects']
+
+    def _load_usage(self):
+        """Return the freshest count of this or another process on the node, or None if it is stale; caller holds self._usage_lock"""
+        candidates = [self._usage]
+        if self.usage_file:
+            try:
+                with open(self.usage_file, encoding='utf-8') as f:
+                    candidates.append(json.load(f))
+            except (OSError, ValueError):
+                pass
+        usage = max(filter(None, candidates), key=lambda u: u.get('updated_at', u['listed_at']), default=None)
+        if usage is None or usage['listed_at'] < time.time() - self.usage_ttl:
+            return None
+        self._usage = usage
+        return usage
+
+    def _save_usage(self, usage):
+        """Keep usage as this process's count and hand it to the node's other processes; caller holds self._usage_lock"""
+        usage['updated_at'] = time.time()
+        self._usage = usage
+        if not self.usage_file:
+            return
+        try:
+            tmp_path = f"{self.usage_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(usage, f)
+            os.replace(tmp_path, self.usage_file)
+        except OSError as e:
+            logger.warning(f"Could not save bucket usage: {str(e)}")
+
+    def _adjust_usage(self, size, objects):
+        """Count an upload (or, with negative arguments, a deletion) without listing the bucket"""
+        with self._usage_lock:
+            usage = self._load_usage()
+            if usage is not None:
+                # Another node's changes show up at the next listing
+                self._save_usage(dict(usage, bytes=max(0, usage['bytes'] + size),
+                                      objects=max(0, usage['objects'] + objects)))
+
+    def commit(self, space_id, fmt, staged_path, metadata, clip=None):
+        """Upload a finished file, then record it in the index"""
+        key = self.storage_key(space_id, fmt, clip)
+        size = os.path.getsize(staged_path)
+        client = self._client()
+        # upload_file switches to a multipart upload with parallel parts above part_size
+        client.upload_file(
+            staged_path, self.bucket, self.object_name(key),
+            ExtraArgs={'ContentType': self.content_types.get(fmt, 'application/octet-stream')},
+            Config=self.transfer_config,
+        )
+
+        entry = self.new_entry(key, space_id, fmt, size, metadata, clip)
+        # Written after the audio, so an index entry never points at a missing object
+        client.put_object(
+            Bucket=self.bucket, Key=self.index_name(key),
+            Body=json.dumps(entry).encode(), ContentType='application/json',
+        )
+        os.remove(staged_path)
+        self._entries.set(key, entry, time.time() + self.index_ttl)
+        self._adjust_usage(size, 1)
+        logger.info(f"Stored {key} in s3://{self.bucket}/{self.object_name(key)} ({size} bytes)")
+        return dict(entry)
+
+    def redirect_url(self, entry):
+        """Return a presigned GET URL that downloads the file under its download name"""
+        return self._client(public=True).generate_presigned_url('get_object', Params={
+            'Bucket': self.bucket,
+            'Key': self.object_name(entry['key']),
+            'ResponseContentDisposition': content_disposition(entry['download_name']),
+        }, ExpiresIn=self.url_ttl)
+
+    def touch(self, key):
+        """Serve statistics are not kept; downloads go to the object store, and counting them would cost a write each"""
+
+    def flush_touches(self):
+        """Nothing is buffered; see touch"""
+
+    def remove(self, key):
+        """Delete a stored file and its index entry"""
+        entry = self.get(key)
+        client = self._client()
+        # Index first, so no node hands out a URL for an object that is going away
+        client.delete_object(Bucket=self.bucket, Key=self.index_name(key))
+        client.delete_object(Bucket=self.bucket, Key=self.object_name(key))
+        self._entries.set(key, None, 0)
+        if entry is not None:
+            self._adjust_usage(-entry['size'], -1)
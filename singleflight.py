@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Single-flight locking for Space downloads
+Only one download per Space runs at a time across every process sharing the
+download directory; concurrent callers block until it finishes and then reuse
+its output.
+"""
+
+import os
+import re
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a process-local lock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Exclusive lock per key, backed by flock() on a lock file"""
+
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        os.makedirs(lock_dir, exist_ok=True)
+        self._local_locks = {}
+        self._local_guard = threading.Lock()
+
+    def _lock_path(self, key):
+        safe_key = re.sub(r'[^A-Za-z0-9_.-]', '_', str(key))[:100]
+        return os.path.join(self.lock_dir, f"{safe_key}.lock")
+
+    @contextmanager
+    def acquire(self, key, blocking=True):
+        """Hold the lock for key; yields True if another caller held it first
+
+        With blocking=False, raises BlockingIOError instead of waiting.
+        """
+        if fcntl is None:
+            with self._local_guard:
+                lock = self._local_locks.setdefault(key, threading.Lock())
+            waited = not lock.acquire(blocking=False)
+            if waited:
+                if not blocking:
+                    raise BlockingIOError(f"{key} is locked")
+                lock.acquire()
+            try:
+                yield waited
+            finally:
+                lock.release()
+            return
+
+        # Lock files are never deleted: unlinking one while another process
+        # waits on it would let a third process lock a fresh inode
+        fd = os.open(self._lock_path(key), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                waited = False
+            except BlockingIOError:
+                if not blocking:
+                    raise
+                logger.info(f"Waiting for in-flight download of {key}")
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                waited = True
+            try:
+                yield waited
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
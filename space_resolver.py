@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Canonical Space ids for every accepted URL form
+/i/spaces/<id> URLs name their Space directly. t.co short links are expanded
+with one redirect lookup, and status links are mapped once a metadata fetch has
+shown which Space they carry. Both expansions are kept in a bounded cache, so
+repeat requests key the store, job and metadata caches on the Space id without
+going through yt-dlp.
+"""
+
+import re
+import time
+import logging
+from urllib.parse import urlsplit, unquote
+
+import tracing
+from metadata_cache import LRUStore
+
+logger = logging.getLogger(__name__)
+
+TWITTER_HOSTS = frozenset(
+    prefix + domain
+    for domain in ('twitter.com', 'x.com')
+    for prefix in ('', 'www.', 'mobile.', 'm.')
+)
+SHORT_HOST = 't.co'
+
+SPACE_PATH = re.compile(r'/i/spaces/([a-zA-Z0-9]+)(?:/|$)')
+STATUS_PATH = re.compile(r'/(?:i/web|[^/]+)/status(?:es)?/(\d+)(?:/|$)')
+SHORT_PATH = re.compile(r'/([a-zA-Z0-9]+)/?$')
+
+# t.co sends links it flags through this interstitial
+UNSAFE_LINK_PREFIX = 'https://twitter.com/safety/unsafe_link_warning?unsafe_link='
+
+# Cached short link targets besides 'space:<id>' and 'status:<id>'
+OFF_TWITTER = 'off-twitter'
+UNRESOLVED = 'unresolved'
+
+
+class SpaceResolver:
+    """Maps Space, status and t.co URLs to a Space id, caching the expansions that need a lookup"""
+
+    def __init__(self, max_entries=4096, ttl=86400, expand_short_links=True, expand_timeout=5, failure_ttl=300):
+        self.ttl = ttl
+        # Short links that could not be expanded are retried after this long
+        self.failure_ttl = failure_ttl
+        self.expand_short_links = expand_short_links
+        self.expand_timeout = expand_timeout
+        self._cache = LRUStore(max_entries)
+
+    def normalize(self, url):
+        """Return url with a scheme and Twitter hosts mapped to twitter.com; other hosts are left alone"""
+        url = url.strip()
+        if not url.startswith(('http://', 'https://')):
+            url = 'https://' + url
+        parts = urlsplit(url)
+        if (parts.hostname or '') in TWITTER_HOSTS:
+            match = SPACE_PATH.match(parts.path)
+            if match:
+                # Query strings and suffixes like /peek do not change the Space
+                return f'https://twitter.com/i/spaces/{match.group(1)}'
+            return parts._replace(scheme='https', netloc='twitter.com').geturl()
+        return url
+
+    def classify(self, url):
+        """Return ('space', id), ('status', id) or ('short', code) for an accepted URL, else None"""
+        parts = urlsplit(url)
+        host = parts.hostname or ''
+        if host in TWITTER_HOSTS:
+            match = SPACE_PATH.match(parts.path)
+            if match:
+                return 'space', match.group(1)
+            match = STATUS_PATH.match(parts.path)
+            if match:
+                return 'status', match.group(1)
+        elif host == SHORT_HOST:
+            match = SHORT_PATH.match(parts.path)
+            if match:
+                return 'short', match.group(1)
+        return None
+
+    def is_supported(self, url):
+        return self.classify(url) is not None
+
+    def space_id(self, url):
+        """Return the Space id url refers to, or None if that is only known after a metadata fetch
+
+        Raises ValueError when a short link turns out not to lead to Twitter.
+        """
+        kind = self.classify(url)
+        if kind is None:
+            return None
+        if kind[0] == 'space':
+            return kind[1]
+
+        key = f'{kind[0]}:{kind[1]}'
+        cached = self._cache.get(key)
+        if cached is None and kind[0] == 'short' and self.expand_short_links:
+            target = self._expand(url, kind[1])
+            if target == OFF_TWITTER:
+                cached = ''
+            elif target.startswith('space:'):
+                cached = target.partition(':')[2]
+            elif target.startswith('status:'):
+                # Known once the status itself has been looked up
+                cached = self._cache.get(target)
+            if cached is not None:
+                self._cache.set(key, cached, time.time() + self.ttl)
+        if cached == '':
+            raise ValueError("Link does not point to a Twitter Space")
+        return cached
+
+    def remember(self, url, space_id):
+        """Record that url carries space_id, as learned from its metadata"""
+        kind = self.classify(url)
+        if kind is None or kind[0] == 'space' or not space_id:
+            return
+        self._cache.set(f'{kind[0]}:{kind[1]}', space_id, time.time() + self.ttl)
+
+    def _expand(self, url, code):
+        """Return where short link code leads: 'space:<id>', 'status:<id>', OFF_TWITTER or UNRESOLVED
+
+        The target is cached whatever it is, so a link to a status whose Space
+        is not known yet, or one that could not be expanded, is not looked up
+        again on every request. Failures are kept for failure_ttl only, and
+        targets that could not be decoded are not kept at all.
+        """
+        key = f'expand:{code}'
+        target = self._cache.get(key)
+        if target is None:
+            target = self._follow(url)
+            if target is None:
+                return UNRESOLVED
+            ttl = self.failure_ttl if target == UNRESOLVED else self.ttl
+            self._cache.set(key, target, time.time() + ttl)
+        return target
+
+    def _follow(self, url):
+        """Look up a short link's redirect and classify its target; None if the target is still percent-encoded"""
+        import requests
+
+        with tracing.tracer.span('expand_short_link'):
+            try:
+                # t.co answers curl with a plain redirect instead of an HTML page
+                response = requests.head(url, headers={'User-Agent': 'curl'}, allow_redirects=False,
+                                         timeout=self.expand_timeout)
+            except requests.RequestException as e:
+                logger.warning(f"Could not expand {url}: {str(e)}")
+                return UNRESOLVED
+        location = response.headers.get('Location')
+        if response.status_code not in (301, 302, 303, 307, 308) or not location:
+            return UNRESOLVED
+        if location.startswith(UNSAFE_LINK_PREFIX):
+            # The interstitial carries the target as an encoded query parameter
+            location = unquote(location[len(UNSAFE_LINK_PREFIX):])
+
+        target = self.classify(self.normalize(location))
+        if target is None:
+            if '%' in location:
+                # Possibly encoded twice; no verdict worth caching
+                logger.warning(f"Could not decode the target of {url}: {location}")
+                return None
+            return OFF_TWITTER
+        if target[0] == 'short':
+            # A short link to another short link; leave it to yt-dlp
+            return UNRESOLVED
+        return f'{target[0]}:{target[1]}'
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Streaming transcode: pipe Space audio through ffmpeg straight to the client
+ffmpeg output is written to a cache file by a producer thread; clients tail that
+file, so a slow client never stalls the transcode and the finished file can be
+committed to the store for later requests. ffmpeg is killed once every client
+has gone away, or when the transcode runs past its time limit.
+"""
+
+import os
+import shutil
+import logging
+import subprocess
+import threading
+from contextlib import ExitStack
+
+logger = logging.getLogger(__name__)
+
+
+def build_ffmpeg_command(media_url, http_headers=None, output_args=None, output='pipe:1'):
+    """Build an ffmpeg command that reads media_url and writes the encoded audio to output (stdout by default)"""
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin', '-y']
+    if http_headers:
+        command += ['-headers', ''.join(f"{k}: {v}\r\n" for k, v in http_headers.items())]
+    command += ['-i', media_url, '-vn']
+    command += output_args or ['-c:a', 'libmp3lame', '-b:a', '192k', '-f', 'mp3']
+    command.append(output)
+    return command
+
+
+class TeeTranscode:
+    """Runs one ffmpeg process and tees its output into a file that any number of readers can follow"""
+
+    def __init__(self, command, staging_dir, lock=None, on_complete=None, on_exit=None, max_seconds=None,
+                 chunk_size=64 * 1024):
+        self.command = command
+        self.staging_dir = staging_dir
+        self.path = os.path.join(staging_dir, 'stream')
+        self.lock = lock
+        self.on_complete = on_complete
+        # Called once the transcode is over, however it ended
+        self.on_exit = on_exit
+        self.max_seconds = max_seconds
+        self.chunk_size = chunk_size
+
+        self.bytes_written = 0
+        self.done = False
+        self.failed = False
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._process = None
+        # Why the transcode was stopped early, if it was
+        self._stop_reason = None
+        # Create the file up front so readers can open it before the first chunk arrives
+        open(self.path, 'wb').close()
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name='tee-transcode', daemon=True)
+        thread.start()
+        return self
+
+    def stop(self, reason):
+        """Kill ffmpeg; the output is incomplete, so it is not committed"""
+        with self._cond:
+            if self.done or self._stop_reason:
+                return
+            self._stop_reason = reason
+            process = self._process
+        logger.info(f"Stopping streaming transcode: {reason}")
+        if process is not None:
+            process.kill()
+
+    def _run(self):
+        timer = None
+        if self.max_seconds:
+            timer = threading.Timer(self.max_seconds, self.stop, args=(f"exceeded {self.max_seconds}s",))
+            timer.daemon = True
+            timer.start()
+        try:
+            with ExitStack() as stack:
+                # Only the holder of the Space's single-flight lock may fill the cache
+                cacheable = self.on_complete is not None
+                if self.lock is not None:
+                    try:
+                        stack.enter_context(self.lock())
+                    except BlockingIOError:
+                        logger.info("Another download of this Space is in flight, streaming without caching")
+                        cacheable = False
+
+                process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                with self._cond:
+                    self._process = process
+                    stopped = self._stop_reason is not None
+                if stopped:
+                    process.kill()
+                with open(self.path, 'ab') as out:
+                    for chunk in iter(lambda: process.stdout.read(self.chunk_size), b''):
+                        out.write(chunk)
+                        out.flush()
+                        with self._cond:
+                            self.bytes_written += len(chunk)
+                            self._cond.notify_all()
+                stderr = process.stderr.read().decode(errors='replace').strip()
+                returncode = process.wait()
+
+                if self._stop_reason:
+                    raise RuntimeError(f"Transcode stopped: {self._stop_reason}")
+                if returncode != 0:
+                    raise RuntimeError(f"ffmpeg exited with {returncode}: {stderr[-500:]}")
+                if cacheable:
+                    self.on_complete(self.path)
+        except Exception as e:
+            logger.error(f"Streaming transcode failed: {str(e)}")
+            self.failed = True
+        finally:
+            if timer is not None:
+                timer.cancel()
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+            # Readers keep their open handles, so the directory can go right away
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            if self.on_exit is not None:
+                self.on_exit()
+
+    def iter_chunks(self):
+        """Open a reader on the output and return an iterator of its bytes as they are produced
+
+        Closing the iterator, as servers do when the client disconnects,
+        stops the transcode if no other reader is left.
+        """
+        # Opened eagerly so the reader survives the staging directory being removed
+        f = open(self.path, 'rb')
+        with self._cond:
+            self._readers += 1
+        return _Reader(self._follow(f), self._reader_left)
+
+    def _reader_left(self):
+        with self._cond:
+            self._readers -= 1
+            abandoned = self._readers == 0 and not self.done
+        if abandoned:
+            self.stop("client disconnected")
+
+    def _follow(self, f):
+        with f:
+            position = 0
+            while True:
+                with self._cond:
+                    while position >= self.bytes_written and not self.done:
+                        self._cond.wait(timeout=5)
+                    available = self.bytes_written - position
+                    finished = self.done
+
+                while available > 0:
+                    chunk = f.read(min(available, self.chunk_size))
+                    if not chunk:
+                        break
+                    position += len(chunk)
+                    available -= len(chunk)
+                    yield chunk
+
+                if finished and position >= self.bytes_written:
+                    if self.failed:
+                        # Abort the chunked response so the client sees a truncated transfer
+                        raise IOError("Transcode failed before the stream completed")
+                    return
+
+
+class _Reader:
+    """Iterator over a transcode's output that reports when it is closed, even before its first chunk"""
+
+    def __init__(self, chunks, on_close):
+        self._chunks = chunks
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        self._chunks.close()
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            on_close()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Request tracing and slow-request profiling
+Spans time the stages of a request (URL resolution, metadata lookup, segment
+fetches, ffmpeg, ...) and are appended as JSON lines to a local file. Tracing is
+sampled per trace: spans of an unsampled trace are never written. A job
+continues the trace of the request that queued it.
+
+The profiling hook is separate and opt-in. It profiles a random sample of
+requests and jobs and keeps a profile only when the run was slower than a
+threshold.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """One timed stage of a trace"""
+
+    def __init__(self, tracer, name, trace_id, parent_id, sampled, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attrs = attrs
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = _current_span.set(self)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self, error=None):
+        duration = time.perf_counter() - self._started
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Ended from another context (e.g. a streamed response); nothing to restore
+            pass
+        if not self.sampled:
+            return
+        record = {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': round(self.start, 6),
+            'duration_ms': round(duration * 1000, 3),
+            'pid': os.getpid(),
+            'status': 'error' if error is not None else 'ok',
+            'attrs': self.attrs,
+        }
+        if error is not None:
+            # The real exception type, before callers rewrap it as ValueError
+            record['error_type'] = type(error).__name__
+            record['error'] = str(error)[:500]
+        self.tracer._write(record)
+
+
+class _NoopSpan:
+    """Returned while tracing is disabled, so call sites need no checks"""
+
+    sampled = False
+
+    def set(self, **attrs):
+        pass
+
+    def end(self, error=None):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Creates spans and appends the sampled ones to a JSON lines file"""
+
+    def __init__(self, path=None, sample_rate=1.0):
+        self.configure(path, sample_rate)
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    def configure(self, path=None, sample_rate=1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self):
+        return bool(self.path) and self.sample_rate > 0
+
+    def current_context(self):
+        """Return the (trace_id, span_id, sampled) of the current span, for handing to another process"""
+        span = _current_span.get()
+        if span is None:
+            return None
+        return span.trace_id, span.span_id, span.sampled
+
+    def start_span(self, name, context=None, **attrs):
+        """Start a span under the current one (or under context); call end() on the result"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        if context is None:
+            parent = _current_span.get()
+            context = (parent.trace_id, parent.span_id, parent.sampled) if parent else None
+        if context is None:
+            # A new trace: decide once whether all of its spans are kept
+            return Span(self, name, uuid.uuid4().hex, None, random.random() < self.sample_rate, attrs)
+        trace_id, parent_id, sampled = context
+        return Span(self, name, trace_id, parent_id, sampled, attrs)
+
+    @contextmanager
+    def span(self, name, context=None, **attrs):
+        """Time the block as a span; an exception marks the span as failed and propagates"""
+        span = self.start_span(name, context, **attrs)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(e)
+            raise
+        span.end()
+
+    def _write(self, record):
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            try:
+                # Forked workers must not share the parent's buffered handle
+                if self._file is None or self._pid != os.getpid():
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                    self._pid = os.getpid()
+                self._file.write(line)
+                self._file.flush()
+            except OSError as e:
+                logger.warning(f"Could not write trace span: {str(e)}")
+
+
+class _ProfileRun:
+    def __init__(self, profiler, engine):
+        self.profiler = profiler
+        self.engine = engine
+        self._started = time.perf_counter()
+        if engine == 'pyinstrument':
+            from pyinstrument import Profiler
+            self._profile = Profiler()
+            self._profile.start()
+        else:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self, label):
+        elapsed_ms = (time.perf_counter() - self._started) * 1000
+        if self.engine == 'pyinstrument':
+            self._profile.stop()
+        else:
+            self._profile.disable()
+        if elapsed_ms < self.profiler.threshold_ms:
+            return None
+
+        safe_label = re.sub(r'[^A-Za-z0-9_-]+', '_', label).strip('_')[:80]
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{int(elapsed_ms)}ms-{safe_label}"
+        try:
+            os.makedirs(self.profiler.output_dir, exist_ok=True)
+            if self.engine == 'pyinstrument':
+                path = os.path.join(self.profiler.output_dir, name + '.html')
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(self._profile.output_html())
+            else:
+                path = os.path.join(self.profiler.output_dir, name + '.prof')
+                self._profile.dump_stats(path)
+        except OSError as e:
+            logger.warning(f"Could not write profile: {str(e)}")
+            return None
+        logger.info(f"Slow run profiled ({int(elapsed_ms)} ms): {path}")
+        return path
+
+
+class SlowProfiler:
+    """Profiles a sample of runs and keeps the profiles of those slower than threshold_ms"""
+
+    def __init__(self, output_dir=None, threshold_ms=5000, sample_rate=0.0, engine='cprofile'):
+        self.configure(output_dir, threshold_ms, sample_rate, engine)
+
+    def configure(self, output_dir=None, threshold_ms=5000, sample_rate=0.0, engine='cprofile'):
+        self.output_dir = output_dir
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.engine = engine
+        if engine == 'pyinstrument':
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                logger.warning("pyinstrument is not installed, profiling with cProfile instead")
+                self.engine = 'cprofile'
+
+    def start(self):
+        """Start profiling this run if it is sampled; returns a handle whose stop(label) keeps slow profiles"""
+        if not self.output_dir or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        try:
+            return _ProfileRun(self, self.engine)
+        except ValueError:
+            # Only one profiler can be active at a time on newer Pythons
+            return None
+
+    @contextmanager
+    def profile(self, label):
+        run = self.start()
+        try:
+            yield
+        finally:
+            if run is not None:
+                run.stop(label)
+
+
+tracer = Tracer()
+profiler = SlowProfiler()
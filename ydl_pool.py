@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Reusable yt-dlp instances
+Building a YoutubeDL loads extractor classes, cookies and HTTP handlers. Reusing
+one keeps its extractors initialised and its keep-alive connections open.
+YoutubeDL is not thread-safe, so an instance is lent to one thread at a time and
+goes back to its options profile's idle list (e.g. metadata-only vs
+download-to-m4a) when the call is done. Threads that live for a single request
+therefore still reuse instances. yt-dlp itself is only imported when the first
+instance is built.
+"""
+
+import os
+import time
+import logging
+import importlib
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class YDLPool:
+    """Idle YoutubeDL instances per options profile, lent to one thread at a time"""
+
+    def __init__(self, profiles=None, max_uses=100, max_age=1800, max_idle=8):
+        self.profiles = {}
+        self.extractors = {}
+        self.max_uses = max_uses
+        self.max_age = max_age
+        # Idle instances kept per profile; more are built under load and closed on return
+        self.max_idle = max_idle
+
+        self._idle = {}
+        self._idle_pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._created = 0
+        self._reused = 0
+
+        for name, opts in (profiles or {}).items():
+            self.register(name, opts)
+
+    def register(self, name, opts, extractors=None):
+        """Define an options profile; instances for it are built on first use
+
+        extractors optionally limits the profile to the given extractor classes,
+        as dotted paths (e.g. 'yt_dlp.extractor.twitter.TwitterSpacesIE'), so
+        only their modules are imported instead of yt-dlp's whole registry.
+        """
+        self.profiles[name] = dict(opts)
+        self.extractors[name] = list(extractors) if extractors else None
+
+    def _build(self, profile):
+        import yt_dlp
+
+        # yt-dlp mutates its params, so every instance gets its own copy
+        opts = dict(self.profiles[profile])
+        extractors = self.extractors[profile]
+        if not extractors:
+            return yt_dlp.YoutubeDL(opts)
+
+        ydl = yt_dlp.YoutubeDL(opts, auto_init=False)
+        for path in extractors:
+            module, _, name = path.rpartition('.')
+            ydl.add_info_extractor(getattr(importlib.import_module(module), name)())
+        return ydl
+
+    def _instances(self, profile):
+        """Idle list of profile; caller holds self._lock"""
+        # A forked process must not share its parent's sockets, so the lists are per process
+        if self._idle_pid != os.getpid():
+            self._idle_pid = os.getpid()
+            self._idle = {}
+        return self._idle.setdefault(profile, [])
+
+    def _checkout(self, profile):
+        if profile not in self.profiles:
+            raise KeyError(f"Unknown yt-dlp profile: {profile}")
+
+        while True:
+            with self._lock:
+                idle = self._instances(profile)
+                # Most recently returned first, as its connections are the likeliest to still be open
+                slot = idle.pop() if idle else None
+            if slot is None:
+                break
+            ydl, created_at, uses = slot
+            if uses < self.max_uses and time.monotonic() - created_at < self.max_age:
+                with self._stats_lock:
+                    self._reused += 1
+                return slot
+            # Recycle periodically so cookies and extractor state cannot go stale
+            ydl.close()
+
+        ydl = self._build(profile)
+        with self._stats_lock:
+            self._created += 1
+        return ydl, time.monotonic(), 0
+
+    @contextmanager
+    def acquire(self, profile, **params):
+        """Borrow an idle instance of profile, building one if none is idle
+
+        params (e.g. paths) override the profile's options for the duration of the call.
+        An instance that raised is closed rather than reused, since an aborted
+        extraction or download can leave state behind.
+        """
+        ydl, created_at, uses = self._checkout(profile)
+        saved = {key: ydl.params[key] for key in params if key in ydl.params}
+        ydl.params.update(params)
+        try:
+            yield ydl
+        except BaseException:
+            ydl.close()
+            raise
+
+        for key in params:
+            if key in saved:
+                ydl.params[key] = saved[key]
+            else:
+                del ydl.params[key]
+        with self._lock:
+            idle = self._instances(profile)
+            if len(idle) < self.max_idle:
+                idle.append((ydl, created_at, uses + 1))
+                return
+        ydl.close()
+
+    def warm(self, *profiles):
+        """Build an instance per profile ahead of the first request"""
+        for profile in profiles or self.profiles:
+            with self.acquire(profile):
+                pass
+
+    def close(self):
+        """Close this process's idle instances"""
+        with self._lock:
+            slots = [slot for idle in self._idle.values() for slot in idle] if self._idle_pid == os.getpid() else []
+            self._idle = {}
+        for ydl, _, _ in slots:
+            ydl.close()
+
+    def stats(self):
+        with self._stats_lock:
+            return {'created': self._created, 'reused': self._reused}